@@ -0,0 +1,210 @@
+# loadtest/benchmark.py
+# Benchmark ponta a ponta: ESP32 simulados -> broker -> data_processor -> análise -> alerta -> dashboard.
+# Para cada combinação de armazenamento (sqlite/jsonl), motor de análise (python/r) e tamanho
+# do histórico já gravado, o script:
+#   1. cria uma pasta de dados isolada e pré-carrega o histórico (mesmos dispositivos da frota);
+#   2. inicia um data_processor com LATENCY_STATS_FILE apontando para essa pasta;
+#   3. publica a frota simulada (esp32_fleet.py) por --duration segundos e espera os resultados;
+#   4. encerra o processador, lê os percentis de cada etapa e mede a consulta do dashboard;
+#   5. grava um relatório Markdown + JSON em --output.
+# As sementes são fixas: a mesma linha de comando gera a mesma carga.
+#
+# Uso (Mosquitto de loadtest/mosquitto.conf rodando em localhost:1883):
+#   python loadtest/benchmark.py --backends sqlite,jsonl --engines python --history 0,10000,100000
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from esp32_fleet import Esp32Fleet
+from shared_subscription_loadtest import ResultCollector, stop_instances, SERVICES_DIR, DATA_PROCESSOR
+
+sys.path.insert(0, SERVICES_DIR)
+from sensor_store import open_store, normalize_reading  # noqa: E402
+from latency import percentile  # noqa: E402
+
+ANALYSES_PER_READING = 2
+STAGES = ("ingest", "persistence", "query", "analysis_flood", "analysis_fire", "alert", "end_to_end", "dashboard_query")
+DASHBOARD_FIELDS = (['water_level', 'rainfall_intensity'], ['temperature', 'humidity', 'smoke_concentration'])
+DASHBOARD_QUERY_REPEATS = 5
+
+
+def prefill_history(store, fleet, rows, interval):
+    """Grava `rows` leituras antigas, igualmente distribuídas entre os dispositivos da frota."""
+    now = datetime.now()
+    batch = []
+    for n in range(rows):
+        device = fleet.devices[n % len(fleet.devices)]
+        moment = now - timedelta(seconds=interval * (rows - n) / len(fleet.devices))
+        record = normalize_reading(device.reading(moment))
+        record['timestamp'] = moment.isoformat()
+        batch.append(record)
+        if len(batch) >= 5000:
+            store.append_many(batch)
+            batch = []
+    if batch:
+        store.append_many(batch)
+
+
+def measure_dashboard_query(store):
+    """Latência da consulta feita pelo dashboard (todas as leituras dos campos de cada seção)."""
+    samples = []
+    for _ in range(DASHBOARD_QUERY_REPEATS):
+        for fields in DASHBOARD_FIELDS:
+            started = time.perf_counter()
+            store.query(fields=fields)
+            samples.append(time.perf_counter() - started)
+    samples.sort()
+    return {"count": len(samples), "p50_ms": round(percentile(samples, 50) * 1000, 3),
+            "p95_ms": round(percentile(samples, 95) * 1000, 3),
+            "p99_ms": round(percentile(samples, 99) * 1000, 3),
+            "max_ms": round(samples[-1] * 1000, 3)}
+
+
+def start_processor(args, backend, engine, run_id, data_dir, stats_file):
+    env = dict(os.environ,
+               MQTT_BROKER=args.host, MQTT_PORT=str(args.port),
+               MQTT_TOPIC=f"benchmark/{run_id}/sensor_data",
+               MQTT_RESULTS_TOPIC=f"benchmark/{run_id}/risk",
+               PROCESSOR_ID=f"benchmark-{run_id}",
+               TEMP_DATA_DIR=data_dir,
+               SENSOR_STORE_BACKEND=backend,
+               ANALYSIS_ENGINE=engine,
+               ANALYSIS_MIN_INTERVAL_SECONDS="0",   # Toda leitura é analisada.
+               ANALYSIS_QUEUE_POLICY="block",        # Sem descartes: a fila reflete a sobrecarga na latência.
+               LATENCY_STATS_FILE=stats_file,
+               LATENCY_REPORT_INTERVAL_SECONDS="0",
+               METRICS_PORT="0",                     # Várias execuções na mesma máquina.
+               PYTHONUNBUFFERED="1")
+    log_path = os.path.join(data_dir, "data_processor.log")
+    log = open(log_path, 'w')
+    process = subprocess.Popen([sys.executable, DATA_PROCESSOR], cwd=SERVICES_DIR, env=env,
+                               stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + args.startup_timeout
+    while True:
+        with open(log_path, encoding='utf-8', errors='replace') as f:
+            if "Subscrito ao tópico" in f.read():
+                return process, log, log_path
+        if process.poll() is not None or time.monotonic() > deadline:
+            stop_instances([(process, log, log_path)])
+            raise RuntimeError(f"data_processor não iniciou (veja {log_path}).")
+        time.sleep(0.2)
+
+
+def run_case(args, backend, engine, history):
+    run_id = uuid.uuid4().hex[:8]
+    work_dir = tempfile.mkdtemp(prefix=f"guardiao_benchmark_{backend}_{engine}_{history}_")
+    data_dir = os.path.join(work_dir, "data")
+    stats_file = os.path.join(work_dir, "latency.json")
+    fleet = Esp32Fleet(args.devices, args.interval, seed=args.seed)
+
+    store = open_store(backend, os.path.join(data_dir, "sensor_store"))
+    prefill_history(store, fleet, history, args.interval)
+    store.close()
+
+    processor = start_processor(args, backend, engine, run_id, data_dir, stats_file)
+    collector = ResultCollector(args.host, args.port, f"benchmark/{run_id}/risk")
+    try:
+        sent = fleet.run(args.host, args.port, f"benchmark/{run_id}/sensor_data", args.duration, qos=1)
+        received = collector.wait_for(sent * ANALYSES_PER_READING, args.idle_timeout)
+    finally:
+        collector.close()
+        stop_instances([processor])
+
+    with open(stats_file) as f:
+        stages = json.load(f)
+    store = open_store(backend, os.path.join(data_dir, "sensor_store"))
+    stages["dashboard_query"] = measure_dashboard_query(store)
+    stored = store.count()
+    store.close()
+
+    if args.keep:
+        print(f"  Dados e logs mantidos em {work_dir}")
+    else:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {"backend": backend, "engine": engine, "history": history, "sent": sent,
+            "results": received, "expected_results": sent * ANALYSES_PER_READING,
+            "stored_readings": stored, "stages": stages}
+
+
+def format_cell(stats):
+    if not stats:
+        return "-"
+    return f"{stats['p50_ms']:.1f} / {stats['p95_ms']:.1f} / {stats['p99_ms']:.1f}"
+
+
+def write_report(args, cases, skipped):
+    os.makedirs(args.output, exist_ok=True)
+    name = datetime.now().strftime("benchmark_%Y%m%d_%H%M%S")
+    environment = {"python": platform.python_version(), "platform": platform.platform(),
+                   "cpus": os.cpu_count(), "date": datetime.now().isoformat(timespec="seconds")}
+    config = {"devices": args.devices, "interval": args.interval, "duration": args.duration,
+              "seed": args.seed, "rate_per_second": round(args.devices / args.interval, 2)}
+
+    lines = [f"# Benchmark Guardião Natural ({environment['date']})", "",
+             f"Carga: {config['devices']} dispositivos a cada {config['interval']}s "
+             f"({config['rate_per_second']} msg/s) por {config['duration']}s, semente {config['seed']}.",
+             f"Ambiente: Python {environment['python']}, {environment['cpus']} CPU(s), {environment['platform']}.",
+             "", "Latências em milissegundos (p50 / p95 / p99).", "",
+             "| Armazenamento | Motor | Histórico | Leituras | Resultados | " + " | ".join(STAGES) + " |",
+             "|" + "---|" * (5 + len(STAGES))]
+    for case in cases:
+        lines.append(f"| {case['backend']} | {case['engine']} | {case['history']} | {case['sent']} | "
+                     f"{case['results']}/{case['expected_results']} | "
+                     + " | ".join(format_cell(case['stages'].get(stage)) for stage in STAGES) + " |")
+    for reason in skipped:
+        lines += ["", f"- Não executado: {reason}"]
+
+    with open(os.path.join(args.output, f"{name}.md"), 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+    with open(os.path.join(args.output, f"{name}.json"), 'w', encoding='utf-8') as f:
+        json.dump({"environment": environment, "config": config, "cases": cases, "skipped": skipped},
+                  f, indent=2, ensure_ascii=False)
+    return os.path.join(args.output, f"{name}.md")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ponta a ponta do Guardião Natural.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--backends", default="sqlite,jsonl")
+    parser.add_argument("--engines", default="python", help="python e/ou r (requer Rscript).")
+    parser.add_argument("--history", default="0,10000,100000",
+                        help="Leituras pré-carregadas antes de cada rodada, separadas por vírgula.")
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--interval", type=float, default=1.0,
+                        help="Segundos entre duas publicações do mesmo dispositivo.")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--startup-timeout", type=float, default=180)
+    parser.add_argument("--idle-timeout", type=float, default=30)
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "reports"))
+    parser.add_argument("--keep", action="store_true", help="Mantém os dados e logs de cada rodada.")
+    args = parser.parse_args()
+
+    cases, skipped = [], []
+    for engine in args.engines.split(","):
+        if engine == "r" and shutil.which("Rscript") is None:
+            skipped.append("motor r (Rscript não encontrado no PATH)")
+            continue
+        for backend in args.backends.split(","):
+            for history in (int(value) for value in args.history.split(",")):
+                print(f"Rodada: armazenamento={backend}, motor={engine}, histórico={history}...")
+                case = run_case(args, backend, engine, history)
+                cases.append(case)
+                end_to_end = case['stages'].get('end_to_end')
+                print(f"  {case['results']}/{case['expected_results']} resultados; "
+                      f"ponta a ponta p50/p95/p99 = {format_cell(end_to_end)} ms")
+
+    print(f"Relatório gravado em {write_report(args, cases, skipped)}")
+
+
+if __name__ == "__main__":
+    main()
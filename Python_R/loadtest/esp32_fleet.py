@@ -0,0 +1,127 @@
+# loadtest/esp32_fleet.py
+# Frota simulada de ESP32 publicando o mesmo payload JSON de esp32/src/prog1.ino.
+# Cada dispositivo mantém leituras "brutas" (distância do ultrassom, LDR e MQ-2) que variam
+# em passeio aleatório e são convertidas em porcentagem com a mesma regra map() do firmware.
+#
+# Uso (broker local em localhost:1883):
+#   python loadtest/esp32_fleet.py --devices 50 --interval 5 --duration 60
+# --interval é o período de cada dispositivo (o firmware publica a cada 5 s).
+import argparse
+import json
+import random
+import time
+from datetime import datetime
+
+import paho.mqtt.client as mqtt
+
+DEFAULT_TOPIC = "guardiao_natural/sensor_data"   # Mesmo tópico de prog1.ino.
+DEFAULT_INTERVAL_SECONDS = 5.0                   # MESSAGE_INTERVAL do firmware.
+DHT_FAILURE_PROBABILITY = 0.01                   # Leituras com temperatura/umidade nulas.
+
+
+def arduino_map(value, in_min, in_max, out_min, out_max):
+    """Equivalente à função map() do Arduino (aritmética inteira) seguida do limite do firmware."""
+    mapped = (value - in_min) * (out_max - out_min) // (in_max - in_min) + out_min
+    return max(min(out_min, out_max), min(max(out_min, out_max), mapped))
+
+
+class SimulatedEsp32:
+    """Um dispositivo com sensores em passeio aleatório."""
+
+    def __init__(self, device_id, rng):
+        self.device_id = device_id
+        self.rng = rng
+        self.distance_cm = rng.uniform(60, 200)
+        self.ldr_value = rng.uniform(1500, 4095)
+        self.mq2_value = rng.uniform(0, 1200)
+        self.temperature = rng.uniform(18, 32)
+        self.humidity = rng.uniform(40, 85)
+
+    def _walk(self, value, step, low, high):
+        return max(low, min(high, value + self.rng.gauss(0, step)))
+
+    def reading(self, moment=None):
+        """Próxima leitura no formato de prog1.ino."""
+        self.distance_cm = self._walk(self.distance_cm, 4, 0, 200)
+        self.ldr_value = self._walk(self.ldr_value, 120, 0, 4095)
+        self.mq2_value = self._walk(self.mq2_value, 60, 0, 4095)
+        self.temperature = self._walk(self.temperature, 0.3, -10, 60)
+        self.humidity = self._walk(self.humidity, 1.0, 0, 100)
+
+        distance_cm, ldr_value, mq2_value = int(self.distance_cm), int(self.ldr_value), int(self.mq2_value)
+        dht_error = self.rng.random() < DHT_FAILURE_PROBABILITY
+        return {
+            "device_id": self.device_id,
+            "nivel_de_agua": arduino_map(distance_cm, 200, 0, 0, 100),
+            "intensidade_de_chuva": arduino_map(ldr_value, 4095, 0, 0, 100),
+            "temperatura": None if dht_error else round(self.temperature, 2),
+            "umidade": None if dht_error else round(self.humidity, 2),
+            "concentracao_de_fumaca": arduino_map(mq2_value, 0, 4095, 0, 100),
+            "timestamp_device": (moment or datetime.now()).strftime("%Y-%m-%dT%H:%M:%S"),
+            "raw_distance_cm": distance_cm,
+            "raw_ldr_value": ldr_value,
+            "raw_mq2_value": mq2_value,
+        }
+
+
+class Esp32Fleet:
+    """Conjunto de dispositivos publicando em intervalos regulares, com início escalonado."""
+
+    def __init__(self, devices, interval=DEFAULT_INTERVAL_SECONDS, seed=42, prefix="ESP32GuardiaoNatural_Sim"):
+        rng = random.Random(seed)
+        self.interval = interval
+        self.devices = [SimulatedEsp32(f"{prefix}_{index:03d}", rng) for index in range(devices)]
+
+    @property
+    def rate(self):
+        """Mensagens por segundo da frota inteira."""
+        return len(self.devices) / self.interval
+
+    def run(self, host, port, topic=DEFAULT_TOPIC, duration=60.0, qos=0):
+        """Publica durante `duration` segundos e retorna a quantidade de mensagens enviadas."""
+        client = mqtt.Client(client_id=f"esp32-fleet-{int(time.time())}")
+        client.max_inflight_messages_set(1000)
+        client.connect(host, port, 60)
+        client.loop_start()
+        spacing = self.interval / len(self.devices)  # Espalha os dispositivos dentro do período.
+        started = time.monotonic()
+        sent = 0
+        info = None
+        try:
+            while True:
+                due = started + sent * spacing
+                if due - started >= duration:
+                    break
+                time.sleep(max(0.0, due - time.monotonic()))
+                device = self.devices[sent % len(self.devices)]
+                info = client.publish(topic, json.dumps(device.reading()), qos=qos)
+                sent += 1
+            if info is not None:
+                info.wait_for_publish(timeout=30)  # Esvazia a fila de envio antes de desconectar.
+        finally:
+            client.loop_stop()
+            client.disconnect()
+        return sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frota simulada de ESP32 (payload de prog1.ino).")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--topic", default=DEFAULT_TOPIC)
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL_SECONDS,
+                        help="Segundos entre duas publicações do mesmo dispositivo.")
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    fleet = Esp32Fleet(args.devices, args.interval, args.seed)
+    print(f"Publicando {fleet.rate:.1f} msg/s ({args.devices} dispositivos a cada {args.interval}s) "
+          f"em {args.topic} por {args.duration:.0f}s...")
+    sent = fleet.run(args.host, args.port, args.topic, args.duration)
+    print(f"{sent} mensagens publicadas.")
+
+
+if __name__ == "__main__":
+    main()
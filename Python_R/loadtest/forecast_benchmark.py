@@ -0,0 +1,210 @@
+# loadtest/forecast_benchmark.py
+# Precisão e latência da previsão de 1 passo à frente: abordagem atual x incremental.
+#   - batch:  forecast_next (risk_engine.py, equivalente ao auto.arima dos scripts R) refeito a
+#             cada leitura sobre as últimas --window leituras (ANALYSIS_WINDOW_ROWS);
+#   - online: ForecastStore/OnlineForecaster (forecaster.py), atualizado em O(1) por leitura;
+#   - r:      auto.arima do pacote forecast sobre a mesma janela (opcional, requer Rscript;
+#             avaliado em --r-points instantes por ser lento).
+# As séries são sintéticas (sementes fixas) e incluem a frota simulada de esp32_fleet.py.
+# Para cada série e método: MAE, RMSE e p50/p95/p99 do tempo de cada previsão.
+#
+# Uso (na pasta Python_R):
+#   python loadtest/forecast_benchmark.py --length 3000 --window 500
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from esp32_fleet import SimulatedEsp32
+from shared_subscription_loadtest import SERVICES_DIR
+
+sys.path.insert(0, SERVICES_DIR)
+from risk_engine import forecast_next  # noqa: E402
+from forecaster import OnlineForecaster  # noqa: E402
+from sensor_store import normalize_reading  # noqa: E402
+from latency import percentile  # noqa: E402
+
+WARM_UP_POINTS = 50   # Primeiras leituras de cada série usadas só para aquecer os modelos.
+
+R_SCRIPT = r"""
+suppressPackageStartupMessages(library(forecast))
+args <- commandArgs(trailingOnly = TRUE)
+values <- scan(args[1], quiet = TRUE)
+points <- scan(args[2], quiet = TRUE)
+window <- as.integer(args[3])
+for (t in points) {
+  start <- max(1, t - window + 1)
+  started <- proc.time()[["elapsed"]]
+  fit <- auto.arima(ts(values[start:t], frequency = 1))
+  prediction <- round(forecast(fit, h = 1)$mean[1], 2)
+  elapsed <- proc.time()[["elapsed"]] - started
+  cat(t, prediction, elapsed, "\n")
+}
+"""
+
+
+def synthetic_series(length, seed):
+    """Séries de teste: nome -> array com `length` valores."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(length)
+    series = {
+        "passeio aleatório": 50 + np.cumsum(rng.normal(0, 1, length)),
+        "AR(1) a=0.8": np.zeros(length),
+        "tendência + ruído": 20 + 0.02 * t + rng.normal(0, 1, length),
+        "degraus + ruído": 10 + 30 * ((t // 400) % 2) + rng.normal(0, 1.5, length),
+    }
+    ar = series["AR(1) a=0.8"]
+    ar[0] = 50
+    for i in range(1, length):
+        ar[i] = 10 + 0.8 * ar[i - 1] + rng.normal(0, 2)
+
+    device = SimulatedEsp32("ESP32GuardiaoNatural_Sim_000", random.Random(seed))
+    moment = datetime(2025, 1, 1)
+    readings = []
+    for _ in range(length):
+        moment += timedelta(seconds=5)
+        readings.append(normalize_reading(device.reading(moment)))
+    for field in ("water_level", "smoke_concentration", "temperature"):
+        values = np.array([reading[field] if reading[field] is not None else np.nan for reading in readings],
+                          dtype=float)
+        # Falhas do DHT (valores nulos): repete a leitura anterior, como um gráfico faria.
+        for i in np.nonzero(np.isnan(values))[0]:
+            values[i] = values[i - 1] if i else np.nanmean(values)
+        series[f"esp32 {field}"] = values
+    return series
+
+
+def summarize(predictions, actuals, timings):
+    errors = np.asarray(predictions, dtype=float) - np.asarray(actuals, dtype=float)
+    timings = sorted(timings)
+    return {"points": len(errors),
+            "mae": round(float(np.abs(errors).mean()), 4),
+            "rmse": round(float(np.sqrt((errors ** 2).mean())), 4),
+            "p50_ms": round(percentile(timings, 50) * 1000, 4),
+            "p95_ms": round(percentile(timings, 95) * 1000, 4),
+            "p99_ms": round(percentile(timings, 99) * 1000, 4),
+            "total_s": round(sum(timings), 3)}
+
+
+def run_batch(values, window):
+    predictions, actuals, timings = [], [], []
+    for t in range(WARM_UP_POINTS, len(values)):
+        started = time.perf_counter()
+        prediction = forecast_next(values[max(0, t - window):t])
+        timings.append(time.perf_counter() - started)
+        predictions.append(prediction)
+        actuals.append(values[t])
+    return summarize(predictions, actuals, timings)
+
+
+def run_online(values, window, reselect_every):
+    forecaster = OnlineForecaster(window=min(window, 200), reselect_every=reselect_every)
+    predictions, actuals, timings = [], [], []
+    for t in range(len(values)):
+        if t >= WARM_UP_POINTS:
+            started = time.perf_counter()
+            prediction = forecaster.forecast()
+            timings.append(time.perf_counter() - started)
+            predictions.append(prediction)
+            actuals.append(values[t])
+        # A atualização (custo por leitura recebida) entra no tempo do passo seguinte.
+        started = time.perf_counter()
+        forecaster.update(values[t])
+        if t >= WARM_UP_POINTS:
+            timings[-1] += time.perf_counter() - started
+    result = summarize(predictions, actuals, timings)
+    result["model"] = forecaster.model_name
+    return result
+
+
+def run_r(values, window, points):
+    """auto.arima em `points` instantes igualmente espaçados (None se o R/forecast não estiver disponível)."""
+    if shutil.which("Rscript") is None:
+        return None
+    targets = np.linspace(WARM_UP_POINTS, len(values) - 1, min(points, len(values) - WARM_UP_POINTS)).astype(int)
+    with tempfile.TemporaryDirectory() as work_dir:
+        values_path, points_path, script_path = (os.path.join(work_dir, name)
+                                                 for name in ("values.txt", "points.txt", "bench.R"))
+        np.savetxt(values_path, values)
+        np.savetxt(points_path, targets, fmt="%d")  # Índices 1-based no R: valores até t (exclusive) -> t.
+        with open(script_path, 'w') as f:
+            f.write(R_SCRIPT)
+        completed = subprocess.run(["Rscript", script_path, values_path, points_path, str(window)],
+                                   capture_output=True, text=True)
+    if completed.returncode != 0:
+        print(f"  auto.arima (R) ignorado: {completed.stderr.strip().splitlines()[-1:]}")
+        return None
+    predictions, actuals, timings = [], [], []
+    for line in completed.stdout.splitlines():
+        t, prediction, elapsed = line.split()
+        predictions.append(float(prediction))
+        actuals.append(values[int(t)])
+        timings.append(float(elapsed))
+    return summarize(predictions, actuals, timings)
+
+
+def write_report(args, results):
+    os.makedirs(args.output, exist_ok=True)
+    name = datetime.now().strftime("forecast_benchmark_%Y%m%d_%H%M%S")
+    environment = {"python": platform.python_version(), "platform": platform.platform(),
+                   "cpus": os.cpu_count(), "date": datetime.now().isoformat(timespec="seconds")}
+    lines = [f"# Benchmark de previsão ({environment['date']})", "",
+             f"{args.length} leituras por série, janela de {args.window} leituras (batch/R), "
+             f"nova escolha de modelo a cada {args.reselect_every} leituras (online), semente {args.seed}.",
+             f"Ambiente: Python {environment['python']}, {environment['cpus']} CPU(s), {environment['platform']}.",
+             "", "| Série | Método | MAE | RMSE | p50 (ms) | p95 (ms) | p99 (ms) | Tempo total (s) |",
+             "|---|---|---|---|---|---|---|---|"]
+    for series_name, methods in results.items():
+        for method, stats in methods.items():
+            if stats is None:
+                continue
+            label = f"{method} ({stats['model']})" if stats.get("model") else method
+            lines.append(f"| {series_name} | {label} | {stats['mae']} | {stats['rmse']} | {stats['p50_ms']} | "
+                         f"{stats['p95_ms']} | {stats['p99_ms']} | {stats['total_s']} |")
+    with open(os.path.join(args.output, f"{name}.md"), 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+    with open(os.path.join(args.output, f"{name}.json"), 'w', encoding='utf-8') as f:
+        json.dump({"environment": environment, "config": vars(args), "results": results},
+                  f, indent=2, ensure_ascii=False)
+    return os.path.join(args.output, f"{name}.md")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precisão e latência da previsão: batch x incremental.")
+    parser.add_argument("--length", type=int, default=3000, help="Leituras por série.")
+    parser.add_argument("--window", type=int, default=500, help="Janela da previsão batch (ANALYSIS_WINDOW_ROWS).")
+    parser.add_argument("--reselect-every", type=int, default=100)
+    parser.add_argument("--r-points", type=int, default=200,
+                        help="Instantes avaliados com auto.arima no R (0 desativa).")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "reports"))
+    args = parser.parse_args()
+
+    results = {}
+    for series_name, values in synthetic_series(args.length, args.seed).items():
+        print(f"Série: {series_name}")
+        results[series_name] = {
+            "batch": run_batch(values, args.window),
+            "online": run_online(values, args.window, args.reselect_every),
+            "r auto.arima": run_r(values, args.window, args.r_points) if args.r_points else None,
+        }
+        for method, stats in results[series_name].items():
+            if stats is not None:
+                print(f"  {method:<13} MAE={stats['mae']:<8} RMSE={stats['rmse']:<8} "
+                      f"p50={stats['p50_ms']} ms p99={stats['p99_ms']} ms")
+    if shutil.which("Rscript") is None and args.r_points:
+        print("Rscript não encontrado: auto.arima (R) não avaliado.")
+    print(f"Relatório gravado em {write_report(args, results)}")
+
+
+if __name__ == "__main__":
+    main()
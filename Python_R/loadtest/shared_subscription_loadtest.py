@@ -0,0 +1,216 @@
+# loadtest/shared_subscription_loadtest.py
+# Teste de carga da escalabilidade horizontal do data_processor.py.
+# Para cada quantidade de instâncias informada, inicia N processos do data_processor
+# (motor Python, sem intervalo mínimo entre análises), publica leituras simuladas de
+# vários dispositivos e mede quantas leituras por segundo o conjunto consegue analisar,
+# contando os resultados publicados no tópico de resultados.
+#
+# Uso (com o Mosquitto de loadtest/mosquitto.conf rodando em localhost:1883):
+#   python loadtest/shared_subscription_loadtest.py --instances 1,2,4 --devices 20 --messages 2000
+# Modos:
+#   --mode shared -> assinatura compartilhada ($share/loadtest/...) e armazenamento comum.
+#   --mode shard  -> particionamento fixo por dispositivo (PROCESSOR_SHARD_*) e um
+#                    armazenamento por instância.
+import argparse
+import json
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import paho.mqtt.client as mqtt
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVICES_DIR = os.path.join(BASE_DIR, '..', 'src', 'services')
+DATA_PROCESSOR = os.path.join(SERVICES_DIR, 'data_processor.py')
+ANALYSES_PER_READING = 2  # Enchente e incêndio.
+
+
+class ResultCollector:
+    """Assina o tópico de resultados e conta as análises recebidas por instância."""
+
+    def __init__(self, host, port, results_topic):
+        self.count = 0
+        self.by_processor = {}
+        self.last_at = None
+        self._lock = threading.Lock()
+        self.client = mqtt.Client(client_id=f"loadtest-collector-{uuid.uuid4().hex[:8]}")
+        self.client.on_message = self._on_message
+        self.client.connect(host, port, 60)
+        self.client.subscribe(f"{results_topic}/#", qos=1)
+        self.client.loop_start()
+
+    def _on_message(self, client, userdata, msg):
+        result = json.loads(msg.payload.decode())
+        with self._lock:
+            self.count += 1
+            processor = result.get('processor_id', '?')
+            self.by_processor[processor] = self.by_processor.get(processor, 0) + 1
+            self.last_at = time.monotonic()
+
+    def wait_for(self, expected, idle_timeout):
+        """Aguarda `expected` resultados ou `idle_timeout` segundos sem nenhum resultado novo."""
+        last_progress, last_count = time.monotonic(), -1
+        while True:
+            with self._lock:
+                count = self.count
+            if count >= expected:
+                return count
+            if count != last_count:
+                last_progress, last_count = time.monotonic(), count
+            elif time.monotonic() - last_progress > idle_timeout:
+                return count
+            time.sleep(0.1)
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+def start_instances(count, args, run_id, work_dir):
+    """Inicia `count` processos do data_processor e aguarda todos assinarem o tópico."""
+    processes = []
+    for index in range(count):
+        env = dict(os.environ,
+                   MQTT_BROKER=args.host, MQTT_PORT=str(args.port),
+                   MQTT_TOPIC=f"loadtest/{run_id}/sensor_data",
+                   MQTT_RESULTS_TOPIC=f"loadtest/{run_id}/risk",
+                   PROCESSOR_ID=f"instance-{index + 1}",
+                   ANALYSIS_ENGINE="python",
+                   ANALYSIS_MIN_INTERVAL_SECONDS="0",
+                   ANALYSIS_QUEUE_POLICY="block",  # Cada leitura gera exatamente uma análise de cada tipo.
+                   SENSOR_STORE_BACKEND=args.backend,
+                   METRICS_PORT="0",  # Várias instâncias na mesma máquina.
+                   PYTHONUNBUFFERED="1")
+        if args.mode == "shared":
+            env.update(MQTT_SHARED_GROUP="loadtest", TEMP_DATA_DIR=os.path.join(work_dir, 'shared'))
+        else:
+            env.update(PROCESSOR_SHARD_COUNT=str(count), PROCESSOR_SHARD_INDEX=str(index),
+                       TEMP_DATA_DIR=os.path.join(work_dir, f"instance-{index + 1}"))
+        log_path = os.path.join(work_dir, f"instance-{index + 1}.log")
+        log = open(log_path, 'w')
+        process = subprocess.Popen([sys.executable, DATA_PROCESSOR], cwd=SERVICES_DIR, env=env,
+                                   stdout=log, stderr=subprocess.STDOUT)
+        processes.append((process, log, log_path))
+
+    deadline = time.monotonic() + args.startup_timeout
+    for process, _, log_path in processes:
+        while True:
+            with open(log_path, encoding='utf-8', errors='replace') as f:
+                if "Subscrito ao tópico" in f.read():
+                    break
+            if process.poll() is not None:
+                raise RuntimeError(f"Instância encerrou durante a inicialização (veja {log_path}).")
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Instância não assinou o tópico a tempo (veja {log_path}).")
+            time.sleep(0.2)
+    return processes
+
+
+def stop_instances(processes):
+    """Encerra as instâncias com SIGINT (executa o bloco finally do data_processor)."""
+    for process, _, _ in processes:
+        if process.poll() is None:
+            process.send_signal(signal.SIGINT)
+    for process, log, _ in processes:
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        log.close()
+
+
+def publish_readings(args, run_id):
+    """Publica as leituras simuladas distribuídas entre os dispositivos e retorna o instante inicial."""
+    client = mqtt.Client(client_id=f"loadtest-publisher-{run_id}")
+    client.max_inflight_messages_set(1000)
+    client.max_queued_messages_set(0)  # Sem limite: todas as leituras ficam na fila de envio.
+    client.connect(args.host, args.port, 60)
+    client.loop_start()
+    topic = f"loadtest/{run_id}/sensor_data"
+    interval = 1.0 / args.rate if args.rate else 0.0
+    started = time.monotonic()
+    pending = []
+    for n in range(args.messages):
+        reading = {
+            "device_id": f"esp32-{n % args.devices:03d}",
+            "water_level": round(random.uniform(0, 100), 2),
+            "rainfall_intensity": round(random.uniform(0, 100), 2),
+            "temperature": round(random.uniform(15, 40), 2),
+            "humidity": round(random.uniform(20, 90), 2),
+            "smoke_concentration": round(random.uniform(0, 100), 2),
+        }
+        pending.append(client.publish(topic, json.dumps(reading), qos=1))
+        if interval:
+            time.sleep(max(0.0, started + (n + 1) * interval - time.monotonic()))
+    for info in pending:
+        info.wait_for_publish()
+    client.loop_stop()
+    client.disconnect()
+    return started
+
+
+def run(instances, args):
+    run_id = uuid.uuid4().hex[:8]
+    work_dir = tempfile.mkdtemp(prefix=f"guardiao_loadtest_{instances}_")
+    processes = start_instances(instances, args, run_id, work_dir)
+    collector = ResultCollector(args.host, args.port, f"loadtest/{run_id}/risk")
+    try:
+        started = publish_readings(args, run_id)
+        expected = args.messages * ANALYSES_PER_READING
+        received = collector.wait_for(expected, args.idle_timeout)
+        elapsed = (collector.last_at or time.monotonic()) - started
+    finally:
+        collector.close()
+        stop_instances(processes)
+    if args.keep:
+        print(f"  Arquivos e logs mantidos em {work_dir}")
+    else:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {
+        "instances": instances, "expected": expected, "received": received,
+        "seconds": elapsed, "readings_per_second": received / ANALYSES_PER_READING / elapsed if elapsed else 0.0,
+        "by_processor": dict(sorted(collector.by_processor.items())),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga do data_processor com várias instâncias.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--instances", default="1,2,4", help="Quantidades de instâncias, separadas por vírgula.")
+    parser.add_argument("--mode", choices=("shared", "shard"), default="shared")
+    parser.add_argument("--backend", choices=("sqlite", "jsonl"), default="sqlite")
+    parser.add_argument("--devices", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=0, help="Mensagens por segundo (0 = sem limite).")
+    parser.add_argument("--startup-timeout", type=float, default=120)
+    parser.add_argument("--idle-timeout", type=float, default=30,
+                        help="Segundos sem novos resultados antes de encerrar a rodada.")
+    parser.add_argument("--keep", action="store_true", help="Mantém os dados e logs de cada rodada.")
+    args = parser.parse_args()
+
+    results = []
+    for instances in (int(value) for value in args.instances.split(",")):
+        print(f"Rodada com {instances} instância(s) ({args.mode}, {args.backend})...")
+        result = run(instances, args)
+        results.append(result)
+        print(f"  {result['received']}/{result['expected']} resultados em {result['seconds']:.1f}s "
+              f"-> {result['readings_per_second']:.1f} leituras/s; por instância: {result['by_processor']}")
+
+    baseline = results[0]["readings_per_second"] or 1.0
+    print("\nInstâncias | Leituras/s | Ganho | Resultados")
+    for result in results:
+        print(f"{result['instances']:>10} | {result['readings_per_second']:>10.1f} | "
+              f"{result['readings_per_second'] / baseline:>4.2f}x | {result['received']}/{result['expected']}")
+
+
+if __name__ == "__main__":
+    main()
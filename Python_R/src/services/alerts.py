@@ -0,0 +1,407 @@
+# python_server/alerts.py
+# Geração e envio dos alertas de risco.
+# - Templates por perigo (enchente/incêndio) e nível de risco, montados uma única vez na importação
+#   e usados tanto pelo data_processor.py (mensagem do alerta e prompt do LM) quanto pelo dashboard.
+# - Deduplicação por dispositivo: um alerta só sai quando o nível de risco muda. A subida é
+#   imediata; a descida exige alguns resultados seguidos no nível mais baixo (histerese), para
+#   que um risco oscilando entre dois níveis não gere um alerta a cada análise.
+# - Envio assíncrono para um backend plugável (simulação local, serviço HTTP de LLM/notificação
+#   ou uma classe própria), em lotes, com limite de chamadas por minuto e cache das mensagens por
+#   (perigo, nível, entradas arredondadas): o mesmo prompt nunca é pago duas vezes.
+import importlib       # Backends próprios no formato "modulo:Classe".
+import logging
+import math            # Entradas não finitas (NaN) ficam fora do prompt.
+import threading       # Thread de envio e proteção do estado da deduplicação.
+import time            # Limite de chamadas e espera dos lotes.
+from collections import OrderedDict, deque
+
+import requests        # Backend HTTP.
+
+from results_store import RISK_LEVELS
+
+# --- Configurações Padrão ---
+DEFAULT_DEESCALATION_COUNT = 3     # Resultados seguidos em nível mais baixo antes de emitir a descida.
+DEFAULT_REPEAT_SECONDS = 0         # Reenvio de um alerta sem mudança de nível (0 = nunca).
+DEFAULT_MAX_CALLS_PER_MINUTE = 60  # Chamadas ao backend (cada chamada envia um lote).
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_BATCH_WAIT_SECONDS = 0.2   # Espera por mais alertas antes de enviar um lote incompleto.
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_CACHE_DECIMALS = 0         # Casas decimais das entradas na chave do cache e no prompt.
+HTTP_TIMEOUT_SECONDS = 10
+
+HAZARD_LABELS = {"flood": "Enchente", "fire": "Incêndio"}
+
+log = logging.getLogger(__name__)
+
+
+class AlertTemplate:
+    """Mensagem de um perigo e nível; `severity` é o estilo no dashboard (error, warning, info, success)."""
+
+    def __init__(self, severity, message):
+        self.severity = severity
+        self.message = message
+
+
+ALERT_TEMPLATES = {
+    "flood": {
+        "Muito Alto": AlertTemplate(
+            "error", "🚨 ALERTA MÁXIMO! Risco de enchente iminente. Busque abrigo seguro imediatamente "
+                     "e siga as instruções das autoridades."),
+        "Alto": AlertTemplate(
+            "warning", "🟠 ALERTA: Risco ALTO de enchente. Prepare-se para evacuação, tenha um kit de "
+                       "emergência pronto e monitore a situação."),
+        "Moderado": AlertTemplate(
+            "info", "🟡 Atenção: Risco MODERADO de enchente. Monitore o nível da água e as condições "
+                    "climáticas e evite áreas de risco."),
+        "Baixo": AlertTemplate(
+            "success", "🟢 Risco de enchente: Baixo. Situação sob controle. Continue acompanhando as "
+                       "informações oficiais."),
+    },
+    "fire": {
+        "Muito Alto": AlertTemplate(
+            "error", "🚨 ALERTA MÁXIMO! Risco de incêndio iminente. Evacue a área, chame os bombeiros e "
+                     "não tente combater o fogo por conta própria."),
+        "Alto": AlertTemplate(
+            "warning", "🟠 ALERTA: Risco ALTO de incêndio. Fique atento a sinais de fumaça e prepare-se "
+                       "para deixar a área."),
+        "Moderado": AlertTemplate(
+            "info", "🟡 Atenção: Risco MODERADO de incêndio. Evite atividades com fogo ou que gerem "
+                    "faíscas e monitore a umidade."),
+        "Baixo": AlertTemplate(
+            "success", "🟢 Risco de incêndio: Baixo. Situação sob controle."),
+    },
+}
+
+# Prompts para um LM real. Os campos entre chaves são as entradas do alerta (ALERT_INPUT_FIELDS).
+PROMPT_HEADERS = {
+    "flood": """**Guardião Natural - Alerta de Enchente:**
+Com base nos seguintes dados de sensor e previsões de risco de enchente:
+Nível atual da água: {water_level}cm
+Intensidade de chuva atual: {rainfall_intensity}%
+Previsão de Nível da Água (próximas horas): {predicted_water_level}cm
+Previsão de Chuva (próximas horas): {predicted_rainfall}%
+Nível de Risco Calculado pelo modelo de ML: {risk_level}
+
+Gere uma mensagem de alerta concisa e acionável para a população local, considerando o nível de risco.
+""",
+    "fire": """**Guardião Natural - Alerta de Incêndio:**
+Com base nos seguintes dados de sensor e previsões de risco de incêndio:
+Temperatura atual: {temperature}°C
+Umidade atual: {humidity}%
+Concentração de Fumaça atual: {smoke_concentration}%
+Previsão de Temperatura (próximas horas): {predicted_temperature}°C
+Previsão de Fumaça (próximas horas): {predicted_smoke}%
+Nível de Risco Calculado pelo modelo de ML: {risk_level}
+
+Gere uma mensagem de alerta concisa e acionável para a população local e autoridades
+(Defesa Civil, Bombeiros), considerando o nível de risco.
+""",
+}
+PROMPT_INSTRUCTIONS = {
+    "flood": {
+        "Baixo": "Use uma mensagem tranquilizadora, indicando que a situação está sob controle.",
+        "Moderado": "Alerte sobre a necessidade de monitoramento e precauções básicas.",
+        "Alto": "Instrua sobre precauções urgentes, como evitar áreas de risco, preparar kit de emergência "
+                "ou considerar evacuação.",
+    },
+    "fire": {
+        "Baixo": "Use uma mensagem tranquilizadora.",
+        "Moderado": "Alerte sobre o monitoramento e a necessidade de evitar atividades que gerem faíscas.",
+        "Alto": "Instrua sobre a evacuação imediata da área, contato com emergência e não tentar combater "
+                "o fogo por conta própria.",
+    },
+}
+PROMPT_INSTRUCTIONS["flood"]["Muito Alto"] = PROMPT_INSTRUCTIONS["flood"]["Alto"]
+PROMPT_INSTRUCTIONS["fire"]["Muito Alto"] = PROMPT_INSTRUCTIONS["fire"]["Alto"]
+
+# Um prompt pronto por perigo e nível: a cada alerta só as entradas são formatadas.
+PROMPT_TEMPLATES = {
+    (hazard, level): PROMPT_HEADERS[hazard].replace("{risk_level}", level)
+    + PROMPT_INSTRUCTIONS[hazard][level] + "\nA mensagem deve ser clara e direta.\n"
+    for hazard in PROMPT_HEADERS for level in RISK_LEVELS
+}
+
+# Entradas de cada alerta: leitura atual (`reading`) e previsões do resultado da análise (`result`).
+ALERT_INPUT_FIELDS = {
+    "flood": (("reading", "water_level"), ("reading", "rainfall_intensity"),
+              ("result", "predicted_water_level"), ("result", "predicted_rainfall")),
+    "fire": (("reading", "temperature"), ("reading", "humidity"), ("reading", "smoke_concentration"),
+             ("result", "predicted_temperature"), ("result", "predicted_smoke")),
+}
+
+
+def alert_template(hazard, risk_level):
+    """Template do perigo e nível (níveis desconhecidos usam o de risco Baixo)."""
+    templates = ALERT_TEMPLATES[hazard]
+    return templates.get(risk_level, templates["Baixo"])
+
+
+def alert_inputs(hazard, reading, result):
+    """Valores que entram no prompt do alerta, a partir da leitura e do resultado da análise."""
+    sources = {"reading": reading, "result": result}
+    return {field: sources[source].get(field) for source, field in ALERT_INPUT_FIELDS[hazard]}
+
+
+def round_input(value, decimals=DEFAULT_CACHE_DECIMALS):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return value
+    if not math.isfinite(value):
+        return None
+    value = round(float(value), decimals)
+    return int(value) if decimals <= 0 else value
+
+
+class PromptInputs(dict):
+    def __missing__(self, key):
+        return "N/A"
+
+
+class AlertRequest:
+    """Alerta a enviar: perigo, nível, dispositivo e entradas arredondadas (que formam a chave do cache)."""
+
+    def __init__(self, hazard, risk_level, device_id, inputs, decimals=DEFAULT_CACHE_DECIMALS):
+        self.hazard = hazard
+        self.risk_level = risk_level
+        self.device_id = device_id
+        rounded = {field: round_input(value, decimals) for field, value in inputs.items()}
+        self.inputs = {field: value for field, value in rounded.items() if value is not None}
+        self.key = (hazard, risk_level, tuple(sorted(self.inputs.items())))
+        self.created_at = time.monotonic()
+
+    @property
+    def prompt(self):
+        """Prompt do LM (montado só quando a mensagem não está no cache)."""
+        template = PROMPT_TEMPLATES.get((self.hazard, self.risk_level), PROMPT_TEMPLATES[(self.hazard, "Baixo")])
+        return template.format_map(PromptInputs(self.inputs))
+
+    def to_dict(self):
+        return {"hazard": self.hazard, "risk_level": self.risk_level, "device_id": self.device_id,
+                "inputs": self.inputs, "prompt": self.prompt}
+
+
+class AlertDeduplicator:
+    """
+    Decide se um resultado gera alerta, por dispositivo e perigo: sempre no primeiro resultado e
+    quando o risco sobe; na descida, só depois de `deescalation_count` resultados seguidos abaixo do
+    nível atual (o alerta sai com o maior nível dessa sequência). Com `repeat_seconds`, um nível
+    inalterado volta a ser alertado depois desse intervalo.
+    """
+
+    def __init__(self, deescalation_count=DEFAULT_DEESCALATION_COUNT, repeat_seconds=DEFAULT_REPEAT_SECONDS):
+        self.deescalation_count = max(deescalation_count, 1)
+        self.repeat_seconds = repeat_seconds
+        self._states = {}   # (dispositivo, perigo) -> [nível atual, último envio, descidas seguidas, maior nível na descida]
+        self._lock = threading.Lock()
+
+    def update(self, device_id, hazard, risk_level, now=None):
+        """Registra o resultado; retorna o nível a alertar ou None (alerta suprimido)."""
+        now = time.monotonic() if now is None else now
+        value = level_value(risk_level)
+        with self._lock:
+            state = self._states.get((device_id, hazard))
+            if state is None or value > level_value(state[0]):
+                self._states[(device_id, hazard)] = [risk_level, now, 0, None]
+                return risk_level
+            if value == level_value(state[0]):
+                state[2], state[3] = 0, None
+                if self.repeat_seconds and now - state[1] >= self.repeat_seconds:
+                    state[1] = now
+                    return risk_level
+                return None
+            state[2] += 1
+            if state[3] is None or value > level_value(state[3]):
+                state[3] = risk_level
+            if state[2] < self.deescalation_count:
+                return None
+            level = state[3]
+            self._states[(device_id, hazard)] = [level, now, 0, None]
+            return level
+
+
+def level_value(risk_level):
+    return RISK_LEVELS.index(risk_level) if risk_level in RISK_LEVELS else 0
+
+
+# --- Backends de envio ---
+
+class TemplateBackend:
+    """Simulação do LM, sem chamada externa: a mensagem é o texto do template do perigo e nível."""
+
+    def send_batch(self, batch):
+        return [alert_template(request.hazard, request.risk_level).message for request in batch]
+
+
+class HttpBackend:
+    """
+    Envia cada lote em um POST JSON {"alerts": [{hazard, risk_level, device_id, inputs, prompt}]} para
+    um serviço de LLM ou de notificação. Se a resposta trouxer {"messages": [...]} (um texto por alerta),
+    essas são as mensagens; senão, o serviço só notifica e a mensagem é a do template.
+    """
+
+    def __init__(self, url, token=None, timeout=HTTP_TIMEOUT_SECONDS):
+        if not url:
+            raise ValueError("O backend http requer a URL do serviço (ALERT_HTTP_URL).")
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()   # Reaproveita a conexão entre os lotes.
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+
+    def send_batch(self, batch):
+        response = self.session.post(self.url, json={"alerts": [request.to_dict() for request in batch]},
+                                     timeout=self.timeout)
+        response.raise_for_status()
+        messages = None
+        if response.content and "json" in response.headers.get("Content-Type", ""):
+            messages = response.json().get("messages")
+        if not isinstance(messages, list) or len(messages) != len(batch):
+            return TemplateBackend().send_batch(batch)
+        return [str(message) for message in messages]
+
+
+def create_backend(name, url=None, token=None):
+    """Backend "template", "http" (em `url`) ou "modulo:Classe" (classe própria com send_batch, sem argumentos)."""
+    if ":" in name:
+        module_name, _, attribute = name.partition(":")
+        return getattr(importlib.import_module(module_name), attribute)()
+    if name == "template":
+        return TemplateBackend()
+    if name == "http":
+        return HttpBackend(url, token)
+    raise ValueError(f"Backend de alertas desconhecido: {name}")
+
+
+class RateLimiter:
+    """Balde de fichas: até `per_minute` chamadas por minuto, com rajadas de até `burst`."""
+
+    def __init__(self, per_minute, burst=1):
+        self.rate = per_minute / 60.0
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+
+    def acquire(self, stop=None):
+        """Espera uma ficha; retorna False se `stop` (threading.Event) for acionado antes."""
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            wait = (1 - self._tokens) / self.rate
+            if stop is not None and stop.wait(wait):
+                return False
+            if stop is None:
+                time.sleep(wait)
+
+
+class AlertDispatcher:
+    """
+    Fila de alertas enviada ao `backend` por uma thread própria, em lotes de até `batch_size`
+    (esperando até `batch_wait` segundos por mais alertas), com no máximo `max_calls_per_minute`
+    chamadas e cache LRU das mensagens por AlertRequest.key. Alertas iguais no mesmo lote geram
+    uma única entrada no lote. `on_alert(request, mensagem)` é chamado para cada alerta.
+    Se o backend falhar, o alerta sai com a mensagem do template (e não entra no cache).
+    """
+
+    def __init__(self, backend, on_alert, batch_size=DEFAULT_BATCH_SIZE, batch_wait=DEFAULT_BATCH_WAIT_SECONDS,
+                 max_calls_per_minute=DEFAULT_MAX_CALLS_PER_MINUTE, cache_size=DEFAULT_CACHE_SIZE,
+                 queue_size=DEFAULT_QUEUE_SIZE, registry=None):
+        self.backend = backend
+        self.on_alert = on_alert
+        self.batch_size = max(batch_size, 1)
+        self.batch_wait = batch_wait
+        self.cache_size = cache_size
+        self._limiter = RateLimiter(max_calls_per_minute) if max_calls_per_minute else None
+        self._cache = OrderedDict()
+        self._queue = deque()
+        self._queue_size = queue_size
+        self._condition = threading.Condition()
+        self._closed = False
+        self._stop = threading.Event()
+        self.counters = {"submitted": 0, "dropped": 0, "cache_hits": 0, "cache_misses": 0,
+                         "backend_calls": 0, "backend_errors": 0}
+        if registry is not None:
+            registry.callback("counter", "alert_dispatch_total",
+                              "Alertas por desfecho do envio (submitted, dropped, cache_hits, cache_misses, "
+                              "backend_calls, backend_errors).",
+                              lambda: {(name,): value for name, value in self.counters.items()}, ["outcome"])
+            registry.callback("gauge", "alert_queue_depth", "Alertas aguardando envio.", lambda: len(self._queue))
+        self._thread = threading.Thread(target=self._run, name="alert-dispatcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, request):
+        """Enfileira o alerta sem bloquear; com a fila cheia, o alerta mais antigo é descartado."""
+        with self._condition:
+            self.counters["submitted"] += 1
+            if len(self._queue) >= self._queue_size:
+                self._queue.popleft()
+                self.counters["dropped"] += 1
+            self._queue.append(request)
+            self._condition.notify()
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._queue and not self._closed:
+                self._condition.wait()
+            deadline = time.monotonic() + self.batch_wait
+            while len(self._queue) < self.batch_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return   # Encerrado e sem alertas pendentes.
+            try:
+                self._dispatch(batch)
+            except Exception:
+                log.exception("Falha ao entregar um lote de alertas.")
+
+    def _dispatch(self, batch):
+        pending = OrderedDict()   # chave -> alertas com a mesma chave
+        for request in batch:
+            message = self._cache.get(request.key)
+            if message is not None:
+                self._cache.move_to_end(request.key)
+                self.counters["cache_hits"] += 1
+                self.on_alert(request, message)
+            else:
+                pending.setdefault(request.key, []).append(request)
+        if not pending:
+            return
+
+        self.counters["cache_misses"] += len(pending)
+        unique = [requests_for_key[0] for requests_for_key in pending.values()]
+        if self._limiter is not None:
+            self._limiter.acquire(self._stop)
+        try:
+            self.counters["backend_calls"] += 1
+            messages = self.backend.send_batch(unique)
+            cacheable = True
+        except Exception as e:
+            self.counters["backend_errors"] += 1
+            log.warning("Backend de alertas falhou (%s); usando as mensagens dos templates.", e)
+            messages = TemplateBackend().send_batch(unique)
+            cacheable = False
+        for (key, requests_for_key), message in zip(pending.items(), messages):
+            if cacheable and self.cache_size:
+                self._cache[key] = message
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            for request in requests_for_key:
+                self.on_alert(request, message)
+
+    def close(self):
+        """Envia os alertas pendentes (sem esperar o limite de chamadas) e encerra a thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._stop.set()
+        self._thread.join()
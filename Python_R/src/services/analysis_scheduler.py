@@ -0,0 +1,153 @@
+# python_server/analysis_scheduler.py
+# Agendador que coalesce as leituras por dispositivo e tipo de análise (enchente/incêndio).
+# Em vez de disparar uma análise completa para cada leitura, cada dispositivo/análise roda
+# no máximo a cada `min_interval` segundos, exceto quando algum campo monitorado muda mais
+# que o limiar configurado (mudança brusca = possível alerta crítico, analisado na hora).
+# Leituras represadas nunca são perdidas: ao fim do intervalo a última delas é analisada.
+import logging
+import math            # Valores não numéricos (NaN) nos campos monitorados.
+import threading       # Thread que dispara as análises represadas.
+import time            # Relógio monotônico para os intervalos.
+
+# --- Configurações Padrão ---
+DEFAULT_MIN_INTERVAL_SECONDS = 30
+REPORT_INTERVAL_SECONDS = 60
+
+# Variação mínima (em relação à última leitura analisada) que dispara a análise imediatamente.
+DEFAULT_CHANGE_THRESHOLDS = {
+    'water_level': 10,          # %
+    'rainfall_intensity': 15,   # %
+    'temperature': 3,           # °C
+    'humidity': 10,             # %
+    'smoke_concentration': 10,  # %
+}
+
+log = logging.getLogger(__name__)
+
+
+def as_number(value):
+    """Valor do campo como float, ou None se ausente ou não numérico (texto, NaN)."""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(number) else number
+
+
+class _ScheduleState:
+    """Situação de um par (dispositivo, análise)."""
+
+    def __init__(self):
+        self.last_run = None          # Instante da última análise disparada.
+        self.last_values = {}         # Campos monitorados da última leitura analisada.
+        self.pending = None           # Última leitura represada: (data, features).
+
+
+class AnalysisScheduler:
+    """
+    Decide quando cada leitura deve gerar análise e repassa as execuções para `submit`
+    (ex.: AnalysisPipeline.submit). `fields_by_analysis` define os campos monitorados
+    de cada análise, ex.: {"flood": ["water_level", "rainfall_intensity"], ...}.
+    """
+
+    def __init__(self, submit, fields_by_analysis, min_interval=DEFAULT_MIN_INTERVAL_SECONDS,
+                 change_thresholds=None, report_interval=REPORT_INTERVAL_SECONDS):
+        self.submit = submit
+        self.fields_by_analysis = fields_by_analysis
+        self.min_interval = min_interval
+        self.change_thresholds = DEFAULT_CHANGE_THRESHOLDS if change_thresholds is None else change_thresholds
+        self._states = {}
+        self._lock = threading.Lock()
+        self.counters = {"readings": 0, "runs": 0, "runs_on_change": 0,
+                         "runs_deferred": 0, "skipped": 0}
+        self._stop = threading.Event()
+        self._report_interval = report_interval
+        self._thread = threading.Thread(target=self._loop, name="analysis-scheduler", daemon=True)
+        self._thread.start()
+
+    def offer(self, data, features=None):
+        """Recebe uma nova leitura e dispara (ou represa) as análises correspondentes."""
+        now = time.monotonic()
+        to_run = []
+        with self._lock:
+            self.counters["readings"] += 1
+            for analysis, fields in self.fields_by_analysis.items():
+                key = (data.get('device_id'), analysis)
+                state = self._states.get(key)
+                if state is None:
+                    state = self._states[key] = _ScheduleState()
+                reason = self._reason_to_run(state, data, fields, now)
+                if reason is None:
+                    if state.pending is not None:
+                        self.counters["skipped"] += 1  # A leitura represada anterior foi superada.
+                    state.pending = (data, features)
+                    continue
+                if state.pending is not None:
+                    self.counters["skipped"] += 1
+                if reason == "change":
+                    self.counters["runs_on_change"] += 1
+                self._mark_run(state, data, fields, now)
+                to_run.append(analysis)
+
+        for analysis in to_run:
+            self.submit(data, features, analyses=[analysis])
+
+    def _reason_to_run(self, state, data, fields, now):
+        if state.last_run is None or now - state.last_run >= self.min_interval:
+            return "interval"
+        for field in fields:
+            threshold = self.change_thresholds.get(field)
+            value, previous = as_number(data.get(field)), as_number(state.last_values.get(field))
+            # Campo ausente ou não numérico (ex.: texto vindo do firmware): não conta como mudança.
+            if threshold is None or value is None or previous is None:
+                continue
+            if abs(value - previous) >= threshold:
+                return "change"
+        return None
+
+    def _mark_run(self, state, data, fields, now):
+        state.last_run = now
+        state.last_values = {field: data.get(field) for field in fields}
+        state.pending = None
+        self.counters["runs"] += 1
+
+    def _flush_due(self):
+        """Dispara a última leitura represada dos pares cujo intervalo já passou."""
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            for (_, analysis), state in self._states.items():
+                if state.pending is not None and now - state.last_run >= self.min_interval:
+                    data, features = state.pending
+                    self._mark_run(state, data, self.fields_by_analysis[analysis], now)
+                    self.counters["runs_deferred"] += 1
+                    due.append((analysis, data, features))
+        for analysis, data, features in due:
+            self.submit(data, features, analyses=[analysis])
+
+    def _loop(self):
+        last_report = time.monotonic()
+        while not self._stop.wait(1.0):
+            self._flush_due()
+            if self._report_interval and time.monotonic() - last_report >= self._report_interval:
+                last_report = time.monotonic()
+                stats = self.stats()
+                log.info("Agendador: leituras=%d, análises=%d (por mudança=%d, represadas=%d), "
+                         "análises evitadas=%d", stats['readings'], stats['runs'],
+                         stats['runs_on_change'], stats['runs_deferred'], stats['skipped'])
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+    def close(self):
+        """Para o agendador disparando as leituras ainda represadas."""
+        self._stop.set()
+        self._thread.join()
+        with self._lock:
+            pending = [(analysis, state.pending) for (_, analysis), state in self._states.items()
+                       if state.pending is not None]
+            for state in self._states.values():
+                state.pending = None
+        for analysis, (data, features) in pending:
+            self.submit(data, features, analyses=[analysis])
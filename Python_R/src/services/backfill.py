@@ -0,0 +1,347 @@
+# python_server/backfill.py
+# Reprocessamento em lote (backfill/replay) das leituras arquivadas.
+# Recalcula o histórico de risco de um período inteiro sem passar pelo MQTT: as leituras são
+# lidas em blocos (do armazenamento do data_processor ou de um arquivo JSON Lines/CSV, inclusive
+# .gz), as features das janelas móveis e as classificações são calculadas com NumPy sobre o bloco
+# inteiro de cada dispositivo, os dispositivos são distribuídos entre os núcleos da máquina
+# (ProcessPoolExecutor) e os resultados são gravados no histórico (risk_results.db) em lote,
+# marcados como reprocessamento: o limite RISK_HISTORY_PER_DEVICE não os apaga.
+#
+# Uso (na pasta src/services):
+#   python backfill.py                                   # todo o armazenamento de leituras
+#   python backfill.py --since 2025-01-01 --until 2025-01-31T23:59:59
+#   python backfill.py --input arquivo/leituras_2024.jsonl.gz --features rolling
+import argparse        # Linha de comando.
+import os              # Caminhos e variáveis de ambiente.
+import time            # Medição da vazão.
+from concurrent.futures import ProcessPoolExecutor  # Um processo por núcleo.
+from datetime import datetime, timedelta
+
+import numpy as np     # Janelas móveis e classificação vetorizadas.
+import pandas as pd    # Leitura dos arquivos em blocos e agrupamento por dispositivo.
+from dotenv import load_dotenv
+
+from sensor_store import PAYLOAD_FIELD_ALIASES
+from sensor_archive import open_tiered_store
+from feature_store import FEATURE_DEFINITIONS
+from forecaster import OnlineForecaster, FORECAST_OUTPUTS, FORECAST_FIELDS
+from risk_engine import RiskEngine, FLOOD_FEATURES, FIRE_FEATURES, FLOOD_PLACEHOLDERS, FIRE_PLACEHOLDERS
+from results_store import ResultStore, RESULTS_DB_NAME
+from logging_setup import configure_logging
+
+load_dotenv()
+
+# --- Configurações (mesmas variáveis de ambiente do data_processor.py) ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+R_ANALYSIS_DIR = os.path.join(BASE_DIR, '..', 'r_analysis')
+TEMP_DATA_DIR = os.getenv("TEMP_DATA_DIR", os.path.join(R_ANALYSIS_DIR, 'temp_data'))
+SENSOR_STORE_DIR = os.path.join(TEMP_DATA_DIR, 'sensor_store')
+SENSOR_STORE_BACKEND = os.getenv("SENSOR_STORE_BACKEND", "sqlite")
+SENSOR_ARCHIVE_DIR = os.getenv("SENSOR_ARCHIVE_DIR", os.path.join(TEMP_DATA_DIR, 'sensor_archive'))
+SENSOR_ARCHIVE_FORMAT = os.getenv("SENSOR_ARCHIVE_FORMAT", "parquet")
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", os.path.join(R_ANALYSIS_DIR, 'models'))
+MODEL_FEATURES = os.getenv("MODEL_FEATURES", "latest").lower()
+FORECAST_SELECTION_WINDOW = int(os.getenv("FORECAST_SELECTION_WINDOW", "200"))
+FORECAST_RESELECT_EVERY = int(os.getenv("FORECAST_RESELECT_EVERY", "100"))
+
+DEFAULT_CHUNK_ROWS = 100_000               # Leituras por bloco (arquivos).
+DEFAULT_CHUNK_PERIOD = timedelta(hours=6)  # Período por bloco (armazenamento de leituras).
+
+# Cada análise: (campos obrigatórios da leitura, features do modelo, feature -> campo da leitura
+# usado no modo "latest", valores fixos). Mesmo mapeamento de RiskEngine.analyze_flood/analyze_fire.
+ANALYSES = {
+    "flood": (['water_level', 'rainfall_intensity'], FLOOD_FEATURES,
+              {'water_level_avg_24h': 'water_level', 'rainfall_total_24h': 'rainfall_intensity'},
+              FLOOD_PLACEHOLDERS),
+    "fire": (['temperature', 'humidity', 'smoke_concentration'], FIRE_FEATURES,
+             {'temperature_avg_24h': 'temperature', 'humidity_avg_24h': 'humidity',
+              'smoke_concentration_avg_6h': 'smoke_concentration'},
+             FIRE_PLACEHOLDERS),
+}
+READING_FIELDS = sorted({field for fields, _, _, _ in ANALYSES.values() for field in fields})
+MAX_WINDOW = max(size for _, _, size in FEATURE_DEFINITIONS.values())
+
+
+class DeviceState:
+    """O que um dispositivo carrega de um bloco para o seguinte (enviado junto com cada tarefa)."""
+
+    def __init__(self):
+        self.context = None    # Leituras da última MAX_WINDOW (início das janelas móveis).
+        self.forecasters = {}  # campo -> OnlineForecaster
+        self.last_time = None
+
+
+# --- Leitura em Blocos ---
+
+def read_archive(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Lê um arquivo de leituras (JSON Lines ou CSV, opcionalmente .gz) em blocos de `chunk_rows` linhas."""
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith('.csv'):
+        reader = pd.read_csv(path, chunksize=chunk_rows)
+    else:
+        reader = pd.read_json(path, lines=True, chunksize=chunk_rows, dtype=False, convert_dates=False)
+    with reader:
+        yield from reader
+
+
+def read_store(store, since=None, until=None, period=DEFAULT_CHUNK_PERIOD):
+    """Lê o armazenamento de leituras em blocos de `period` (intervalos consecutivos, sem sobreposição)."""
+    first, last = store.time_range()
+    if first is None:
+        return
+    start = since or datetime.fromisoformat(first)
+    end = until or datetime.fromisoformat(last)
+    while start <= end:
+        stop = min(start + period - timedelta(microseconds=1), end)
+        records = store.query(since=start, until=stop)
+        if records:
+            yield pd.DataFrame.from_records(records)
+        start += period
+
+
+def prepare(frame):
+    """Normaliza um bloco: nomes dos campos do ESP32, tipos numéricos e timestamp (sem leituras inválidas)."""
+    for alias, field in PAYLOAD_FIELD_ALIASES.items():
+        if alias in frame.columns:
+            frame[field] = frame[field].fillna(frame[alias]) if field in frame.columns else frame[alias]
+    for field in READING_FIELDS:
+        frame[field] = pd.to_numeric(frame[field], errors='coerce') if field in frame.columns else np.nan
+    timestamps = frame['timestamp'] if 'timestamp' in frame.columns else pd.Series(None, index=frame.index)
+    if 'timestamp_device' in frame.columns:
+        timestamps = timestamps.fillna(frame['timestamp_device'])
+    frame['timestamp'] = pd.to_datetime(timestamps, errors='coerce', format='ISO8601')
+    frame['device_id'] = frame['device_id'].fillna('').astype(str) if 'device_id' in frame.columns else ''
+    return frame.loc[frame['timestamp'].notna(), ['device_id', 'timestamp'] + READING_FIELDS]
+
+
+# --- Cálculo Vetorizado (executado nos processos do pool) ---
+
+def rolling_features(frame):
+    """
+    Features de FEATURE_DEFINITIONS em cada leitura, iguais às do FeatureStore: janelas de tempo
+    fechadas nos dois extremos, só com os valores presentes do campo; uma leitura sem o campo
+    repete as features da anterior. Somas acumuladas + busca binária do início de cada janela.
+    """
+    times = frame['timestamp'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    features = {}
+    for name, (field, aggregation, size) in FEATURE_DEFINITIONS.items():
+        values = frame[field].to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        t, v = times[valid], values[valid]
+        start = np.searchsorted(t, t - pd.Timedelta(size).value, side='left')
+        if aggregation == 'change':
+            result = v - v[start]
+        else:
+            sums = np.concatenate([[0.0], np.cumsum(v)])
+            result = sums[1:] - sums[start]
+            if aggregation == 'mean':
+                result = result / (np.arange(1, len(v) + 1) - start)
+        column = np.full(len(values), np.nan)
+        column[valid] = result
+        features[name] = pd.Series(column).ffill().to_numpy()
+    return features
+
+
+def online_forecasts(frame, forecasters, window, reselect_every):
+    """
+    Previsão de 1 passo após cada leitura (como o ForecastStore do FORECAST_MODE=online),
+    com as recursões dos modelos calculadas sobre o bloco inteiro (OnlineForecaster.update_many).
+    """
+    forecasts = {}
+    for field in FORECAST_FIELDS:
+        forecaster = forecasters.get(field)
+        if forecaster is None:
+            forecaster = forecasters[field] = OnlineForecaster(window, reselect_every)
+        values = frame[field].to_numpy(dtype=float)
+        column = np.full(len(values), np.nan)
+        previous = forecaster.forecast()
+        valid = ~np.isnan(values)
+        column[valid] = forecaster.update_many(values[valid])
+        column = pd.Series(column).ffill()
+        forecasts[field] = (column.fillna(previous) if previous is not None else column).to_numpy()
+    return forecasts
+
+
+def classify(model, X):
+    """Classe de cada linha; linhas repetidas (comuns com leituras inteiras) são classificadas uma vez."""
+    unique, inverse = np.unique(X, axis=0, return_inverse=True)
+    return model.predict_index(unique)[inverse.reshape(-1)]
+
+
+_engine = None
+_options = None
+
+
+def init_worker(r_analysis_dir, model_dir, options):
+    """Inicialização de cada processo: carrega os modelos do cache de artefatos uma única vez."""
+    global _engine, _options
+    # O dataset não muda durante o backfill: dispensa as verificações de recarga.
+    _engine = RiskEngine(r_analysis_dir, model_dir=model_dir, check_interval=float('inf'))
+    _options = options
+
+
+def replay_device(device_id, readings, state):
+    """
+    Analisa, em lote, as leituras de um dispositivo dentro de um bloco.
+    Retorna (dispositivo, {análise: [resultados]}, estado para o próximo bloco, leituras ignoradas).
+    """
+    state = state or DeviceState()
+    readings = readings.sort_values('timestamp', kind='stable')
+    skipped = 0
+    if state.last_time is not None:
+        # Leituras anteriores às já processadas: ignoradas, como no FeatureStore.
+        in_order = readings['timestamp'] >= state.last_time
+        skipped = int((~in_order).sum())
+        readings = readings[in_order]
+    if readings.empty:
+        return device_id, {}, state, skipped
+
+    rolling = _options['features'] == 'rolling'
+    frame = pd.concat([state.context, readings]) if rolling and state.context is not None else readings
+    frame = frame.reset_index(drop=True)
+    new_rows = np.arange(len(frame) - len(readings), len(frame))
+    features = rolling_features(frame) if rolling else {}
+    forecasts = (online_forecasts(readings, state.forecasters, _options['window'], _options['reselect_every'])
+                 if _options['forecasts'] == 'online' else {})
+    timestamps = readings['timestamp'].dt.strftime('%Y-%m-%dT%H:%M:%S').to_numpy()
+
+    results = {}
+    for analysis, (fields, feature_names, current_fields, placeholders) in ANALYSES.items():
+        mask = readings[fields].notna().all(axis=1).to_numpy()
+        if not mask.any():
+            continue
+        columns = []
+        for name in feature_names:
+            if name in current_fields:
+                column = readings[current_fields[name]].to_numpy(dtype=float)
+            else:
+                column = np.full(len(readings), float(placeholders.get(name, 0)))
+            if name in features:
+                rolled = features[name][new_rows]
+                column = np.where(np.isnan(rolled), column, rolled)
+            columns.append(column[mask])
+        model = _engine.models[analysis].get()
+        levels = np.array(model.classes)[classify(model, np.column_stack(columns))]
+        outputs = {output: (forecasts[field][mask] if field in forecasts else np.full(mask.sum(), np.nan))
+                   for output, field in FORECAST_OUTPUTS[analysis].items()}
+        results[analysis] = [
+            {"risk_level": level,
+             **{output: (None if np.isnan(values[i]) else float(values[i])) for output, values in outputs.items()},
+             "timestamp_analysis": timestamp, "device_id": device_id, "backfill": True}
+            for i, (level, timestamp) in enumerate(zip(levels, timestamps[mask]))]
+
+    state.last_time = readings['timestamp'].iloc[-1]
+    if rolling:
+        state.context = frame[frame['timestamp'] >= state.last_time - MAX_WINDOW]
+    return device_id, results, state, skipped
+
+
+# --- Execução ---
+
+def backfill(chunks, result_store, workers, options, r_analysis_dir=R_ANALYSIS_DIR, model_dir=MODEL_CACHE_DIR,
+             replace=True):
+    """
+    Processa os blocos de leituras em ordem: cada bloco é dividido por dispositivo entre os
+    processos e os resultados do bloco são gravados no histórico em uma transação por análise.
+    Com `replace`, os resultados já gravados no período de cada dispositivo são substituídos
+    (rodar o mesmo backfill de novo não duplica o histórico).
+    Retorna um resumo (leituras, resultados, leituras ignoradas e tempo).
+    """
+    # Garante os artefatos antes de iniciar o pool (os processos só carregam, nunca treinam ao mesmo tempo).
+    for model in RiskEngine(r_analysis_dir, model_dir=model_dir).models.values():
+        model.get()
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(workers, initializer=init_worker,
+                                       initargs=(r_analysis_dir, model_dir, options))
+    else:
+        init_worker(r_analysis_dir, model_dir, options)
+
+    states, summary = {}, {"readings": 0, "results": 0, "skipped": 0}
+    started = time.perf_counter()
+    try:
+        for chunk in chunks:
+            chunk = prepare(chunk)
+            groups = [(device_id, group, states.get(device_id))
+                      for device_id, group in chunk.groupby('device_id', sort=False)]
+            if not groups:
+                continue
+            if executor is not None:
+                outputs = executor.map(replay_device, *zip(*groups))
+            else:
+                outputs = (replay_device(*group) for group in groups)
+            batch = {analysis: [] for analysis in ANALYSES}
+            for device_id, results, state, skipped in outputs:
+                states[device_id] = state
+                summary["skipped"] += skipped
+                for analysis, device_results in results.items():
+                    batch[analysis].extend(device_results)
+            for analysis, results in batch.items():
+                summary["results"] += result_store.publish_many(analysis, results, replace=replace, backfill=True)
+            summary["readings"] += len(chunk)
+            elapsed = time.perf_counter() - started
+            print(f"{summary['readings']} leituras, {summary['results']} resultados "
+                  f"({summary['readings'] / elapsed * 60:,.0f} leituras/min)")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    summary["seconds"] = time.perf_counter() - started
+    return summary
+
+
+def parse_moment(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reprocessa em lote as leituras arquivadas e grava o histórico de risco.")
+    parser.add_argument("--input", default=None,
+                        help="Arquivo de leituras (.jsonl, .json, .csv, opcionalmente .gz). "
+                             "Sem ele, lê o armazenamento do data_processor (SENSOR_STORE_BACKEND).")
+    parser.add_argument("--since", default=None, help="Início do período (ISO), só para o armazenamento.")
+    parser.add_argument("--until", default=None, help="Fim do período (ISO), só para o armazenamento.")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="Leituras por bloco (--input).")
+    parser.add_argument("--chunk-hours", type=float, default=DEFAULT_CHUNK_PERIOD.total_seconds() / 3600,
+                        help="Horas de leituras por bloco (armazenamento).")
+    parser.add_argument("--features", choices=("latest", "rolling"), default=MODEL_FEATURES,
+                        help="Features do modelo, como MODEL_FEATURES (padrão: variável de ambiente).")
+    parser.add_argument("--forecasts", choices=("online", "none"), default="online",
+                        help="online: previsões incrementais do forecaster.py; none: sem previsões.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Processos de análise (padrão: um por núcleo; 1 = no próprio processo).")
+    parser.add_argument("--output-db", default=os.path.join(TEMP_DATA_DIR, RESULTS_DB_NAME),
+                        help="Banco do histórico de resultados.")
+    parser.add_argument("--replace", action=argparse.BooleanOptionalAction, default=True,
+                        help="Substitui os resultados já gravados no período reprocessado de cada dispositivo "
+                             "(padrão); --no-replace acrescenta os resultados aos existentes.")
+    parser.add_argument("--model-dir", default=MODEL_CACHE_DIR)
+    parser.add_argument("--r-analysis-dir", default=R_ANALYSIS_DIR)
+    args = parser.parse_args()
+    configure_logging(os.getenv("LOG_LEVEL", "INFO"), os.getenv("LOG_FORMAT", "text"))
+
+    store = None
+    if args.input:
+        chunks = read_archive(args.input, args.chunk_rows)
+    else:
+        # Inclui as leituras já movidas para o arquivo frio (SENSOR_RAW_RETENTION_DAYS).
+        store = open_tiered_store(SENSOR_STORE_BACKEND, SENSOR_STORE_DIR, SENSOR_ARCHIVE_DIR, SENSOR_ARCHIVE_FORMAT)
+        chunks = read_store(store, parse_moment(args.since), parse_moment(args.until),
+                            timedelta(hours=args.chunk_hours))
+    result_store = ResultStore(args.output_db)
+    options = {"features": args.features, "forecasts": args.forecasts,
+               "window": FORECAST_SELECTION_WINDOW, "reselect_every": FORECAST_RESELECT_EVERY}
+    try:
+        summary = backfill(chunks, result_store, max(args.workers, 1), options,
+                           args.r_analysis_dir, args.model_dir, args.replace)
+    finally:
+        result_store.close()
+        if store is not None:
+            store.close()
+    rate = summary["readings"] / summary["seconds"] * 60 if summary["seconds"] else 0
+    print(f"Backfill concluído: {summary['readings']} leituras, {summary['results']} resultados gravados, "
+          f"{summary['skipped']} leituras fora de ordem ignoradas, {summary['seconds']:.1f} s "
+          f"({rate:,.0f} leituras/min).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# python_server/change_notifier.py
+# Canal de notificação de mudanças do data_processor para o dashboard.
+# Cada canal ("flood", "fire", ...) tem um número de versão incrementado a cada novidade;
+# o dashboard compara a versão com a última que desenhou e só refaz os painéis afetados.
+# Fontes de eventos:
+#   - MQTT: assina o tópico de resultados publicado pelo data_processor
+#     (<MQTT_RESULTS_TOPIC>/<dispositivo>/<análise>) e guarda o último resultado de cada dispositivo;
+#   - arquivos: observa data de modificação/tamanho de arquivos (ex.: flood_risk_output.json),
+#     usado quando o broker não está acessível;
+#   - buffers de leituras: uma única thread acrescenta as leituras novas aos buffers do dashboard
+#     (sensor_buffer.py) e notifica o canal do buffer, em vez de cada sessão consultar o armazenamento.
+import json            # Para decodificar os resultados publicados.
+import logging
+import os              # Para consultar data de modificação e tamanho dos arquivos.
+import threading       # Proteção das versões e thread de observação dos arquivos.
+
+import paho.mqtt.client as mqtt
+
+FILE_WATCH_INTERVAL_SECONDS = 1.0
+BUFFER_REFRESH_INTERVAL_SECONDS = 2.0
+
+log = logging.getLogger(__name__)
+
+
+class ChangeNotifier:
+    """Versões por canal e último resultado de cada dispositivo, compartilhados entre as sessões."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._results = {}  # análise -> {dispositivo: resultado}
+        self.source = None  # "mqtt" ou "files", preenchido por quem inicia a fonte de eventos.
+
+    def notify(self, channel):
+        with self._lock:
+            self._versions[channel] = self._versions.get(channel, 0) + 1
+
+    def version(self, channel):
+        with self._lock:
+            return self._versions.get(channel, 0)
+
+    def versions(self):
+        """Versões de todos os canais: muda sempre que qualquer canal recebe uma novidade."""
+        with self._lock:
+            return tuple(sorted(self._versions.items()))
+
+    def publish_result(self, analysis, device_id, result):
+        """Registra o resultado de uma análise e notifica o canal correspondente."""
+        with self._lock:
+            devices = self._results.get(analysis)
+            if devices is None:
+                devices = self._results[analysis] = {}
+            devices[device_id] = result
+            self._versions[analysis] = self._versions.get(analysis, 0) + 1
+
+    def latest_result(self, analysis):
+        """Resultado mais recente da análise entre todos os dispositivos (None se nada chegou)."""
+        with self._lock:
+            results = list(self._results.get(analysis, {}).values())
+        if not results:
+            return None
+        return max(results, key=lambda result: str(result.get('timestamp_analysis', '')))
+
+
+def start_mqtt_listener(notifier, host, port, results_topic, client_id):
+    """
+    Assina os resultados publicados pelo data_processor. As mensagens retidas chegam logo
+    após a assinatura, então o dashboard já começa com o último resultado de cada dispositivo.
+    Retorna o cliente MQTT ou lança a exceção de conexão.
+    """
+    def on_connect(client, userdata, flags, rc):
+        client.subscribe(f"{results_topic}/#")
+
+    def on_message(client, userdata, msg):
+        # Tópico: <results_topic>/<dispositivo>/<análise>
+        parts = msg.topic[len(results_topic):].strip('/').split('/')
+        if len(parts) != 2:
+            return
+        try:
+            result = json.loads(msg.payload.decode())
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return
+        notifier.publish_result(parts[1], result.get('device_id', parts[0]), result)
+
+    client = mqtt.Client(client_id=client_id)
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(host, port, 60)
+    client.loop_start()
+    notifier.source = "mqtt"
+    return client
+
+
+def start_file_watcher(notifier, paths_by_channel, interval=FILE_WATCH_INTERVAL_SECONDS):
+    """Notifica o canal sempre que um dos seus arquivos muda (data de modificação ou tamanho)."""
+    def signature(path):
+        try:
+            stat = os.stat(path)
+            return stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return None
+
+    def watch():
+        signatures = {path: signature(path) for paths in paths_by_channel.values() for path in paths}
+        while True:
+            stop.wait(interval)
+            if stop.is_set():
+                return
+            for channel, paths in paths_by_channel.items():
+                changed = False
+                for path in paths:
+                    current = signature(path)
+                    if current != signatures[path]:
+                        signatures[path] = current
+                        changed = True
+                if changed:
+                    notifier.notify(channel)
+
+    stop = threading.Event()
+    threading.Thread(target=watch, name="file-watcher", daemon=True).start()
+    notifier.source = "files"
+    return stop
+
+
+def start_buffer_refresher(notifier, buffers_by_channel, interval=BUFFER_REFRESH_INTERVAL_SECONDS):
+    """Acrescenta as leituras novas a cada buffer e notifica o canal do buffer quando alguma entrou."""
+    def refresh():
+        while True:
+            for channel, buffer in buffers_by_channel.items():
+                try:
+                    sequence = buffer.sequence
+                    buffer.refresh()
+                    if buffer.sequence != sequence:
+                        notifier.notify(channel)
+                except Exception:
+                    log.exception("Falha ao atualizar o buffer de leituras '%s'.", channel)
+            if stop.wait(interval):
+                return
+
+    stop = threading.Event()
+    threading.Thread(target=refresh, name="buffer-refresher", daemon=True).start()
+    return stop
@@ -1,20 +1,76 @@
 # python_server/dashboard.py
 # Biblioteca principal para criar o dashboard web interativo.
 import streamlit as st
+import logging
 import pandas as pd    # Para manipulação e análise de dados (DataFrames).
-import json            # Para ler e escrever arquivos JSON.
-import time            # Para pausas e controle de tempo.
 import os              # Para operações de sistema de arquivos.
+import uuid            # Identificador único do cliente MQTT do dashboard.
 # Para criar gráficos interativos e visualmente atraentes.
 import plotly.express as px
-from datetime import datetime  # Para trabalhar com timestamps.
+import numpy as np     # Para localizar o início do período no buffer ordenado.
+from datetime import datetime, timedelta  # Para trabalhar com timestamps.
+# Mesmo armazenamento usado pelo data_processor.py: ativo + arquivo frio das leituras antigas.
+from sensor_archive import open_tiered_store
+from sensor_buffer import SensorBuffer  # Leituras em colunas, atualizadas de forma incremental.
+# Redução de pontos (LTTB/min-max) e escolha da resolução dos agregados por período.
+from downsampling import choose_resolution, downsample, RAW, DOWNSAMPLED, DOWNSAMPLING_METHODS
+from rollups import ROLLUP_RESOLUTIONS
+# Notificações de novos resultados publicados pelo data_processor.py.
+from change_notifier import ChangeNotifier, start_mqtt_listener, start_file_watcher, start_buffer_refresher
+# Histórico versionado dos resultados das análises (último resultado e risco ao longo do tempo).
+from results_store import ResultStore, RESULTS_DB_NAME, RISK_LEVELS, risk_level_value
+# Mensagens de alerta por perigo e nível, as mesmas usadas pelo data_processor.py.
+from alerts import alert_template
+from dotenv import load_dotenv
+
+load_dotenv()
+
+log = logging.getLogger(__name__)
 
 # --- Caminhos dos Arquivos de Dados ---
 # Estes são os mesmos arquivos que o data_processor.py gera.
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-ALL_SENSOR_DATA_FILE = os.path.join(BASE_DIR, '..', 'r_analysis', 'temp_data', 'all_sensor_data.json')
-FLOOD_RISK_OUTPUT_R = os.path.join(BASE_DIR, '..', 'r_analysis', 'temp_data', 'flood_risk_output.json')
-FIRE_RISK_OUTPUT_R = os.path.join(BASE_DIR, '..', 'r_analysis', 'temp_data', 'fire_risk_output.json')
+TEMP_DATA_DIR = os.getenv("TEMP_DATA_DIR", os.path.join(BASE_DIR, '..', 'r_analysis', 'temp_data'))
+ALL_SENSOR_DATA_FILE = os.path.join(TEMP_DATA_DIR, 'all_sensor_data.json')
+SENSOR_STORE_DIR = os.path.join(TEMP_DATA_DIR, 'sensor_store')
+SENSOR_STORE_BACKEND = os.getenv("SENSOR_STORE_BACKEND", "sqlite")
+# Mesmas configurações de retenção e do arquivo frio do data_processor.py.
+SENSOR_ARCHIVE_DIR = os.getenv("SENSOR_ARCHIVE_DIR", os.path.join(TEMP_DATA_DIR, 'sensor_archive'))
+SENSOR_ARCHIVE_FORMAT = os.getenv("SENSOR_ARCHIVE_FORMAT", "parquet")
+SENSOR_RAW_RETENTION_DAYS = int(os.getenv("SENSOR_RAW_RETENTION_DAYS", "30"))
+
+# --- Campos Exibidos em Cada Seção ---
+FLOOD_FIELDS = ['water_level', 'rainfall_intensity']
+FIRE_FIELDS = ['temperature', 'humidity', 'smoke_concentration']
+FLOOD_RISK_OUTPUT_R = os.path.join(TEMP_DATA_DIR, 'flood_risk_output.json')
+FIRE_RISK_OUTPUT_R = os.path.join(TEMP_DATA_DIR, 'fire_risk_output.json')
+RESULTS_DB = os.path.join(TEMP_DATA_DIR, RESULTS_DB_NAME)
+
+# --- Gráficos ---
+# DASHBOARD_CHART_POINTS: máximo de pontos por gráfico (~ largura do gráfico em pixels).
+# DASHBOARD_DOWNSAMPLING: "lttb" (formato da curva) ou "minmax" (preserva picos).
+CHART_POINTS = int(os.getenv("DASHBOARD_CHART_POINTS", "800"))
+DOWNSAMPLING_METHOD = os.getenv("DASHBOARD_DOWNSAMPLING", "lttb").lower()
+if DOWNSAMPLING_METHOD not in DOWNSAMPLING_METHODS:
+    DOWNSAMPLING_METHOD = "lttb"
+TIME_RANGES = {
+    "Última hora": timedelta(hours=1),
+    "Últimas 6 horas": timedelta(hours=6),
+    "Últimas 24 horas": timedelta(hours=24),
+    "Últimos 7 dias": timedelta(days=7),
+    "Todo o histórico": None,
+}
+RESOLUTION_LABELS = {60: "1 min", 900: "15 min", 3600: "1 h"}
+
+# --- Atualização dos Painéis ---
+# DASHBOARD_REFRESH_SECONDS: intervalo da busca de leituras novas (uma thread para todas as sessões)
+#                            e da execução de cada painel (fragmento) de cada sessão.
+# DASHBOARD_CHANGE_SOURCE: "mqtt" (resultados publicados pelo data_processor) ou "files".
+DASHBOARD_REFRESH_SECONDS = float(os.getenv("DASHBOARD_REFRESH_SECONDS", "2"))
+DASHBOARD_CHANGE_SOURCE = os.getenv("DASHBOARD_CHANGE_SOURCE", "mqtt").lower()
+MQTT_BROKER_HOST = os.getenv("MQTT_BROKER", "broker.hivemq.com")
+MQTT_BROKER_PORT = int(os.getenv("MQTT_PORT", "1883"))
+MQTT_RESULTS_TOPIC = os.getenv("MQTT_RESULTS_TOPIC", "guardiao_natural/risk")
 
 
 # --- Configuração da Página do Streamlit ---
@@ -25,192 +81,395 @@ st.title("🌎 Guardião Natural - Monitoramento e Prevenção de Desastres")
 st.markdown(
     "Dashboard interativo para visualização de dados de sensores e alertas de risco.")
 
-# --- Função para Carregar Dados JSON de Forma Segura ---
+# --- Acesso ao Armazenamento de Leituras ---
 
 
-# Cache os dados por 1 segundo para evitar leituras excessivas (melhora performance).
-@st.cache_data(ttl=1)
-def load_json_data(filepath):
-    """Carrega dados de um arquivo JSON, retornando uma lista vazia se o arquivo não existir."""
-    if not os.path.exists(filepath):
-        return []
-    try:
-        with open(filepath, 'r') as f:
-            data = json.load(f)
-            return data
-    except json.JSONDecodeError:
-        st.warning(
-            f"Erro ao decodificar JSON em {filepath}. O arquivo pode estar vazio ou corrompido.")
-        return []
-    except Exception as e:
-        st.error(f"Erro ao carregar {filepath}: {e}")
-        return []
-
-# --- Função para Carregar o Último Alerta de Risco ---
+# Uma única conexão com o armazenamento é compartilhada por todas as sessões.
+@st.cache_resource
+def get_sensor_store():
+    """Abre o armazenamento de leituras com o arquivo frio (migrando o JSON legado, se necessário)."""
+    return open_tiered_store(SENSOR_STORE_BACKEND, SENSOR_STORE_DIR, SENSOR_ARCHIVE_DIR,
+                             SENSOR_ARCHIVE_FORMAT, legacy_file=ALL_SENSOR_DATA_FILE)
 
 
-@st.cache_data(ttl=1)  # Cache também para os alertas de risco.
-def load_latest_risk_alert(filepath):
-    """Carrega o último objeto de risco de um arquivo JSON."""
-    if not os.path.exists(filepath):
-        return {}
+# Um buffer colunar por seção, também compartilhado por todas as sessões. As leituras novas
+# são acrescentadas por uma única thread (ver get_change_notifier), não a cada redesenho.
+# O buffer guarda só a janela do armazenamento ativo (SENSOR_RAW_RETENTION_DAYS); períodos
+# mais antigos vêm do arquivo frio (ver archived_window).
+@st.cache_resource
+def get_sensor_buffer(fields):
+    max_age = timedelta(days=SENSOR_RAW_RETENTION_DAYS) if SENSOR_RAW_RETENTION_DAYS else None
+    sensor_buffer = SensorBuffer(get_sensor_store(), fields, max_age=max_age)
     try:
-        with open(filepath, 'r') as f:
-            data = json.load(f)
-            return data
-    except json.JSONDecodeError:
-        # Retorna vazio se o arquivo não for um JSON válido (ex: vazio)
-        return {}
+        sensor_buffer.refresh()
+    except Exception:
+        log.exception("Erro ao carregar as leituras dos sensores.")
+    return sensor_buffer
+
+
+def load_sensor_frame(fields):
+    """
+    Leituras do buffer (já limpas e ordenadas por timestamp) e o número de sequência do buffer,
+    que muda a cada leitura acrescentada: (DataFrame, sequência).
+    """
+    sensor_buffer = get_sensor_buffer(fields)
+    sequence = sensor_buffer.sequence  # Lida antes do frame: o frame nunca é mais antigo que ela.
+    return sensor_buffer.frame(), sequence
+
+
+def archived_count(df, field, since):
+    """
+    Leituras do período que só existem no arquivo frio (anteriores à primeira leitura do buffer),
+    contadas pelos agregados de 1 h, sem abrir os arquivos: (quantidade, início do período).
+    Retorna (0, None) se o arquivo frio não tem leituras no período.
+    """
+    days = get_sensor_store().archive.day_range()
+    first_buffered = pd.Timestamp(df['timestamp'].iloc[0]).to_pydatetime()
+    if days is None or days[0] > first_buffered.date().isoformat():
+        return 0, None
+    if since is not None and since.date().isoformat() > days[1]:
+        return 0, None
+    hourly = [row for row in get_sensor_store().rollups(field, max(ROLLUP_RESOLUTIONS), since=since)
+              if pd.Timestamp(row['timestamp']).to_pydatetime() < first_buffered]
+    if not hourly:
+        return 0, None
+    start = pd.Timestamp(hourly[0]['timestamp']).to_pydatetime()
+    return sum(row['count'] for row in hourly), max(start, since) if since else start
+
+
+def stored_window(field, since):
+    """Leituras brutas do período lidas do armazenamento em camadas (ativo + arquivo frio)."""
+    window = pd.DataFrame(get_sensor_store().query(since=since, fields=(field,)), columns=['timestamp', field])
+    window['timestamp'] = pd.to_datetime(window['timestamp'], format='ISO8601', errors='coerce')
+    window[field] = pd.to_numeric(window[field], errors='coerce')
+    return window.dropna().sort_values('timestamp', kind='stable').reset_index(drop=True)
+
+
+def chart_series(df, field, time_range):
+    """
+    Série de um gráfico com no máximo CHART_POINTS pontos para o período escolhido.
+    Usa as leituras brutas quando cabem, reduzidas (LTTB/min-max) quando são poucas vezes
+    mais que o limite, ou os agregados do armazenamento (média com faixa mín./máx.)
+    na resolução que cabe no gráfico. Retorna (DataFrame, descrição da resolução).
+    """
+    timestamps = df['timestamp'].to_numpy()
+    if not len(timestamps):
+        return df, ""
+    since = None
+    if time_range is not None:
+        since = pd.Timestamp(timestamps[-1]).to_pydatetime() - time_range
+        window = df.iloc[int(np.searchsorted(timestamps, np.datetime64(since))):]
+    else:
+        window = df
+    span_start = window['timestamp'].iloc[0] if not window.empty else None
+
+    # O buffer só guarda a janela do armazenamento ativo: se o período começa antes dela,
+    # as leituras mais antigas estão no arquivo frio (SENSOR_RAW_RETENTION_DAYS).
+    archived = 0
+    if since is None or np.datetime64(since) < timestamps[0]:
+        archived, archive_start = archived_count(df, field, since)
+        if archived:
+            span_start = pd.Timestamp(archive_start)
+    if window.empty and not archived:
+        return window, ""
+
+    span = (pd.Timestamp(timestamps[-1]) - span_start).total_seconds()
+    choice = choose_resolution(span, len(window) + archived, ROLLUP_RESOLUTIONS, CHART_POINTS)
+    if archived and choice in (RAW, DOWNSAMPLED):
+        window = stored_window(field, since)   # Poucas leituras: cabem no gráfico mesmo lidas do arquivo.
+    if choice == RAW:
+        return window, "leituras brutas"
+    if choice == DOWNSAMPLED:
+        selected = downsample(window['timestamp'].to_numpy(), window[field].to_numpy(),
+                              CHART_POINTS, DOWNSAMPLING_METHOD)
+        return window.iloc[selected], f"{len(selected)} de {len(window)} leituras ({DOWNSAMPLING_METHOD})"
+
+    # Os agregados continuam no armazenamento ativo também para os dias cujas leituras
+    # brutas já foram movidas para o arquivo frio (SENSOR_RAW_RETENTION_DAYS).
+    rows = get_sensor_store().rollups(field, choice, since=since)
+    series = pd.DataFrame(rows, columns=['timestamp', 'count', 'mean', 'min', 'max'])
+    series['timestamp'] = pd.to_datetime(series['timestamp'])
+    series = series.rename(columns={'mean': field})
+    description = f"média por {RESOLUTION_LABELS.get(choice, f'{choice} s')} (faixa: mín./máx.)"
+    if len(series) > CHART_POINTS:
+        selected = downsample(series['timestamp'].to_numpy(), series[field].to_numpy(),
+                              CHART_POINTS, DOWNSAMPLING_METHOD)
+        description += f", {len(selected)} de {len(series)} intervalos ({DOWNSAMPLING_METHOD})"
+        series = series.iloc[selected]
+    return series, description
+
+
+def chart_figure(df, field, title, time_range):
+    """
+    Gráfico de linha do campo com a série reduzida; agregados mostram a faixa mín./máx.
+    Retorna (figura, descrição da resolução) ou None se não houver pontos suficientes.
+    """
+    series, resolution = chart_series(df, field, time_range)
+    if len(series) < 2:  # Precisa de pelo menos 2 pontos para gráfico de linha
+        return None
+    fig = px.line(series, x='timestamp', y=field, title=title)
+    if 'min' in series:
+        fig.add_scatter(x=series['timestamp'], y=series['max'], mode='lines', line_width=0,
+                        showlegend=False, hoverinfo='skip')
+        fig.add_scatter(x=series['timestamp'], y=series['min'], mode='lines', line_width=0,
+                        fill='tonexty', fillcolor='rgba(99, 110, 250, 0.2)',
+                        showlegend=False, hoverinfo='skip')
+    return fig, resolution
+
+
+def show_chart(figure):
+    """Exibe um gráfico montado por chart_figure (já calculado em um redesenho anterior)."""
+    if figure is None:
+        return
+    fig, resolution = figure
+    st.plotly_chart(fig, use_container_width=True)
+    st.caption(f"Resolução: {resolution}")
+
+# --- Resultados das Análises de Risco ---
+
+
+# Histórico dos resultados gravado pelo data_processor, compartilhado por todas as sessões.
+@st.cache_resource
+def get_result_store():
+    return ResultStore(RESULTS_DB)
+
+
+# A versão do canal faz parte da chave do cache: o histórico só é consultado de novo
+# quando o notificador indica que o data_processor publicou um novo resultado.
+@st.cache_data(max_entries=8)
+def load_latest_risk(analysis, version=0):
+    """Último resultado da análise gravado no histórico de resultados ({} se ainda não houver)."""
+    try:
+        return get_result_store().latest(analysis) or {}
     except Exception as e:
-        st.error(f"Erro ao carregar alerta de risco de {filepath}: {e}")
+        st.error(f"Erro ao carregar o último resultado da análise '{analysis}': {e}")
         return {}
 
 
-# --- Layout do Dashboard ---
-# Usamos colunas para organizar o conteúdo visualmente.
-col1, col2 = st.columns(2)
-
-# --- Seção de Enchentes ---
-with col1:
-    st.header("💧 Monitoramento de Enchentes")
-    # Carrega todos os dados dos sensores e filtra para enchentes
-    all_sensor_data = load_json_data(ALL_SENSOR_DATA_FILE)
-    df_flood_raw = pd.DataFrame(all_sensor_data)
-
-    if not df_flood_raw.empty:
-        # Garante que as colunas existam e não são nulas
-        df_flood = df_flood_raw[['timestamp',
-                                 'water_level', 'rainfall_intensity']].copy()
-        df_flood['timestamp'] = pd.to_datetime(df_flood['timestamp'])
-        df_flood = df_flood.dropna()  # Remove linhas com NaN nas colunas relevantes
-        df_flood = df_flood.sort_values(
-            'timestamp', ascending=True)  # Ordena por timestamp
-
+def risk_history_figure(analysis, title, time_range):
+    """Gráfico do nível de risco calculado ao longo do tempo, uma linha por dispositivo."""
+    since = datetime.now() - time_range if time_range is not None else None
+    history = pd.DataFrame(get_result_store().history(analysis, since=since),
+                           columns=['timestamp_analysis', 'device_id', 'risk_level'])
+    history['nivel'] = history['risk_level'].map(risk_level_value)
+    history = history.dropna(subset=['nivel'])
+    if len(history) < 2:
+        return None
+    history['timestamp_analysis'] = pd.to_datetime(history['timestamp_analysis'], format='ISO8601')
+    fig = px.line(history, x='timestamp_analysis', y='nivel', color='device_id', line_shape='hv',
+                  title=title, labels={'timestamp_analysis': 'timestamp', 'nivel': 'risco',
+                                       'device_id': 'dispositivo'})
+    fig.update_yaxes(tickvals=list(range(len(RISK_LEVELS))), ticktext=list(RISK_LEVELS),
+                     range=[-0.3, len(RISK_LEVELS) - 0.7])
+    return fig, f"todas as {len(history)} análises do período"
+
+
+# --- Notificação de Mudanças ---
+
+
+# Um único notificador (e uma única conexão MQTT) para todas as sessões.
+@st.cache_resource
+def get_change_notifier():
+    """
+    Recebe os resultados publicados pelo data_processor em MQTT_RESULTS_TOPIC; se o broker
+    não estiver acessível (ou DASHBOARD_CHANGE_SOURCE=files), observa os arquivos de risco.
+    Também inicia a thread que acrescenta as leituras novas aos buffers (canais "<seção>_readings").
+    """
+    notifier = ChangeNotifier()
+    start_buffer_refresher(notifier, {"flood_readings": get_sensor_buffer(tuple(FLOOD_FIELDS)),
+                                      "fire_readings": get_sensor_buffer(tuple(FIRE_FIELDS))},
+                           DASHBOARD_REFRESH_SECONDS)
+    if DASHBOARD_CHANGE_SOURCE == "mqtt":
+        try:
+            start_mqtt_listener(notifier, MQTT_BROKER_HOST, MQTT_BROKER_PORT, MQTT_RESULTS_TOPIC,
+                                client_id=f"guardiao-dashboard-{uuid.uuid4().hex[:8]}")
+            return notifier
+        except Exception as e:
+            log.warning("Broker MQTT indisponível para o dashboard (%s); observando os arquivos de risco.", e)
+    start_file_watcher(notifier, {"flood": [FLOOD_RISK_OUTPUT_R], "fire": [FIRE_RISK_OUTPUT_R]})
+    return notifier
+
+
+def latest_risk(analysis):
+    """Último resultado da análise: o recebido por MQTT ou, sem ele, o do histórico de resultados."""
+    notifier = get_change_notifier()
+    return notifier.latest_result(analysis) or load_latest_risk(analysis, notifier.version(analysis))
+
+
+def section_changed(key, token):
+    """True quando o painel `key` precisa ser refeito (o token mudou desde o último desenho)."""
+    if st.session_state.get(key) == token:
+        return False
+    st.session_state[key] = token
+    return True
+
+
+def rerun_if_moved(channel, drawn_version):
+    """
+    Redesenha só o fragmento atual, sem esperar o próximo intervalo, se o canal dele mudou
+    enquanto era desenhado. Numa execução completa da página o Streamlit não permite o rerun
+    de um fragmento: a novidade fica para o próximo intervalo.
+    """
+    if st.session_state.get("page_running"):
+        return
+    if get_change_notifier().version(channel) != drawn_version:
+        st.rerun(scope="fragment")
+
+
+# --- Painéis ---
+# Cada painel é um fragmento independente: a cada DASHBOARD_REFRESH_SECONDS o Streamlit executa
+# de novo só aquele fragmento, que verifica apenas o próprio canal do notificador. Consultas e
+# gráficos só são refeitos quando o canal mudou; nos demais intervalos o painel reexibe o que já
+# calculou (mensagens grandes idênticas, como os gráficos, vão ao navegador só como referência).
+
+
+@st.fragment(run_every=DASHBOARD_REFRESH_SECONDS)
+def flood_readings_panel():
+    version = get_change_notifier().version("flood_readings")
+    # Colunas de enchente (sem nulos e em ordem cronológica) vindas do buffer compartilhado
+    df_flood, sequence = load_sensor_frame(tuple(FLOOD_FIELDS))
+    time_range = TIME_RANGES[st.session_state.time_range_label]
+    if section_changed("flood_readings", (sequence, st.session_state.time_range_label)):
+        st.session_state.flood_charts = {
+            field: chart_figure(df_flood, field, title, time_range)
+            for field, title in (('water_level', 'Histórico do Nível da Água (%)'),
+                                 ('rainfall_intensity', 'Histórico da Intensidade da Chuva (%)'))}
+
+    if not df_flood.empty:
         # Exibe os últimos valores
         latest_flood_data = df_flood.tail(1)
-        if not latest_flood_data.empty:
-            st.metric(label="Nível da Água Atual",
-                      value=f"{latest_flood_data['water_level'].iloc[0]:.0f}%")
-            st.metric(label="Intensidade da Chuva Atual",
-                      value=f"{latest_flood_data['rainfall_intensity'].iloc[0]:.0f}%")
-
-        # Gráfico de Nível da Água ao longo do tempo
-        # Precisa de pelo menos 2 pontos para gráfico de linha
-        if len(df_flood['water_level']) > 1:
-            fig_water_level = px.line(
-                df_flood, x='timestamp', y='water_level', title='Histórico do Nível da Água (%)')
-            st.plotly_chart(fig_water_level, use_container_width=True)
-
-        # Gráfico de Intensidade da Chuva ao longo do tempo
-        if len(df_flood['rainfall_intensity']) > 1:
-            fig_rainfall = px.line(df_flood, x='timestamp', y='rainfall_intensity',
-                                   title='Histórico da Intensidade da Chuva (%)')
-            st.plotly_chart(fig_rainfall, use_container_width=True)
+        st.metric(label="Nível da Água Atual",
+                  value=f"{latest_flood_data['water_level'].iloc[0]:.0f}%")
+        st.metric(label="Intensidade da Chuva Atual",
+                  value=f"{latest_flood_data['rainfall_intensity'].iloc[0]:.0f}%")
+
+        # Gráficos de Nível da Água e de Intensidade da Chuva ao longo do tempo
+        for figure in st.session_state.flood_charts.values():
+            show_chart(figure)
     else:
         st.info("Aguardando dados de enchentes do sensor...")
+    rerun_if_moved("flood_readings", version)
 
+
+@st.fragment(run_every=DASHBOARD_REFRESH_SECONDS)
+def flood_alert_panel():
     # --- Alerta de Risco de Enchente (do R e LM) ---
+    version = get_change_notifier().version("flood")
     st.subheader("⚠️ Alerta de Risco de Enchente")
-    flood_risk_data = load_latest_risk_alert(FLOOD_RISK_OUTPUT_R)
+    flood_risk_data = latest_risk("flood")
 
     if flood_risk_data:
         risk_level = flood_risk_data.get("risk_level", "Desconhecido")
         pred_water = flood_risk_data.get("predicted_water_level", "N/A")
         pred_rainfall = flood_risk_data.get("predicted_rainfall", "N/A")
         analysis_time = flood_risk_data.get("timestamp_analysis", "N/A")
+        device = flood_risk_data.get("device_id")
 
         st.write(f"**Nível de Risco Calculado:** **{risk_level}**")
         st.write(f"Previsão Nível Água: {pred_water}%")
         st.write(f"Previsão Chuva: {pred_rainfall}%")
-        st.caption(f"Última análise: {analysis_time}")
-
-        # O dashboard pode exibir uma mensagem de alerta do LM
-    
-        if risk_level == "Muito Alto":
-            st.error(
-                "🚨 ALERTA MÁXIMO! Risco de enchente iminente. Busque abrigo seguro imediatamente!")
-        elif risk_level == "Alto":
-            st.warning(
-                "🟠 ALERTA: Risco ALTO de enchente. Prepare-se para evacuação e monitore a situação.")
-        elif risk_level == "Moderado":
-            st.info(
-                "🟡 Atenção: Risco MODERADO de enchente. Monitore o nível da água e as condições climáticas.")
-        else:
-            st.success("🟢 Risco de enchente: Baixo. Situação sob controle.")
+        st.caption(f"Última análise: {analysis_time}" + (f" (dispositivo {device})" if device else ""))
+
+        template = alert_template("flood", risk_level)
+        getattr(st, template.severity)(template.message)
     else:
         st.info("Aguardando resultados da análise de risco de enchente (Python/R)...")
+    rerun_if_moved("flood", version)
 
-# --- Seção de Incêndios ---
-with col2:
-    st.header("🔥 Monitoramento de Incêndios")
-    df_fire_raw = pd.DataFrame(all_sensor_data)
 
-    if not df_fire_raw.empty:
-        df_fire = df_fire_raw[['timestamp', 'temperature',
-                               'humidity', 'smoke_concentration']].copy()
-        df_fire['timestamp'] = pd.to_datetime(df_fire['timestamp'])
-        df_fire = df_fire.dropna()
-        df_fire = df_fire.sort_values('timestamp', ascending=True)
+@st.fragment(run_every=DASHBOARD_REFRESH_SECONDS)
+def fire_readings_panel():
+    version = get_change_notifier().version("fire_readings")
+    df_fire, sequence = load_sensor_frame(tuple(FIRE_FIELDS))
+    time_range = TIME_RANGES[st.session_state.time_range_label]
+    if section_changed("fire_readings", (sequence, st.session_state.time_range_label)):
+        st.session_state.fire_charts = {
+            field: chart_figure(df_fire, field, title, time_range)
+            for field, title in (('temperature', 'Histórico da Temperatura (°C)'),
+                                 ('smoke_concentration', 'Histórico da Concentração de Fumaça (%)'))}
 
+    if not df_fire.empty:
         # Exibe os últimos valores
         latest_fire_data = df_fire.tail(1)
-        if not latest_fire_data.empty:
-            st.metric(label="Temperatura Atual",
-                      value=f"{latest_fire_data['temperature'].iloc[0]:.1f}°C")
-            st.metric(label="Umidade Atual",
-                      value=f"{latest_fire_data['humidity'].iloc[0]:.0f}%")
-            st.metric(label="Fumaça Atual",
-                      value=f"{latest_fire_data['smoke_concentration'].iloc[0]:.0f}%")
-
-        # Gráfico de Temperatura
-        if len(df_fire['temperature']) > 1:
-            fig_temp = px.line(
-                df_fire, x='timestamp', y='temperature', title='Histórico da Temperatura (°C)')
-            st.plotly_chart(fig_temp, use_container_width=True)
-
-        # Gráfico de Fumaça
-        if len(df_fire['smoke_concentration']) > 1:
-            fig_smoke = px.line(df_fire, x='timestamp', y='smoke_concentration',
-                                title='Histórico da Concentração de Fumaça (%)')
-            st.plotly_chart(fig_smoke, use_container_width=True)
+        st.metric(label="Temperatura Atual",
+                  value=f"{latest_fire_data['temperature'].iloc[0]:.1f}°C")
+        st.metric(label="Umidade Atual",
+                  value=f"{latest_fire_data['humidity'].iloc[0]:.0f}%")
+        st.metric(label="Fumaça Atual",
+                  value=f"{latest_fire_data['smoke_concentration'].iloc[0]:.0f}%")
+
+        # Gráficos de Temperatura e de Fumaça
+        for figure in st.session_state.fire_charts.values():
+            show_chart(figure)
     else:
         st.info("Aguardando dados de incêndio do sensor...")
+    rerun_if_moved("fire_readings", version)
 
+
+@st.fragment(run_every=DASHBOARD_REFRESH_SECONDS)
+def fire_alert_panel():
     # --- Alerta de Risco de Incêndio (do R e LM) ---
+    version = get_change_notifier().version("fire")
     st.subheader("🔥 Alerta de Risco de Incêndio")
-    fire_risk_data = load_latest_risk_alert(FIRE_RISK_OUTPUT_R)
+    fire_risk_data = latest_risk("fire")
 
     if fire_risk_data:
         risk_level = fire_risk_data.get("risk_level", "Desconhecido")
         pred_temp = fire_risk_data.get("predicted_temperature", "N/A")
         pred_smoke = fire_risk_data.get("predicted_smoke", "N/A")
         analysis_time = fire_risk_data.get("timestamp_analysis", "N/A")
+        device = fire_risk_data.get("device_id")
 
         st.write(f"**Nível de Risco Calculado:** **{risk_level}**")
         st.write(f"Previsão Temperatura: {pred_temp}°C")
         st.write(f"Previsão Fumaça: {pred_smoke}%")
-        st.caption(f"Última análise: {analysis_time}")
-
-        if risk_level == "Muito Alto":
-            st.error(
-                "🚨 ALERTA MÁXIMO! Risco de incêndio iminente. Evacue a área e chame os bombeiros!")
-        elif risk_level == "Alto":
-            st.warning(
-                "🟠 ALERTA: Risco ALTO de incêndio. Fique atento a sinais de fumaça e prepare-se.")
-        elif risk_level == "Moderado":
-            st.info(
-                "🟡 Atenção: Risco MODERADO de incêndio. Evite atividades com fogo e monitore a umidade.")
-        else:
-            st.success("🟢 Risco de incêndio: Baixo. Situação sob controle.")
+        st.caption(f"Última análise: {analysis_time}" + (f" (dispositivo {device})" if device else ""))
+
+        template = alert_template("fire", risk_level)
+        getattr(st, template.severity)(template.message)
     else:
         st.info("Aguardando resultados da análise de risco de incêndio (Python/R)...")
+    rerun_if_moved("fire", version)
 
 
-# --- Atualização Automática ---
-UPDATE_INTERVAL_SECONDS = 5  # Atualiza o dashboard a cada 5 segundos.
+@st.fragment(run_every=DASHBOARD_REFRESH_SECONDS)
+def risk_history_chart(analysis, title):
+    """Histórico do risco; o gráfico só é refeito quando chega um novo resultado da análise."""
+    version = get_change_notifier().version(analysis)
+    if section_changed(f"{analysis}_history", (version, st.session_state.time_range_label)):
+        st.session_state[f"{analysis}_history_chart"] = risk_history_figure(
+            analysis, title, TIME_RANGES[st.session_state.time_range_label])
+    show_chart(st.session_state[f"{analysis}_history_chart"])
+    rerun_if_moved(analysis, version)
+
+
+# --- Layout do Dashboard ---
+# Período exibido nos gráficos (a resolução é escolhida automaticamente).
+st.sidebar.selectbox("Período dos gráficos", list(TIME_RANGES), index=2, key="time_range_label")
+
+# Durante a execução completa os fragmentos não podem pedir o próprio rerun (ver rerun_if_moved).
+st.session_state.page_running = True
+
+# Usamos colunas para organizar o conteúdo visualmente.
+col1, col2 = st.columns(2)
 
+# --- Seção de Enchentes ---
+with col1:
+    st.header("💧 Monitoramento de Enchentes")
+    flood_readings_panel()
+    flood_alert_panel()
+    risk_history_chart("flood", "Histórico do Risco de Enchente")
+
+# --- Seção de Incêndios ---
+with col2:
+    st.header("🔥 Monitoramento de Incêndios")
+    fire_readings_panel()
+    fire_alert_panel()
+    risk_history_chart("fire", "Histórico do Risco de Incêndio")
+
+
+# --- Atualização Automática ---
 st.markdown("---")
-st.write(f"Dashboard atualizando a cada {UPDATE_INTERVAL_SECONDS} segundos...")
-# Placeholder que mantém a página atualizada
-time.sleep(UPDATE_INTERVAL_SECONDS)
-st.rerun()  # Força o Streamlit a reexecutar o script
+st.write(f"Cada painel é atualizado sozinho a cada {DASHBOARD_REFRESH_SECONDS:g} s e só refaz consultas e "
+         f"gráficos quando chegam novas leituras ou resultados (fonte dos resultados: {get_change_notifier().source}).")
+st.session_state.page_running = False
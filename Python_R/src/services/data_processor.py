@@ -10,286 +10,592 @@ import pandas as pd
 import subprocess
 # Importa os para interagir com o sistema operacional (caminhos de arquivo, variáveis de ambiente).
 import os
+# Logs com nível (DEBUG/INFO/WARNING/ERROR) no lugar dos print().
+import logging
 # Importa datetime para trabalhar com datas e horas.
 from datetime import datetime
+# Importa socket e zlib para identificar a instância e distribuir os dispositivos entre instâncias.
+import socket
+import zlib
+# Armazenamento append-only das leituras (SQLite em modo WAL ou JSON Lines segmentado).
+from sensor_store import device_partition, normalize_reading
+# Camadas de retenção: arquivo frio das leituras antigas e compactação em segundo plano.
+from sensor_archive import open_tiered_store
+from retention import Compactor, parse_rollup_retention
+# Pool de workers R persistentes (modelos treinados uma única vez).
+from r_worker import RWorkerPool, RWorkerError, RWorkerTimeout
+# Motor de análise equivalente em Python/NumPy (dispensa o Rscript).
+from risk_engine import RiskEngine
+# Features dos modelos calculadas de forma incremental (janelas móveis por dispositivo).
+from feature_store import FeatureStore
+# Previsões incrementais por dispositivo e variável (alternativa ao auto.arima a cada análise).
+from forecaster import ForecastStore
+# Fila limitada + pool de threads entre a ingestão MQTT e as análises.
+from pipeline import AnalysisPipeline
+# Coalescência das leituras: limita a frequência de análises por dispositivo.
+from analysis_scheduler import AnalysisScheduler
+# Percentis de latência por etapa (ingestão, gravação, análise, alerta).
+from latency import LatencyRecorder
+# Histórico versionado dos resultados (seq) e gravação atômica dos arquivos de risco.
+from results_store import ResultStore, RESULTS_DB_NAME, write_json_atomic
+# Logs estruturados, métricas no formato Prometheus e profiler por amostragem.
+from logging_setup import configure_logging
+from metrics import MetricsRegistry, start_metrics_server
+from profiler import SamplingProfiler
+# Alertas: templates compartilhados com o dashboard, deduplicação e envio em lotes com cache.
+from alerts import (AlertDeduplicator, AlertDispatcher, AlertRequest, HAZARD_LABELS, alert_inputs,
+                    create_backend)
+
+# --- Chave da API do LM (SIMULADA) ---
+# Mantemos o load_dotenv() caso outras variáveis de ambiente sejam adicionadas no futuro.
+# Ele é chamado antes das configurações abaixo, que podem ser sobrescritas pelo .env.
+load_dotenv()
+
+# --- Logs ---
+# LOG_LEVEL: DEBUG, INFO (padrão), WARNING ou ERROR. O payload de cada mensagem e a saída dos
+# scripts R só são registrados em DEBUG (imprimi-los a cada mensagem custa tempo sob carga).
+# LOG_FORMAT: "text" (padrão) ou "json" (uma linha JSON por evento, para coletores de log).
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+configure_logging(LOG_LEVEL, LOG_FORMAT)
+log = logging.getLogger("data_processor")
 
 # --- Configurações MQTT ---
-MQTT_BROKER_HOST = "broker.hivemq.com"
-MQTT_BROKER_PORT = 1883
-MQTT_TOPIC_ALL_DATA = "guardiao_natural/sensor_data"
+MQTT_BROKER_HOST = os.getenv("MQTT_BROKER", "broker.hivemq.com")
+MQTT_BROKER_PORT = int(os.getenv("MQTT_PORT", "1883"))
+MQTT_TOPIC_ALL_DATA = os.getenv("MQTT_TOPIC", "guardiao_natural/sensor_data")
+# Resultados das análises, publicados por dispositivo em <MQTT_RESULTS_TOPIC>/<dispositivo>/<análise>.
+MQTT_RESULTS_TOPIC = os.getenv("MQTT_RESULTS_TOPIC", "guardiao_natural/risk")
+
+# --- Escalabilidade Horizontal (várias instâncias do data_processor) ---
+# MQTT_SHARED_GROUP: assina o tópico como "$share/<grupo>/<tópico>"; o broker distribui as
+# mensagens entre as instâncias do grupo (balanceamento de carga).
+# PROCESSOR_SHARD_COUNT/PROCESSOR_SHARD_INDEX: particionamento fixo por dispositivo; cada
+# instância processa apenas os dispositivos cujo hash cai no seu índice (afinidade de dispositivo,
+# necessária para MODEL_FEATURES=rolling). Não combine os dois modos.
+MQTT_SHARED_GROUP = os.getenv("MQTT_SHARED_GROUP", "")
+PROCESSOR_SHARD_COUNT = int(os.getenv("PROCESSOR_SHARD_COUNT", "1"))
+PROCESSOR_SHARD_INDEX = int(os.getenv("PROCESSOR_SHARD_INDEX", "0"))
+PROCESSOR_ID = os.getenv("PROCESSOR_ID", f"{socket.gethostname()}-{os.getpid()}")
+MQTT_SUBSCRIPTION = (f"$share/{MQTT_SHARED_GROUP}/{MQTT_TOPIC_ALL_DATA}"
+                     if MQTT_SHARED_GROUP else MQTT_TOPIC_ALL_DATA)
+if MQTT_SHARED_GROUP and PROCESSOR_SHARD_COUNT > 1:
+    log.warning("MQTT_SHARED_GROUP e PROCESSOR_SHARD_COUNT ativos ao mesmo tempo; "
+                "leituras de dispositivos de outras partições serão ignoradas por esta instância.")
 
 # --- Caminhos dos Arquivos de Dados (simulação de Banco de Dados) ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-ALL_SENSOR_DATA_FILE = os.path.join(BASE_DIR, '..', 'r_analysis', 'temp_data', 'all_sensor_data.json')
+# TEMP_DATA_DIR: pasta dos dados gerados (leituras, arquivos de troca com o R e resultados).
+# Permite rodar instâncias isoladas, ex.: no teste de carga (loadtest/).
+TEMP_DATA_DIR = os.getenv("TEMP_DATA_DIR", os.path.join(BASE_DIR, '..', 'r_analysis', 'temp_data'))
+# Arquivo legado (array JSON): migrado uma única vez para o armazenamento append-only.
+ALL_SENSOR_DATA_FILE = os.path.join(TEMP_DATA_DIR, 'all_sensor_data.json')
+SENSOR_STORE_DIR = os.path.join(TEMP_DATA_DIR, 'sensor_store')
+SENSOR_ARCHIVE_DIR = os.getenv("SENSOR_ARCHIVE_DIR", os.path.join(TEMP_DATA_DIR, 'sensor_archive'))
+
+# --- Campos Usados em Cada Análise ---
+FLOOD_FIELDS = ['water_level', 'rainfall_intensity']
+FIRE_FIELDS = ['temperature', 'humidity', 'smoke_concentration']
 
 # --- Arquivos para Integração com R ---
-FLOOD_DATA_FOR_R = os.path.join(BASE_DIR, '..', 'r_analysis', 'temp_data', 'flood_data_for_r.csv')
-FIRE_DATA_FOR_R = os.path.join(BASE_DIR, '..', 'r_analysis', 'temp_data', 'fire_data_for_r.csv')
-FLOOD_RISK_OUTPUT_R = os.path.join(BASE_DIR, '..', 'r_analysis', 'temp_data', 'flood_risk_output.json')
-FIRE_RISK_OUTPUT_R = os.path.join(BASE_DIR, '..', 'r_analysis', 'temp_data', 'fire_risk_output.json')
+FLOOD_DATA_FOR_R = os.path.join(TEMP_DATA_DIR, 'flood_data_for_r.csv')
+FIRE_DATA_FOR_R = os.path.join(TEMP_DATA_DIR, 'fire_data_for_r.csv')
+FLOOD_RISK_OUTPUT_R = os.path.join(TEMP_DATA_DIR, 'flood_risk_output.json')
+FIRE_RISK_OUTPUT_R = os.path.join(TEMP_DATA_DIR, 'fire_risk_output.json')
 FLOOD_ANALYSIS_R  = os.path.join(BASE_DIR, '..', 'r_analysis', 'flood_analysis.R')
 FIRE_ANALYSIS_R  = os.path.join(BASE_DIR, '..', 'r_analysis', 'fire_analysis.R')
-
-
-# --- Chave da API do LM (SIMULADA) ---
-# Mantemos o load_dotenv() caso outras variáveis de ambiente sejam adicionadas no futuro.
-load_dotenv()
+R_ANALYSIS_DIR = os.path.join(BASE_DIR, '..', 'r_analysis')
+R_ANALYSIS_WORKER = os.path.join(BASE_DIR, '..', 'r_analysis', 'analysis_worker.R')
+
+# --- Métricas e Profiling ---
+# METRICS_PORT: porta do endpoint HTTP local com as métricas no formato Prometheus (GET /metrics),
+# em METRICS_HOST (padrão 127.0.0.1, só a própria máquina); 0 desativa.
+# PROFILER_ENABLED: "1" habilita o profiler por amostragem sob demanda: GET /debug/profile?seconds=N
+# no mesmo endpoint ou `kill -USR1 <pid>` (captura de PROFILE_SECONDS gravada em PROFILE_DIR).
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "0") == "1"
+PROFILE_SECONDS = float(os.getenv("PROFILE_SECONDS", "10"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(TEMP_DATA_DIR, 'profiles'))
+metrics = MetricsRegistry("guardiao")
+messages_received = metrics.counter("messages_received_total", "Mensagens MQTT recebidas.")
+messages_ignored = metrics.counter(
+    "messages_ignored_total", "Mensagens de dispositivos de outra partição (PROCESSOR_SHARD_COUNT).")
+decode_errors = metrics.counter("message_decode_errors_total", "Mensagens com JSON inválido.")
+message_errors = metrics.counter("message_errors_total", "Falhas no processamento das mensagens.")
+analysis_failures = metrics.counter("analysis_failures_total", "Análises sem resultado.", ["analysis"])
+r_timeouts = metrics.counter("r_timeouts_total", "Análises R que excederam R_ANALYSIS_TIMEOUT_SECONDS "
+                             "(mode: script avulso ou worker persistente).", ["mode"])
+r_script_duration = metrics.histogram("r_script_duration_seconds",
+                                      "Duração de cada execução do Rscript avulso.", ["script"])
+alerts_emitted = metrics.counter("alerts_total", "Alertas gerados por análise e nível de risco.",
+                                 ["analysis", "risk_level"])
+
+
+# --- Armazenamento das Leituras ---
+# SENSOR_STORE_BACKEND: "sqlite" (padrão) ou "jsonl".
+SENSOR_STORE_BACKEND = os.getenv("SENSOR_STORE_BACKEND", "sqlite")
+# SENSOR_ARCHIVE_FORMAT: formato do arquivo frio, "parquet" (padrão, requer pyarrow) ou "jsonl.gz".
+SENSOR_ARCHIVE_FORMAT = os.getenv("SENSOR_ARCHIVE_FORMAT", "parquet")
+sensor_store = open_tiered_store(SENSOR_STORE_BACKEND, SENSOR_STORE_DIR, SENSOR_ARCHIVE_DIR,
+                                 SENSOR_ARCHIVE_FORMAT, legacy_file=ALL_SENSOR_DATA_FILE)
+
+# --- Retenção do Histórico de Leituras ---
+# SENSOR_RAW_RETENTION_DAYS: dias de leituras brutas no armazenamento ativo (0 = sem limite);
+# as mais antigas são movidas para o arquivo frio e continuam visíveis nas consultas.
+# SENSOR_ROLLUP_RETENTION_DAYS: retenção dos agregados por resolução, "segundos:dias,..."
+# (padrão: 1 min por 90 dias; 15 min e 1 h sem limite).
+# SENSOR_COMPACTION_INTERVAL_SECONDS: intervalo da compactação em segundo plano (0 = desativada).
+SENSOR_RAW_RETENTION_DAYS = int(os.getenv("SENSOR_RAW_RETENTION_DAYS", "30"))
+SENSOR_ROLLUP_RETENTION_DAYS = parse_rollup_retention(os.getenv("SENSOR_ROLLUP_RETENTION_DAYS", "60:90"))
+SENSOR_COMPACTION_INTERVAL_SECONDS = float(os.getenv("SENSOR_COMPACTION_INTERVAL_SECONDS", "3600"))
+compactor = None
+if SENSOR_COMPACTION_INTERVAL_SECONDS > 0:
+    compactor = Compactor(sensor_store, sensor_store.archive, SENSOR_RAW_RETENTION_DAYS,
+                          SENSOR_ROLLUP_RETENTION_DAYS, SENSOR_COMPACTION_INTERVAL_SECONDS, registry=metrics)
+
+# --- Histórico dos Resultados ---
+# RISK_HISTORY_PER_DEVICE: resultados mantidos por dispositivo e análise (0 = sem limite).
+RISK_HISTORY_PER_DEVICE = int(os.getenv("RISK_HISTORY_PER_DEVICE", "1000"))
+result_store = ResultStore(os.path.join(TEMP_DATA_DIR, RESULTS_DB_NAME), RISK_HISTORY_PER_DEVICE)
+
+# --- Cache dos Modelos Treinados ---
+# MODEL_CACHE_DIR: pasta dos artefatos dos modelos, usada pelo motor Python e pelos scripts R
+# (que herdam a variável de ambiente). MODEL_RELOAD_CHECK_SECONDS: intervalo entre verificações
+# de mudança nos datasets históricos (o modelo é treinado de novo sem reiniciar o processador).
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", os.path.join(R_ANALYSIS_DIR, 'models'))
+MODEL_RELOAD_CHECK_SECONDS = float(os.getenv("MODEL_RELOAD_CHECK_SECONDS", "5"))
+
+# --- Motor de Análise ---
+# ANALYSIS_ENGINE: "r" (padrão, scripts R) ou "python" (risk_engine.py, em processo).
+ANALYSIS_ENGINE = os.getenv("ANALYSIS_ENGINE", "r").lower()
+risk_engine = (RiskEngine(R_ANALYSIS_DIR, model_dir=MODEL_CACHE_DIR, check_interval=MODEL_RELOAD_CHECK_SECONDS)
+               if ANALYSIS_ENGINE == "python" else None)
+
+# --- Features dos Modelos ---
+# MODEL_FEATURES: "latest" (padrão, a última leitura é usada diretamente como feature, como nos
+# scripts R) ou "rolling" (médias/somas/variações em janelas móveis mantidas pelo FeatureStore).
+# Atenção: os datasets históricos usam outra escala (ex.: metros e mm) que as leituras em %.
+MODEL_FEATURES = os.getenv("MODEL_FEATURES", "latest").lower()
+feature_store = None
+if MODEL_FEATURES == "rolling":
+    feature_store = FeatureStore()
+    feature_store.warm_up(sensor_store)
+
+# --- Previsões das Séries ---
+# FORECAST_MODE: "batch" (padrão, auto.arima/forecast_next sobre a janela de leituras a cada
+# análise) ou "online" (forecaster.py: estado por dispositivo e variável atualizado em O(1) por
+# leitura; a escolha do modelo é refeita a cada FORECAST_RESELECT_EVERY leituras, sobre as
+# últimas FORECAST_SELECTION_WINDOW leituras).
+FORECAST_MODE = os.getenv("FORECAST_MODE", "batch").lower()
+FORECAST_SELECTION_WINDOW = int(os.getenv("FORECAST_SELECTION_WINDOW", "200"))
+FORECAST_RESELECT_EVERY = int(os.getenv("FORECAST_RESELECT_EVERY", "100"))
+forecast_store = None
+if FORECAST_MODE == "online":
+    forecast_store = ForecastStore(window=FORECAST_SELECTION_WINDOW, reselect_every=FORECAST_RESELECT_EVERY)
+    forecast_store.warm_up(sensor_store)
+
+# --- Janela de Dados Enviada para a Análise ---
+# ANALYSIS_WINDOW_ROWS: quantidade de leituras mais recentes usadas pela análise (previsão ARIMA
+# e classificador). Mantém o custo de leitura/exportação constante por mensagem; 0 = todo o histórico.
+ANALYSIS_WINDOW_ROWS = int(os.getenv("ANALYSIS_WINDOW_ROWS", "500"))
+# R_EXPORT_FORMAT: "csv" (padrão) ou "feather" (Arrow IPC, binário; requer pyarrow e o pacote R arrow).
+R_EXPORT_FORMAT = os.getenv("R_EXPORT_FORMAT", "csv").lower()
+if R_EXPORT_FORMAT == "feather":
+    try:
+        import pyarrow  # noqa: F401  (usado pelo pandas em DataFrame.to_feather)
+    except ImportError:
+        log.warning("pyarrow não está instalado; exportando os dados para o R em CSV.")
+        R_EXPORT_FORMAT = "csv"
+
+# --- Pipeline de Análise ---
+# ANALYSIS_QUEUE_SIZE: tamanho máximo da fila de análises pendentes.
+# ANALYSIS_WORKERS: threads que executam as análises (enchente e incêndio em paralelo).
+# ANALYSIS_QUEUE_POLICY: "coalesce" (padrão), "drop_oldest", "drop_newest" ou "block".
+ANALYSIS_QUEUE_SIZE = int(os.getenv("ANALYSIS_QUEUE_SIZE", "100"))
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+ANALYSIS_QUEUE_POLICY = os.getenv("ANALYSIS_QUEUE_POLICY", "coalesce").lower()
+
+# ANALYSIS_MIN_INTERVAL_SECONDS: intervalo mínimo entre análises do mesmo dispositivo/tipo.
+# Mudanças bruscas nas leituras disparam a análise imediatamente; 0 analisa toda leitura.
+ANALYSIS_MIN_INTERVAL_SECONDS = float(os.getenv("ANALYSIS_MIN_INTERVAL_SECONDS", "30"))
+
+# --- Workers R Persistentes ---
+# R_WORKER_POOL_SIZE: quantidade de workers R (0 volta a executar um Rscript por mensagem).
+R_WORKER_POOL_SIZE = int(os.getenv("R_WORKER_POOL_SIZE", "2"))
+R_ANALYSIS_TIMEOUT_SECONDS = int(os.getenv("R_ANALYSIS_TIMEOUT_SECONDS", "60"))
+r_worker_pool = None
+if risk_engine is None and R_WORKER_POOL_SIZE > 0:
+    try:
+        r_worker_pool = RWorkerPool(R_WORKER_POOL_SIZE, R_ANALYSIS_WORKER, R_ANALYSIS_DIR,
+                                    request_timeout=R_ANALYSIS_TIMEOUT_SECONDS)
+    except (RWorkerError, OSError) as e:
+        log.warning("Não foi possível iniciar os workers R (%s). Usando um Rscript por mensagem.", e)
+
+# --- Medição de Latência ---
+# LATENCY_REPORT_INTERVAL_SECONDS: intervalo do relatório de percentis no console (0 desativa).
+# LATENCY_STATS_FILE: arquivo JSON com o resumo dos percentis (usado por loadtest/benchmark.py).
+LATENCY_REPORT_INTERVAL_SECONDS = float(os.getenv("LATENCY_REPORT_INTERVAL_SECONDS", "60"))
+LATENCY_STATS_FILE = os.getenv("LATENCY_STATS_FILE", "")
+latency = LatencyRecorder(report_interval=LATENCY_REPORT_INTERVAL_SECONDS,
+                          stats_file=LATENCY_STATS_FILE or None, registry=metrics)
+
+# --- Alertas ---
+# ALERT_DEESCALATION_COUNT: resultados seguidos em um nível mais baixo antes de alertar a descida do
+# risco (a subida é alertada na hora). ALERT_REPEAT_SECONDS: reenvio de um nível inalterado (0 = nunca).
+# ALERT_BACKEND: "template" (simulação do LM, padrão), "http" (POST em ALERT_HTTP_URL, com
+# ALERT_HTTP_TOKEN opcional) ou "modulo:Classe". Os envios saem em lotes de até ALERT_BATCH_SIZE,
+# esperando até ALERT_BATCH_WAIT_SECONDS, com no máximo ALERT_MAX_CALLS_PER_MINUTE chamadas.
+# ALERT_CACHE_SIZE mensagens ficam em cache por (perigo, nível, entradas com ALERT_CACHE_DECIMALS casas).
+ALERT_DEESCALATION_COUNT = int(os.getenv("ALERT_DEESCALATION_COUNT", "3"))
+ALERT_REPEAT_SECONDS = float(os.getenv("ALERT_REPEAT_SECONDS", "0"))
+ALERT_BACKEND = os.getenv("ALERT_BACKEND", "template")
+ALERT_HTTP_URL = os.getenv("ALERT_HTTP_URL", "")
+ALERT_HTTP_TOKEN = os.getenv("ALERT_HTTP_TOKEN", "")
+ALERT_BATCH_SIZE = int(os.getenv("ALERT_BATCH_SIZE", "20"))
+ALERT_BATCH_WAIT_SECONDS = float(os.getenv("ALERT_BATCH_WAIT_SECONDS", "0.2"))
+ALERT_MAX_CALLS_PER_MINUTE = float(os.getenv("ALERT_MAX_CALLS_PER_MINUTE", "60"))
+ALERT_CACHE_SIZE = int(os.getenv("ALERT_CACHE_SIZE", "1024"))
+ALERT_CACHE_DECIMALS = int(os.getenv("ALERT_CACHE_DECIMALS", "0"))
+alerts_suppressed = metrics.counter("alerts_suppressed_total",
+                                    "Resultados sem alerta (nível de risco inalterado).", ["analysis"])
+
+
+def deliver_alert(request, message):
+    """Entrega de um alerta pelo AlertDispatcher (thread de envio)."""
+    alerts_emitted.labels(analysis=request.hazard, risk_level=request.risk_level).inc()
+    latency.record("alert_dispatch", time.monotonic() - request.created_at)
+    log.info("Alerta de %s [%s, risco %s]: %s", HAZARD_LABELS[request.hazard], request.device_id,
+             request.risk_level, message,
+             extra={"device_id": request.device_id, "analysis": request.hazard, "risk_level": request.risk_level})
+
+
+alert_backend = create_backend(ALERT_BACKEND, ALERT_HTTP_URL, ALERT_HTTP_TOKEN or None)
+alert_deduplicator = AlertDeduplicator(ALERT_DEESCALATION_COUNT, ALERT_REPEAT_SECONDS)
+alert_dispatcher = AlertDispatcher(alert_backend, deliver_alert, ALERT_BATCH_SIZE, ALERT_BATCH_WAIT_SECONDS,
+                                   ALERT_MAX_CALLS_PER_MINUTE, ALERT_CACHE_SIZE, registry=metrics)
 
 # --- Função de Callback MQTT: Quando o Cliente Conecta ao Broker ---
 
 
 def on_connect(client, userdata, flags, rc):
     """Callback chamado quando o cliente MQTT se conecta ao broker."""
-    print(f"Conectado ao broker MQTT com código: {rc}")
-    client.subscribe(MQTT_TOPIC_ALL_DATA)
-    print(f"Subscrito ao tópico: {MQTT_TOPIC_ALL_DATA}")
+    log.info("Conectado ao broker MQTT com código: %s", rc)
+    client.subscribe(MQTT_SUBSCRIPTION)
+    log.info("Subscrito ao tópico: %s", MQTT_SUBSCRIPTION)
 
 # --- Função de Callback MQTT: Quando uma Mensagem é Recebida ---
 
 
 def on_message(client, userdata, msg):
     """Callback chamado quando uma mensagem MQTT é recebida em um tópico subscrito."""
-    print(f"Mensagem recebida no tópico {msg.topic}: {msg.payload.decode()}")
+    messages_received.inc()
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Mensagem recebida no tópico %s: %s", msg.topic, msg.payload.decode(errors='replace'))
 
     try:
-        data = json.loads(msg.payload.decode())
-        data['timestamp'] = datetime.now().isoformat()
-
-        save_data(data, ALL_SENSOR_DATA_FILE)
-
-        process_flood_data(data)
-        process_fire_data(data)
+        with latency.measure("ingest"):
+            data = json.loads(msg.payload.decode())
+            if not owns_device(data.get('device_id')):
+                messages_ignored.inc()
+                return  # Dispositivo de outra partição: processado por outra instância.
+            normalize_reading(data)
+            data['timestamp'] = datetime.now().isoformat()
+
+            save_data(data)
+            features = feature_store.update(data) if feature_store is not None else None
+            if forecast_store is not None:
+                forecast_store.update(data)
+
+            # As análises rodam fora da thread de rede do paho (ver pipeline.py), com a
+            # frequência limitada pelo agendador quando configurado.
+            if analysis_scheduler is not None:
+                analysis_scheduler.offer(data, features)
+            else:
+                analysis_pipeline.submit(data, features)
 
     except json.JSONDecodeError:
-        print("Erro ao decodificar JSON da mensagem MQTT.")
+        decode_errors.inc()
+        log.warning("Erro ao decodificar JSON da mensagem MQTT no tópico %s.", msg.topic)
     except Exception as e:
-        print(f"Erro no processamento da mensagem: {e}")
+        message_errors.inc()
+        log.exception("Erro no processamento da mensagem: %s", e)
+
 
+def owns_device(device_id):
+    """Indica se este processo é responsável pelo dispositivo (particionamento por hash estável)."""
+    if PROCESSOR_SHARD_COUNT <= 1:
+        return True
+    return zlib.crc32(str(device_id).encode('utf-8')) % PROCESSOR_SHARD_COUNT == PROCESSOR_SHARD_INDEX
 
-def save_data(data, filename):
-    ensure_directory_exists(filename)
-    if not os.path.exists(filename):
-        with open(filename, 'w') as f:
-            json.dump([], f)
 
-    with open(filename, 'r+') as f:
-        file_data = json.load(f)
-        file_data.append(data)
-        f.seek(0)
-        json.dump(file_data, f, indent=4)
+def save_data(data):
+    """Grava a leitura no armazenamento append-only (custo O(1) por mensagem)."""
+    with latency.measure("persistence"):
+        sensor_store.append(data)
 
 
-def load_data(filename):
-    """Carrega dados de um arquivo JSON."""
-    if not os.path.exists(filename):
-        return []
-    with open(filename, 'r') as f:
-        return json.load(f)
+def load_data(fields, device_id=None, since=None, until=None, last=None):
+    """Consulta no armazenamento apenas as leituras e os campos necessários para a análise."""
+    with latency.measure("query"):
+        return sensor_store.query(device_id=device_id, since=since, until=until, fields=fields, last=last)
 
 
 def run_r_script(script_path, input_file, output_file):
     """Executa um script R."""
+    script = os.path.basename(script_path)
+    started = time.perf_counter()
     try:
         cmd = ["Rscript", script_path, input_file, output_file]
         result = subprocess.run(
-            cmd,timeout=60, capture_output=True, text=True, check=True)
-        print(f"Script R '{script_path}' executado. Saída:\n{result.stdout}")
+            cmd,timeout=R_ANALYSIS_TIMEOUT_SECONDS, capture_output=True, text=True, check=True)
+        log.debug("Script R '%s' executado. Saída:\n%s", script_path, result.stdout)
         if result.stderr:
-            print(f"Erros/Warnings do R:\n{result.stderr}")
+            log.debug("Mensagens/avisos do R:\n%s", result.stderr)
         return True
     except subprocess.CalledProcessError as e:
-        print(f"Erro ao executar script R: {e}")
-        print(f"Stderr: {e.stderr}")
-        print(f"Stdout: {e.stdout}")
+        log.error("Erro ao executar script R: %s\nStderr: %s\nStdout: %s", e, e.stderr, e.stdout)
+        return False
+    except subprocess.TimeoutExpired:
+        r_timeouts.labels(mode="script").inc()
+        log.error("O script R '%s' excedeu %s s.", script_path, R_ANALYSIS_TIMEOUT_SECONDS)
         return False
     except FileNotFoundError:
-        print(f"Erro: Rscript não encontrado. Certifique-se de que R esteja no seu PATH.")
+        log.error("Rscript não encontrado. Certifique-se de que R esteja no seu PATH.")
         return False
+    finally:
+        r_script_duration.labels(script=script).observe(time.perf_counter() - started)
+
+
+def run_analysis(analysis, device_id, rows, script_path, input_file, output_file, features=None,
+                 forecasts=None):
+    """
+    Executa a análise de risco ("flood" ou "fire") de um dispositivo e retorna o resultado como
+    dicionário (ou None em caso de falha). O resultado recebe um seq no histórico de resultados,
+    é gravado em `output_file` e publicado no tópico de resultados do dispositivo.
+    """
+    with latency.measure(f"analysis_{analysis}"):
+        risk_data = analyze_rows(analysis, rows, script_path,
+                                 device_file_path(input_file, device_id),
+                                 device_file_path(output_file, device_id), features, forecasts)
+    if risk_data is None:
+        analysis_failures.labels(analysis=analysis).inc()
+        return None
+    risk_data['device_id'] = device_id
+    risk_data['seq'] = result_store.publish(analysis, device_id, risk_data)
+    save_risk_output(risk_data, output_file)
+    publish_result(analysis, device_id, risk_data)
+    return risk_data
+
+
+def analyze_rows(analysis, rows, script_path, input_file, output_file, features=None, forecasts=None):
+    """
+    Usa o motor Python se configurado, depois o pool de workers R; caso contrário,
+    exporta os dados e executa o script R em um novo processo.
+    `features` (FeatureStore) só é aproveitado pelo motor Python e pelos workers R.
+    `forecasts` (ForecastStore) dispensa a previsão no motor Python e nos workers R; no script R
+    avulso, substitui as previsões gravadas por ele.
+    """
+    if risk_engine is not None:
+        return risk_engine.analyze(analysis, rows, features, forecasts)
 
-# FUNÇÃO MODIFICADA: AGORA SIMULA A RESPOSTA DO LM
+    if r_worker_pool is not None:
+        try:
+            return r_worker_pool.analyze(analysis, rows, features, forecasts)
+        except RWorkerError as e:
+            if isinstance(e, RWorkerTimeout):
+                r_timeouts.labels(mode="worker").inc()
+            log.error("Erro na análise '%s' pelo worker R: %s", analysis, e)
+            return None
+
+    df = pd.DataFrame(rows)
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    input_file = export_for_r(df, input_file)
+    log.debug("Dados para R salvos em %s", input_file)
+
+    if not run_r_script(script_path, input_file, output_file):
+        return None
+    try:
+        with open(output_file, 'r') as f:
+            result = json.load(f)
+        result.update({name: value for name, value in (forecasts or {}).items() if value is not None})
+        return result
+    except FileNotFoundError:
+        log.error("Arquivo de saída do R '%s' não encontrado.", output_file)
+    except json.JSONDecodeError:
+        log.error("Erro ao decodificar JSON do arquivo de saída do R '%s'.", output_file)
+    return None
 
 
-def get_lm_response(prompt):
+def analysis_window_rows(forecasts):
     """
-    SIMULA a interação com um Large Language Model (LM)
-    para gerar alertas com base no prompt.
+    Leituras consultadas para a análise: com previsões incrementais, o motor Python e os
+    workers R só precisam da última (para o classificador); o script R avulso recebe a janela.
     """
-    print("SIMULANDO CHAMADA AO LM. Alerta gerado com base no nível de risco extraído do prompt.")
-
-    # Extrai o nível de risco do prompt.
-    # O prompt é o texto que enviaríamos a um LM real, e ele já contém o nível de risco.
-    risk_level = "Baixo"  # Valor padrão se não for encontrado
-    if "Nível de Risco Calculado pelo modelo de ML: Muito Alto" in prompt:
-        risk_level = "Muito Alto"
-    elif "Nível de Risco Calculado pelo modelo de ML: Alto" in prompt:
-        risk_level = "Alto"
-    elif "Nível de Risco Calculado pelo modelo de ML: Moderado" in prompt:
-        risk_level = "Moderado"
+    if forecasts and (risk_engine is not None or r_worker_pool is not None):
+        return 1
+    return ANALYSIS_WINDOW_ROWS or None
+
+
+def device_file_path(path, device_id):
+    """Arquivo de trabalho exclusivo do dispositivo (evita que análises paralelas se sobrescrevam)."""
+    root, extension = os.path.splitext(path)
+    return f"{root}_{device_partition(device_id)}{extension}"
+
+
+def publish_result(analysis, device_id, risk_data):
+    """Publica o resultado (retido) no tópico do dispositivo; outras instâncias e painéis podem assiná-lo."""
+    topic = f"{MQTT_RESULTS_TOPIC}/{device_partition(device_id)}/{analysis}"
+    payload = dict(risk_data, analysis=analysis, processor_id=PROCESSOR_ID)
+    client.publish(topic, json.dumps(payload, ensure_ascii=False), qos=0, retain=True)
+
+
+def export_for_r(df, input_file):
+    """Grava a janela de leituras no formato configurado para o R e retorna o caminho gravado."""
+    ensure_directory_exists(input_file)
+    if R_EXPORT_FORMAT == "feather":
+        input_file = os.path.splitext(input_file)[0] + '.feather'
+        df.to_feather(input_file)
     else:
-        risk_level = "Baixo"  # Para qualquer outro caso ou se não encontrar no prompt
-
-    # Gera uma mensagem de alerta simulada com base no nível de risco.
-    # Esta lógica é a mesma que já está no dashboard para ser consistente.
-    simulated_alert_message = ""
-    if risk_level == "Muito Alto":
-        simulated_alert_message = "🚨 ALERTA MÁXIMO! Risco IMINENTE. Busque abrigo seguro imediatamente e siga as instruções das autoridades. Sua segurança é prioridade! (Guardião Natural Simulado)"
-    elif risk_level == "Alto":
-        simulated_alert_message = "🟠 ALERTA: Risco ALTO. Prepare-se para possíveis impactos e monitore a situação de perto. Tenha um kit de emergência pronto. (Guardião Natural Simulado)"
-    elif risk_level == "Moderado":
-        simulated_alert_message = "🟡 ATENÇÃO: Risco MODERADO. Mantenha-se informado sobre as condições. Evite áreas de risco e tome precauções básicas. (Guardião Natural Simulado)"
-    else:  # Baixo
-        simulated_alert_message = "🟢 STATUS: Risco Baixo. Situação sob controle. Continue monitorando as informações oficiais. (Guardião Natural Simulado)"
-
-    return simulated_alert_message
-
-
-def process_flood_data(new_data):
-    """Processa dados de enchente, chama o script R de análise e o LM para gerar alertas."""
-    ensure_directory_exists(ALL_SENSOR_DATA_FILE)
-    all_sensor_data = load_data(ALL_SENSOR_DATA_FILE)
-    if not all_sensor_data:
-        print("Dados de sensor insuficientes para análise de enchente.")
+        df.to_csv(input_file, index=False)
+    return input_file
+
+
+def save_risk_output(risk_data, output_file):
+    """Grava o resultado da análise no mesmo arquivo que o script R gravaria (substituição atômica)."""
+    write_json_atomic(risk_data, output_file)
+
+
+def emit_alert(hazard, device_id, risk_data, reading):
+    """
+    Gera o alerta do resultado quando o nível de risco do dispositivo muda (AlertDeduplicator).
+    A mensagem (template ou LM, conforme ALERT_BACKEND) é enviada em segundo plano pelo AlertDispatcher.
+    """
+    risk_level = alert_deduplicator.update(device_id, hazard, risk_data.get("risk_level", "Baixo"))
+    if risk_level is None:
+        alerts_suppressed.labels(analysis=hazard).inc()
         return
+    alert_dispatcher.submit(AlertRequest(hazard, risk_level, device_id, alert_inputs(hazard, reading, risk_data),
+                                         ALERT_CACHE_DECIMALS))
 
-    flood_specific_data = []
-    for item in all_sensor_data:
-        if 'water_level' in item and 'rainfall_intensity' in item and 'timestamp' in item:
-            flood_specific_data.append({
-                'timestamp': item['timestamp'],
-                'water_level': item['water_level'],
-                'rainfall_intensity': item['rainfall_intensity']
-            })
 
+def process_flood_data(new_data, features=None):
+    """Processa dados de enchente, chama a análise (R ou Python) e gera o alerta."""
+    device_id = new_data.get('device_id')
+    forecasts = forecast_store.forecasts(device_id, "flood") if forecast_store is not None else None
+    flood_specific_data = load_data(FLOOD_FIELDS, device_id=device_id, last=analysis_window_rows(forecasts))
     if not flood_specific_data:
-        print("Nenhum dado de enchente relevante encontrado para análise.")
+        log.info("Nenhum dado de enchente relevante encontrado para análise (%s).", device_id)
         return
 
-    df_flood = pd.DataFrame(flood_specific_data)
-    df_flood['timestamp'] = pd.to_datetime(df_flood['timestamp'])
-    ensure_directory_exists(FIRE_DATA_FOR_R)
-    df_flood.to_csv(FLOOD_DATA_FOR_R, index=False)
-    print(f"Dados de enchente para R salvos em {FLOOD_DATA_FOR_R}")  
-
-    ensure_directory_exists(FLOOD_ANALYSIS_R)
-    if run_r_script(FLOOD_ANALYSIS_R, FLOOD_DATA_FOR_R, FLOOD_RISK_OUTPUT_R):
-        try:
-            with open(FLOOD_RISK_OUTPUT_R, 'r') as f:
-                flood_risk_data = json.load(f)
-            risk_level = flood_risk_data.get("risk_level", "Baixo")
-            water_level_pred = flood_risk_data.get(
-                "predicted_water_level", "N/A")
-            rainfall_pred = flood_risk_data.get("predicted_rainfall", "N/A")
-
-            lm_prompt = f"""
-            **Guardião Natural - Alerta de Enchente:**
-            Com base nos seguintes dados de sensor e previsões de risco de enchente:
-            Nível atual da água: {new_data.get('water_level', 'N/A')}cm
-            Intensidade de chuva atual: {new_data.get('rainfall_intensity', 'N/A')}%
-            Previsão de Nível da Água (próximas horas): {water_level_pred}cm
-            Previsão de Chuva (próximas horas): {rainfall_pred}%
-            Nível de Risco Calculado pelo modelo de ML: {risk_level}
-
-            Gere uma mensagem de alerta concisa e acionável para a população local,
-            considerando o nível de risco.
-            - Se o risco for 'Baixo', use uma mensagem tranquilizadora, indicando que a situação está sob controle.
-            - Se for 'Moderado', alerte sobre a necessidade de monitoramento e precauções básicas.
-            - Se for 'Alto' ou 'Muito Alto', instrua sobre precauções urgentes, como evitar áreas de risco, preparar kit de emergência ou considerar evacuação.
-            A mensagem deve ser clara e direta.
-            """
-            print("\n--- Alerta de Enchente (LM) ---")
-            alert_message = get_lm_response(lm_prompt)
-            print(alert_message)
-            print("---------------------------------\n")
-
-        except FileNotFoundError:
-            print(
-                f"Arquivo de saída do R '{FLOOD_RISK_OUTPUT_R}' não encontrado.")
-        except json.JSONDecodeError:
-            print(f"Erro ao decodificar JSON do arquivo de saída do R para enchentes.")
-
-
-def process_fire_data(new_data):
-    """Processa dados de incêndio, chama o script R de análise e o LM para gerar alertas."""
-    all_sensor_data = load_data(ALL_SENSOR_DATA_FILE)
-    if not all_sensor_data:
-        print("Dados de sensor insuficientes para análise de incêndio.")
+    flood_risk_data = run_analysis("flood", device_id, flood_specific_data, FLOOD_ANALYSIS_R,
+                                   FLOOD_DATA_FOR_R, FLOOD_RISK_OUTPUT_R, features, forecasts)
+    if flood_risk_data is None:
         return
 
-    fire_specific_data = []
-    for item in all_sensor_data:
-        if 'temperature' in item and 'humidity' in item and 'smoke_concentration' in item and 'timestamp' in item:
-            fire_specific_data.append({
-                'timestamp': item['timestamp'],
-                'temperature': item['temperature'],
-                'humidity': item['humidity'],
-                'smoke_concentration': item['smoke_concentration']
-            })
+    with latency.measure("alert"):
+        emit_alert("flood", device_id, flood_risk_data, new_data)
+    record_end_to_end(new_data)
 
+
+def process_fire_data(new_data, features=None):
+    """Processa dados de incêndio, chama a análise (R ou Python) e gera o alerta."""
+    device_id = new_data.get('device_id')
+    forecasts = forecast_store.forecasts(device_id, "fire") if forecast_store is not None else None
+    fire_specific_data = load_data(FIRE_FIELDS, device_id=device_id, last=analysis_window_rows(forecasts))
     if not fire_specific_data:
-        print("Nenhum dado de incêndio relevante encontrado para análise.")
+        log.info("Nenhum dado de incêndio relevante encontrado para análise (%s).", device_id)
         return
 
-    df_fire = pd.DataFrame(fire_specific_data)
-    df_fire['timestamp'] = pd.to_datetime(df_fire['timestamp'])
+    fire_risk_data = run_analysis("fire", device_id, fire_specific_data, FIRE_ANALYSIS_R,
+                                  FIRE_DATA_FOR_R, FIRE_RISK_OUTPUT_R, features, forecasts)
+    if fire_risk_data is None:
+        return
+
+    with latency.measure("alert"):
+        emit_alert("fire", device_id, fire_risk_data, new_data)
+    record_end_to_end(new_data)
+
+
+def record_end_to_end(data):
+    """Latência total: da chegada da leitura (timestamp gravado no on_message) até a decisão do alerta."""
+    received = datetime.fromisoformat(data['timestamp'])
+    latency.record("end_to_end", (datetime.now() - received).total_seconds())
 
-    ensure_directory_exists(FIRE_DATA_FOR_R)
-    df_fire.to_csv(FIRE_DATA_FOR_R, index=False)
-    print(f"Dados de incêndio para R salvos em {FIRE_DATA_FOR_R}")
 
-    if run_r_script(FIRE_ANALYSIS_R, FIRE_DATA_FOR_R, FIRE_RISK_OUTPUT_R):
-        try:
-            with open(FIRE_RISK_OUTPUT_R, 'r') as f:
-                fire_risk_data = json.load(f)
-            risk_level = fire_risk_data.get("risk_level", "Baixo")
-            pred_temp = fire_risk_data.get("predicted_temperature", "N/A")
-            pred_smoke = fire_risk_data.get("predicted_smoke", "N/A")
-
-            lm_prompt = f"""
-            **Guardião Natural - Alerta de Incêndio:**
-            Com base nos seguintes dados de sensor e previsões de risco de incêndio:
-            Temperatura atual: {new_data.get('temperature', 'N/A')}°C
-            Umidade atual: {new_data.get('humidity', 'N/A')}%
-            Concentração de Fumaça atual: {new_data.get('smoke_concentration', 'N/A')}%
-            Previsão de Temperatura (próximas horas): {pred_temp}°C
-            Previsão de Fumaça (próximas horas): {pred_smoke}%
-            Nível de Risco Calculado pelo modelo de ML: {risk_level}
-
-            Gere uma mensagem de alerta concisa e acionável para a população local e autoridades (Defesa Civil, Bombeiros),
-            considerando o nível de risco.
-            - Se o risco for 'Baixo', use uma mensagem tranquilizadora.
-            - Se for 'Moderado', alerte sobre o monitoramento e a necessidade de evitar atividades que gerem faíscas.
-            - Se for 'Alto' ou 'Muito Alto', instrua sobre a evacuação imediata da área,
-              contato com emergência e não tentar combater o fogo por conta própria.
-            A mensagem deve ser clara e direta.
-            """
-            print("\n--- Alerta de Incêndio (LM) ---")
-            alert_message = get_lm_response(lm_prompt)
-            print(alert_message)
-            print("---------------------------------\n")
-
-        except FileNotFoundError:
-            print(
-                f"Arquivo de saída do R '{FIRE_RISK_OUTPUT_R}' não encontrado.")
-        except json.JSONDecodeError:
-            print(f"Erro ao decodificar JSON do arquivo de saída do R para incêndios.")
-    
 def ensure_directory_exists(path):
     """Garante que o diretório para o caminho especificado exista."""
     directory = os.path.dirname(path)
     os.makedirs(directory, exist_ok=True)
 
 
+# --- Inicialização do Pipeline de Análise ---
+analysis_pipeline = AnalysisPipeline(
+    {"flood": process_flood_data, "fire": process_fire_data},
+    queue_size=ANALYSIS_QUEUE_SIZE, workers=ANALYSIS_WORKERS, policy=ANALYSIS_QUEUE_POLICY)
+analysis_scheduler = None
+if ANALYSIS_MIN_INTERVAL_SECONDS > 0:
+    analysis_scheduler = AnalysisScheduler(
+        analysis_pipeline.submit, {"flood": FLOOD_FIELDS, "fire": FIRE_FIELDS},
+        min_interval=ANALYSIS_MIN_INTERVAL_SECONDS)
+
+# --- Métricas do Pipeline e Endpoint HTTP ---
+metrics.callback("gauge", "analysis_queue_depth", "Análises aguardando na fila.",
+                 lambda: len(analysis_pipeline.queue))
+metrics.callback("counter", "analysis_jobs_total",
+                 "Pedidos de análise por desfecho (submitted, queued, coalesced, dropped, processed, failed).",
+                 lambda: {(name,): value for name, value in analysis_pipeline.stats().items()
+                          if name in analysis_pipeline.counters}, ["outcome"])
+if r_worker_pool is not None:
+    metrics.callback("counter", "r_worker_restarts_total", "Reinícios dos workers R (timeout ou queda).",
+                     lambda: sum(worker.restarts for worker in r_worker_pool.workers))
+
+
+def log_profile(path, stacks):
+    """Resumo de uma captura do profiler: arquivo gravado e funções com mais amostras."""
+    top = ", ".join(f"{function} {share:.0%}" for function, share in profiler.top_functions(stacks, 5))
+    log.info("Profile gravado em %s. Mais amostras: %s", path, top)
+
+
+profiler = SamplingProfiler() if PROFILER_ENABLED else None
+if profiler is not None and profiler.install_signal_handler(PROFILE_DIR, PROFILE_SECONDS, on_done=log_profile):
+    log.info("Profiler habilitado: kill -USR1 %d grava uma captura de %s s em %s.",
+             os.getpid(), PROFILE_SECONDS, PROFILE_DIR)
+metrics_server = None
+if METRICS_PORT:
+    try:
+        metrics_server = start_metrics_server(metrics, METRICS_PORT, METRICS_HOST, profiler)
+        log.info("Métricas em http://%s:%d/metrics", METRICS_HOST, METRICS_PORT)
+    except OSError as e:
+        log.warning("Endpoint de métricas não iniciado em %s:%d (%s).", METRICS_HOST, METRICS_PORT, e)
+
 # --- Inicialização do Cliente MQTT ---
-client = mqtt.Client()
+client = mqtt.Client(client_id=f"guardiao-processor-{PROCESSOR_ID}")
 client.on_connect = on_connect
 client.on_message = on_message
 
-print(f"Conectando ao broker MQTT: {MQTT_BROKER_HOST}:{MQTT_BROKER_PORT}")
+log.info("Conectando ao broker MQTT: %s:%s", MQTT_BROKER_HOST, MQTT_BROKER_PORT)
 try:
     client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT, 60)
 except Exception as e:
-    print(f"Não foi possível conectar ao broker MQTT: {e}")
+    log.error("Não foi possível conectar ao broker MQTT: %s", e)
     exit()
 
 # --- Loop Principal para Manter o Cliente MQTT Executando ---
-client.loop_forever()
+try:
+    client.loop_forever()
+finally:
+    # Conclui as análises pendentes, garante o fsync das últimas leituras e encerra os workers R.
+    if analysis_scheduler is not None:
+        analysis_scheduler.close()
+    analysis_pipeline.close()
+    alert_dispatcher.close()
+    if compactor is not None:
+        compactor.close()
+    sensor_store.close()
+    result_store.close()
+    latency.close()
+    if metrics_server is not None:
+        metrics_server.shutdown()
+    if r_worker_pool is not None:
+        r_worker_pool.close()
@@ -0,0 +1,91 @@
+# python_server/downsampling.py
+# Redução de pontos das séries enviadas aos gráficos do dashboard.
+# Um gráfico com algumas centenas de pixels de largura não mostra mais que isso de pontos:
+# enviar milhares de leituras ao navegador só aumenta o JSON do Plotly e o tempo de desenho.
+#   - LTTB (Largest-Triangle-Three-Buckets): mantém o formato visual da curva.
+#   - min/max por intervalo: preserva os picos (útil para fumaça e nível da água).
+import numpy as np
+
+# --- Configurações Padrão ---
+DEFAULT_MAX_POINTS = 800           # Aproximadamente a largura em pixels de um gráfico do dashboard.
+DOWNSAMPLE_FACTOR = 20             # Séries de até 20x o limite de pontos são reduzidas (custo limitado).
+DOWNSAMPLING_METHODS = ("lttb", "minmax")
+
+# Escolhas possíveis de choose_resolution (além das resoluções dos agregados, em segundos).
+RAW = "raw"
+DOWNSAMPLED = "downsampled"
+
+
+def _as_float(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[us]').astype(np.int64).astype(float)
+    return x.astype(float)
+
+
+def lttb(x, y, threshold):
+    """Índices dos `threshold` pontos escolhidos pelo LTTB (sempre inclui o primeiro e o último)."""
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x, y = _as_float(x), np.asarray(y, dtype=float)
+    # Os pontos internos são divididos em threshold - 2 intervalos de tamanho igual.
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # O terceiro vértice do triângulo é a média do próximo intervalo (ou o último ponto).
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        if next_start >= next_end:
+            next_start, next_end = n - 1, n
+        avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        areas = np.abs((x[previous] - avg_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (avg_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+    return selected
+
+
+def minmax(y, buckets):
+    """Índices do mínimo e do máximo de cada um dos `buckets` intervalos (até 2 * buckets pontos)."""
+    n = len(y)
+    if 2 * buckets >= n or buckets < 1:
+        return np.arange(n)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(0, n, buckets + 1).astype(int)
+    selected = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            low, high = start + int(np.argmin(y[start:end])), start + int(np.argmax(y[start:end]))
+            selected.extend(sorted({low, high}))
+    return np.asarray(selected, dtype=int)
+
+
+def downsample(x, y, max_points=DEFAULT_MAX_POINTS, method="lttb"):
+    """Índices de no máximo `max_points` pontos pelo método escolhido ("lttb" ou "minmax")."""
+    if method == "minmax":
+        return minmax(y, max_points // 2)
+    if method == "lttb":
+        return lttb(x, y, max_points)
+    raise ValueError(f"Método de redução desconhecido: {method}")
+
+
+def choose_resolution(span_seconds, raw_count, resolutions, max_points=DEFAULT_MAX_POINTS):
+    """
+    Decide de onde vem a série de um gráfico com no máximo `max_points` pontos:
+      RAW          -> as leituras brutas já cabem no gráfico;
+      DOWNSAMPLED  -> leituras brutas reduzidas (LTTB/min-max);
+      <segundos>   -> a menor resolução de agregado com até DOWNSAMPLE_FACTOR * `max_points`
+                      intervalos no período (ou a maior disponível), reduzida depois ao limite.
+    Assim nenhuma série lida passa de DOWNSAMPLE_FACTOR * `max_points` pontos, qualquer que seja o período.
+    """
+    if raw_count <= max_points:
+        return RAW
+    if raw_count <= max_points * DOWNSAMPLE_FACTOR:
+        return DOWNSAMPLED
+    for resolution in sorted(resolutions):
+        if span_seconds / resolution <= max_points * DOWNSAMPLE_FACTOR:
+            return resolution
+    return max(resolutions)
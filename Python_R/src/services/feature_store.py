@@ -0,0 +1,118 @@
+# python_server/feature_store.py
+# Cálculo incremental das features dos modelos de risco (médias, somas e variações em janelas móveis).
+# Em vez de reconstruir um DataFrame com todo o histórico a cada mensagem, cada dispositivo
+# mantém janelas de tempo com somas acumuladas, atualizadas em O(1) (amortizado) por leitura.
+from collections import deque  # Fila das leituras dentro de cada janela.
+from datetime import datetime, timedelta
+
+# --- Definição das Features ---
+# nome da feature: (campo da leitura, agregação, tamanho da janela)
+# Agregações: "mean" (média), "sum" (soma) e "change" (último valor - primeiro valor da janela).
+FEATURE_DEFINITIONS = {
+    'water_level_avg_24h': ('water_level', 'mean', timedelta(hours=24)),
+    'rainfall_total_24h': ('rainfall_intensity', 'sum', timedelta(hours=24)),
+    'water_level_change_12h': ('water_level', 'change', timedelta(hours=12)),
+    'temperature_avg_24h': ('temperature', 'mean', timedelta(hours=24)),
+    'humidity_avg_24h': ('humidity', 'mean', timedelta(hours=24)),
+    'smoke_concentration_avg_6h': ('smoke_concentration', 'mean', timedelta(hours=6)),
+}
+
+# Features que o sensor não mede: mesmos valores fixos usados pelos scripts R.
+FEATURE_PLACEHOLDERS = {
+    'previous_flood_event_in_region': 0,
+    'wind_speed_avg_24h': 10,
+    'vegetation_dryness_index': 0.5,
+}
+
+
+class RollingWindow:
+    """Janela móvel de tempo com soma acumulada: cada leitura entra e sai uma única vez."""
+
+    def __init__(self, size):
+        self.size = size
+        self.items = deque()  # (instante, valor)
+        self.total = 0.0
+
+    def push(self, moment, value):
+        self.items.append((moment, value))
+        self.total += value
+        limit = moment - self.size
+        while self.items and self.items[0][0] < limit:
+            self.total -= self.items.popleft()[1]
+        if len(self.items) == 1:
+            self.total = value  # Descarta o erro de arredondamento acumulado nas subtrações.
+
+    def value(self, aggregation):
+        if not self.items:
+            return None
+        if aggregation == 'sum':
+            return self.total
+        if aggregation == 'mean':
+            return self.total / len(self.items)
+        if aggregation == 'change':
+            return self.items[-1][1] - self.items[0][1]
+        raise ValueError(f"Agregação desconhecida: {aggregation}")
+
+
+class DeviceFeatures:
+    """Janelas de um único dispositivo (uma por feature)."""
+
+    def __init__(self, definitions):
+        self.definitions = definitions
+        self.windows = {name: RollingWindow(size) for name, (_, _, size) in definitions.items()}
+        self.last_moment = None
+
+    def update(self, moment, record):
+        if self.last_moment is not None and moment < self.last_moment:
+            return  # Leitura fora de ordem: ignorada para manter as janelas consistentes.
+        self.last_moment = moment
+        for name, (field, _, _) in self.definitions.items():
+            value = record.get(field)
+            if value is not None:
+                self.windows[name].push(moment, float(value))
+
+    def features(self):
+        return {name: self.windows[name].value(aggregation)
+                for name, (_, aggregation, _) in self.definitions.items()}
+
+
+class FeatureStore:
+    """Mantém as features de cada dispositivo atualizadas a cada leitura recebida."""
+
+    def __init__(self, definitions=None, placeholders=None):
+        self.definitions = definitions or FEATURE_DEFINITIONS
+        self.placeholders = FEATURE_PLACEHOLDERS if placeholders is None else placeholders
+        self.devices = {}
+
+    @property
+    def max_window(self):
+        return max(size for _, _, size in self.definitions.values())
+
+    def update(self, record):
+        """Atualiza as janelas do dispositivo da leitura e retorna as features atuais dele."""
+        device = self.devices.get(record.get('device_id'))
+        if device is None:
+            device = self.devices[record.get('device_id')] = DeviceFeatures(self.definitions)
+        device.update(parse_timestamp(record.get('timestamp')), record)
+        return self.features(record.get('device_id'))
+
+    def features(self, device_id):
+        """Vetor de features (dicionário) do dispositivo, incluindo os valores fixos."""
+        device = self.devices.get(device_id)
+        values = device.features() if device else {name: None for name in self.definitions}
+        return {**self.placeholders, **values}
+
+    def warm_up(self, sensor_store, now=None):
+        """Reconstrói as janelas a partir do armazenamento lendo apenas o período da maior janela."""
+        since = (now or datetime.now()) - self.max_window
+        for record in sensor_store.query(since=since):
+            self.update(record)
+
+
+def parse_timestamp(value):
+    """Converte o timestamp ISO gravado na leitura (usa o horário atual se ausente)."""
+    if isinstance(value, datetime):
+        return value
+    if not value:
+        return datetime.now()
+    return datetime.fromisoformat(str(value))
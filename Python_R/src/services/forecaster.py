@@ -0,0 +1,333 @@
+# python_server/forecaster.py
+# Previsão de 1 passo à frente incremental, por dispositivo e variável.
+# O auto.arima dos scripts R (e o forecast_next do risk_engine.py) refaz a busca do modelo
+# sobre toda a janela de leituras a cada mensagem. Aqui cada série mantém o estado do modelo
+# ajustado e o atualiza em O(1) a cada nova leitura; a escolha do modelo (suavização
+# exponencial simples, Holt com tendência amortecida ou AR(1) por mínimos quadrados recursivos)
+# é refeita só periodicamente, sobre uma janela limitada das leituras mais recentes.
+# Para séries inteiras (backfill.py), update_many calcula as mesmas recursões com NumPy: entre
+# duas escolhas os parâmetros do modelo são fixos, e a recursão é resolvida em blocos de leituras.
+import math            # Verificação de valores inválidos.
+import threading       # Leituras (thread MQTT) e previsões (threads de análise) concorrentes.
+from collections import deque  # Janela limitada usada na escolha do modelo.
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+import numpy as np     # Recursões das séries inteiras (update_many).
+
+# --- Configurações Padrão ---
+MIN_POINTS_FOR_FORECAST = 5        # Mesma regra dos scripts R: com menos pontos, repete o último valor.
+SELECTION_WINDOW = 200             # Leituras usadas na escolha do modelo.
+RESELECT_EVERY = 100               # Leituras entre duas escolhas de modelo (após o aquecimento).
+WARM_UP_PERIOD = timedelta(hours=24)
+SCAN_BLOCK = 64                    # Leituras por bloco em linear_scan (memória ~ SCAN_BLOCK² por estado).
+
+# Campo previsto em cada análise: nome no resultado -> campo da leitura.
+FORECAST_OUTPUTS = {
+    "flood": {"predicted_water_level": "water_level", "predicted_rainfall": "rainfall_intensity"},
+    "fire": {"predicted_temperature": "temperature", "predicted_smoke": "smoke_concentration"},
+}
+FORECAST_FIELDS = tuple(field for outputs in FORECAST_OUTPUTS.values() for field in outputs.values())
+
+
+# --- Recursões Lineares em Lote ---
+
+@lru_cache(maxsize=64)
+def _scan_operators(matrix, block):
+    """
+    Potências A¹..A^block da matriz (tupla de tuplas), (block, k, k), e a matriz
+    (block·k, block·k) cujo bloco (i, m) é A^(i-m) abaixo da diagonal e zero acima.
+    """
+    a = np.array(matrix, dtype=float)
+    k = len(a)
+    powers = np.empty((block + 1, k, k))
+    powers[0] = np.eye(k)
+    for j in range(block):
+        powers[j + 1] = powers[j] @ a
+    steps = np.arange(block)
+    lags = steps[:, None] - steps[None, :]
+    toeplitz = np.where((lags >= 0)[:, :, None, None], powers[np.clip(lags, 0, None)], 0.0)
+    return powers[1:], toeplitz.transpose(0, 2, 1, 3).reshape(block * k, block * k)
+
+
+def linear_scan(matrix, inputs, state, block=SCAN_BLOCK):
+    """
+    Estados s[t] = A s[t-1] + u[t] da recursão linear com A fixa (`matrix`, tupla de tuplas),
+    entradas `inputs` (n, k) e estado inicial `state` (k,). Retorna os n estados (n, k).
+    Em cada bloco de `block` leituras: s[i] = A^(i+1) s0 + Σ A^(i-m) u[m] (só produtos de matrizes).
+    Com A 1×1, cada coluna de `inputs` é uma recursão independente (state com uma posição por coluna).
+    """
+    inputs = np.asarray(inputs, dtype=float)
+    powers, toeplitz = _scan_operators(matrix, block)
+    states = np.empty_like(inputs)
+    state = np.asarray(state, dtype=float)
+    k = len(matrix)
+    for start in range(0, len(inputs), block):
+        u = inputs[start:start + block]
+        n = len(u)
+        if k == 1:
+            states[start:start + n] = toeplitz[:n, :n] @ u + powers[:n, 0] * state
+        else:
+            states[start:start + n] = ((toeplitz[:n * k, :n * k] @ u.reshape(-1)).reshape(n, k)
+                                       + powers[:n] @ state)
+        state = states[start + n - 1]
+    return states
+
+
+# --- Modelos (atualização O(1) por leitura) ---
+# update_many(values) aplica update a cada valor (sem NaN) e retorna a previsão após cada um.
+
+class SimpleExponentialSmoothing:
+    """Nível suavizado; com alpha = 1 equivale ao passeio aleatório (ARIMA(0,1,0))."""
+
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.level = None
+
+    def update(self, value):
+        if self.level is None:
+            self.level = value
+        else:
+            self.level += self.alpha * (value - self.level)
+
+    def forecast(self):
+        return self.level
+
+    def update_many(self, values):
+        values = np.asarray(values, dtype=float)
+        if not len(values):
+            return values
+        if self.level is None:
+            self.level = float(values[0])
+            return np.concatenate([values[:1], self.update_many(values[1:])])
+        levels = linear_scan(((1 - self.alpha,),), self.alpha * values[:, None], (self.level,))[:, 0]
+        self.level = float(levels[-1])
+        return levels
+
+
+class DampedHolt:
+    """Holt (nível + tendência) com tendência amortecida por `phi`."""
+
+    def __init__(self, alpha, beta, phi=0.98):
+        self.alpha, self.beta, self.phi = alpha, beta, phi
+        self.level = None
+        self.trend = 0.0
+
+    def update(self, value):
+        if self.level is None:
+            self.level = value
+            return
+        previous = self.level
+        self.level = self.alpha * value + (1 - self.alpha) * (previous + self.phi * self.trend)
+        self.trend = self.beta * (self.level - previous) + (1 - self.beta) * self.phi * self.trend
+
+    def forecast(self):
+        return None if self.level is None else self.level + self.phi * self.trend
+
+    def update_many(self, values):
+        values = np.asarray(values, dtype=float)
+        if not len(values):
+            return values
+        if self.level is None:
+            self.update(values[0])
+            return np.concatenate([[self.forecast()], self.update_many(values[1:])])
+        # Nível e tendência: s[t] = A s[t-1] + b x[t] (mesma conta de update, expandida).
+        alpha, beta, phi = self.alpha, self.beta, self.phi
+        matrix = ((1 - alpha, (1 - alpha) * phi), (-alpha * beta, phi * (1 - alpha * beta)))
+        states = linear_scan(matrix, values[:, None] * np.array([alpha, alpha * beta]), (self.level, self.trend))
+        self.level, self.trend = float(states[-1, 0]), float(states[-1, 1])
+        return states[:, 0] + phi * states[:, 1]
+
+
+class RecursiveAR1:
+    """
+    AR(1) com constante (y[t] = c + a * y[t-1]) estimado por mínimos quadrados recursivos,
+    um filtro de Kalman para parâmetros constantes, com fator de esquecimento `forgetting`.
+    """
+
+    def __init__(self, forgetting=0.99):
+        self.forgetting = forgetting
+        self.c = self.a = 0.0
+        self.p00, self.p01, self.p11 = 1e3, 0.0, 1e3  # Covariância dos parâmetros (simétrica).
+        self.last = None
+
+    def update(self, value):
+        if self.last is not None:
+            x1 = self.last
+            px0 = self.p00 + self.p01 * x1
+            px1 = self.p01 + self.p11 * x1
+            gain_denominator = self.forgetting + px0 + x1 * px1
+            k0, k1 = px0 / gain_denominator, px1 / gain_denominator
+            error = value - (self.c + self.a * x1)
+            self.c += k0 * error
+            self.a += k1 * error
+            self.p00 = (self.p00 - k0 * px0) / self.forgetting
+            self.p01 = (self.p01 - k0 * px1) / self.forgetting
+            self.p11 = (self.p11 - k1 * px1) / self.forgetting
+        self.last = value
+
+    def forecast(self):
+        if self.last is None:
+            return None
+        if abs(self.a) >= 1:  # Estimativa não estacionária: usa o passeio aleatório.
+            return self.last
+        return self.c + self.a * self.last
+
+    def update_many(self, values):
+        """
+        Mesma estimativa na forma de informação: R[t] = λ R[t-1] + x xᵀ e r[t] = λ r[t-1] + x y
+        (x = [1, y[t-1]]), com R = P⁻¹ e (c, a) = R⁻¹ r; as somas com esquecimento vêm de linear_scan.
+        """
+        values = np.asarray(values, dtype=float)
+        if not len(values):
+            return values
+        if self.last is None:
+            self.last = float(values[0])
+            return np.concatenate([[self.forecast()], self.update_many(values[1:])])
+        x1 = np.concatenate([[self.last], values[:-1]])
+        determinant = self.p00 * self.p11 - self.p01 ** 2
+        r00, r01, r11 = self.p11 / determinant, -self.p01 / determinant, self.p00 / determinant
+        initial = (r00, r01, r11, r00 * self.c + r01 * self.a, r01 * self.c + r11 * self.a)
+        inputs = np.column_stack([np.ones_like(x1), x1, x1 * x1, values, x1 * values])
+        r00, r01, r11, r0, r1 = linear_scan(((self.forgetting,),), inputs, initial).T
+        determinant = r00 * r11 - r01 ** 2
+        c, a = (r11 * r0 - r01 * r1) / determinant, (r00 * r1 - r01 * r0) / determinant
+        self.c, self.a, self.last = float(c[-1]), float(a[-1]), float(values[-1])
+        self.p00, self.p01, self.p11 = (float(r11[-1] / determinant[-1]), float(-r01[-1] / determinant[-1]),
+                                        float(r00[-1] / determinant[-1]))
+        return np.where(np.abs(a) >= 1, values, c + a * values)
+
+
+# Modelos candidatos: nome -> fábrica de um modelo novo.
+CANDIDATES = {
+    **{f"ses(alpha={alpha})": (lambda alpha=alpha: SimpleExponentialSmoothing(alpha))
+       for alpha in (0.2, 0.5, 0.8, 1.0)},
+    **{f"holt(alpha={alpha}, beta={beta})": (lambda alpha=alpha, beta=beta: DampedHolt(alpha, beta))
+       for alpha in (0.3, 0.8) for beta in (0.05, 0.2)},
+    "ar1(rls)": lambda: RecursiveAR1(),
+}
+
+
+class OnlineForecaster:
+    """
+    Previsão de uma série: o modelo escolhido é atualizado a cada leitura e a escolha
+    (menor erro quadrático médio de 1 passo na janela) é refeita a cada `reselect_every`
+    leituras. Enquanto a janela enche, a escolha é refeita com 5, 10, 20, 40... leituras.
+    """
+
+    def __init__(self, window=SELECTION_WINDOW, reselect_every=RESELECT_EVERY, candidates=None):
+        self.values = deque(maxlen=window)
+        self.reselect_every = reselect_every
+        # None = CANDIDATES (as fábricas não são guardadas: o previsor pode ser enviado a outro
+        # processo com pickle, como no backfill.py).
+        self.candidates = candidates
+        self.model = None
+        self.model_name = None
+        self._since_selection = 0
+        self._selected_at = 0
+
+    def update(self, value):
+        value = float(value)
+        if math.isnan(value):
+            return
+        self.values.append(value)
+        if self.model is not None:
+            self.model.update(value)
+        self._since_selection += 1
+        if (len(self.values) >= MIN_POINTS_FOR_FORECAST
+                and (self.model is None
+                     or self._since_selection >= min(self.reselect_every, self._selected_at))):
+            self.reselect()
+
+    def reselect(self):
+        """Reajusta todos os candidatos na janela e mantém o de menor erro (já com o estado atual)."""
+        best_error, best_name, best_model = math.inf, None, None
+        values = np.array(self.values, dtype=float)
+        for name, factory in (self.candidates or CANDIDATES).items():
+            model = factory()
+            # Erro de 1 passo: a previsão após cada leitura contra a leitura seguinte.
+            errors = values[1:] - model.update_many(values)[:-1]
+            error = float(np.mean(errors ** 2)) if len(errors) else math.inf
+            if error < best_error:
+                best_error, best_name, best_model = error, name, model
+        self.model, self.model_name = best_model, best_name
+        self._since_selection = 0
+        self._selected_at = len(self.values)
+
+    def update_many(self, values):
+        """
+        Aplica update a cada valor válido de `values` e retorna forecast() após cada um deles
+        (um array só com os valores que não são NaN), com os modelos atualizados por update_many.
+        """
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        forecasts = np.empty(len(values))
+        position = 0
+        while position < len(values):
+            if self.model is None:
+                steps = max(MIN_POINTS_FOR_FORECAST - len(self.values), 1)
+            else:
+                steps = max(min(self.reselect_every, self._selected_at) - self._since_selection, 1)
+            chunk = values[position:position + steps]
+            self.values.extend(chunk)
+            self._since_selection += len(chunk)
+            reselect = (len(chunk) == steps and len(self.values) >= MIN_POINTS_FOR_FORECAST)
+            if self.model is not None:
+                # Na leitura da nova escolha, o modelo atual é substituído: não precisa dela.
+                predictions = self.model.update_many(chunk[:-1] if reselect else chunk)
+                forecasts[position:position + len(predictions)] = predictions
+            else:
+                forecasts[position:position + len(chunk)] = chunk   # Sem modelo: repete o último valor.
+            if reselect:
+                self.reselect()
+                forecasts[position + len(chunk) - 1] = self.model.forecast()
+            position += len(chunk)
+        return np.round(forecasts, 2)
+
+    def forecast(self):
+        """Previsão do próximo valor (arredondada como nos scripts R), ou None sem leituras."""
+        if not self.values:
+            return None
+        prediction = self.model.forecast() if self.model is not None else None
+        if prediction is None or len(self.values) < MIN_POINTS_FOR_FORECAST:
+            prediction = self.values[-1]
+        return round(float(prediction), 2)
+
+
+class ForecastStore:
+    """Previsores por (dispositivo, campo), atualizados a cada leitura recebida."""
+
+    def __init__(self, fields=FORECAST_FIELDS, window=SELECTION_WINDOW, reselect_every=RESELECT_EVERY):
+        self.fields = fields
+        self.window = window
+        self.reselect_every = reselect_every
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def update(self, record):
+        device_id = record.get('device_id')
+        with self._lock:
+            for field in self.fields:
+                value = record.get(field)
+                if not isinstance(value, (int, float)) or isinstance(value, bool):
+                    continue
+                forecaster = self.series.get((device_id, field))
+                if forecaster is None:
+                    forecaster = self.series[(device_id, field)] = OnlineForecaster(
+                        self.window, self.reselect_every)
+                forecaster.update(value)
+
+    def forecasts(self, device_id, analysis):
+        """Previsões da análise para o dispositivo, com os nomes do resultado (ex.: predicted_smoke)."""
+        with self._lock:
+            result = {}
+            for output, field in FORECAST_OUTPUTS[analysis].items():
+                forecaster = self.series.get((device_id, field))
+                result[output] = forecaster.forecast() if forecaster is not None else None
+            return result
+
+    def warm_up(self, sensor_store, now=None, period=WARM_UP_PERIOD):
+        """Alimenta os previsores com as leituras do período (cada série guarda só a janela)."""
+        since = (now or datetime.now()) - period
+        for record in sensor_store.query(since=since):
+            self.update(record)
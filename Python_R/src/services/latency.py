@@ -0,0 +1,110 @@
+# python_server/latency.py
+# Medição da latência de cada etapa do processamento (ingestão, gravação, análise, alerta).
+# Cada etapa guarda as últimas `max_samples` medições e o relatório mostra os percentis
+# p50/p95/p99, que revelam as lentidões ocasionais escondidas por uma média.
+# Com um registro de métricas (metrics.py), cada medição também entra no histograma
+# <namespace>_stage_duration_seconds{stage="..."} exposto no endpoint /metrics.
+import json            # Para gravar o resumo em arquivo (lido pelo benchmark).
+import logging
+import os              # Para a troca atômica do arquivo de resumo.
+import threading       # Thread do relatório periódico e proteção das amostras.
+import time            # Relógio de alta resolução.
+from collections import deque
+from contextlib import contextmanager
+
+# --- Configurações Padrão ---
+DEFAULT_MAX_SAMPLES = 10000
+REPORT_INTERVAL_SECONDS = 60
+PERCENTILES = (50, 95, 99)
+
+log = logging.getLogger(__name__)
+
+
+class LatencyRecorder:
+    """Coleta durações por etapa e calcula percentis sobre uma janela limitada de amostras."""
+
+    def __init__(self, max_samples=DEFAULT_MAX_SAMPLES, report_interval=REPORT_INTERVAL_SECONDS,
+                 stats_file=None, registry=None):
+        self.max_samples = max_samples
+        self.stats_file = stats_file
+        self._histogram = None
+        if registry is not None:
+            self._histogram = registry.histogram(
+                "stage_duration_seconds", "Duração de cada etapa do processamento.", ["stage"])
+        self._samples = {}   # etapa -> deque das últimas durações (segundos)
+        self._counts = {}    # etapa -> total de medições desde o início
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        if report_interval:
+            threading.Thread(target=self._report_loop, args=(report_interval,),
+                             name="latency-report", daemon=True).start()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.max_samples)
+                self._counts[stage] = 0
+            samples.append(seconds)
+            self._counts[stage] += 1
+        if self._histogram is not None:
+            self._histogram.labels(stage=stage).observe(seconds)
+
+    @contextmanager
+    def measure(self, stage):
+        """Mede o bloco `with` como uma amostra da etapa."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def summary(self):
+        """Percentis (em milissegundos) de cada etapa, ex.: {"analysis_flood": {"p50_ms": ...}}."""
+        with self._lock:
+            snapshot = {stage: (sorted(samples), self._counts[stage])
+                        for stage, samples in self._samples.items()}
+        summary = {}
+        for stage, (values, count) in sorted(snapshot.items()):
+            stats = {"count": count}
+            for pct in PERCENTILES:
+                stats[f"p{pct}_ms"] = round(percentile(values, pct) * 1000, 3)
+            stats["max_ms"] = round(values[-1] * 1000, 3)
+            summary[stage] = stats
+        return summary
+
+    def format_summary(self):
+        return "\n".join(
+            f"Latência {stage}: n={stats['count']}, p50={stats['p50_ms']:.1f}ms, "
+            f"p95={stats['p95_ms']:.1f}ms, p99={stats['p99_ms']:.1f}ms, máx={stats['max_ms']:.1f}ms"
+            for stage, stats in self.summary().items())
+
+    def save(self, path=None):
+        """Grava o resumo em JSON (troca atômica: o leitor nunca vê um arquivo pela metade)."""
+        path = path or self.stats_file
+        if not path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+        os.replace(temp_path, path)
+
+    def _report_loop(self, interval):
+        while not self._stop.wait(interval):
+            report = self.format_summary()
+            if report:
+                log.info(report)
+            self.save()
+
+    def close(self):
+        self._stop.set()
+        self.save()
+
+
+def percentile(sorted_values, pct):
+    """Percentil pelo método do posto mais próximo (valores já ordenados)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-pct * len(sorted_values) // 100))  # Teto de pct% de n.
+    return sorted_values[int(rank) - 1]
@@ -0,0 +1,45 @@
+# python_server/logging_setup.py
+# Configuração do logging (módulo logging da biblioteca padrão) dos serviços.
+# Substitui os print() do caminho das mensagens: cada linha tem nível (DEBUG/INFO/WARNING/ERROR)
+# e pode sair como texto ou como JSON (uma linha por evento, para coletores de log).
+# Mensagens abaixo do nível configurado (ex.: o payload de cada leitura, em DEBUG) nem são formatadas.
+import json            # Formato JSON Lines.
+import logging
+import sys             # Saída padrão, como os print() substituídos.
+from datetime import datetime
+
+# --- Configurações Padrão ---
+DEFAULT_LEVEL = "INFO"
+DEFAULT_FORMAT = "text"      # "text" ou "json"
+TEXT_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+# Atributos padrão do LogRecord: o que não estiver aqui veio de `extra=` e vira campo do JSON.
+STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por evento: timestamp, nível, logger, thread, mensagem e os campos de `extra`."""
+
+    def format(self, record):
+        event = {
+            "timestamp": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        event.update({key: value for key, value in vars(record).items() if key not in STANDARD_ATTRIBUTES})
+        if record.exc_info:
+            event["exception"] = self.formatException(record.exc_info)
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+def configure_logging(level=DEFAULT_LEVEL, fmt=DEFAULT_FORMAT):
+    """Configura o logger raiz (nível e formato) com saída no stdout; pode ser chamada de novo."""
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if str(fmt).lower() == "json" else logging.Formatter(TEXT_FORMAT))
+    root = logging.getLogger()
+    for old_handler in list(root.handlers):
+        root.removeHandler(old_handler)
+    root.addHandler(handler)
+    root.setLevel(str(level).upper())
@@ -0,0 +1,268 @@
+# python_server/metrics.py
+# Registro de métricas em memória (contadores, medidores e histogramas) exposto em um endpoint
+# HTTP local no formato texto do Prometheus (GET /metrics). Atualizar uma métrica custa um
+# lock e uma soma, sem E/S: o custo fica em quem lê o endpoint, não no caminho das mensagens.
+# Sem dependências externas (não requer o pacote prometheus_client).
+import math            # Bucket +Inf e formatação de valores especiais.
+import threading       # Proteção dos valores e thread do servidor HTTP.
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# --- Configurações Padrão ---
+# Limites (segundos) dos buckets dos histogramas de duração: de 1 ms a 1 min.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+MAX_PROFILE_SECONDS = 60
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+               for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Metric:
+    """Métrica com rótulos opcionais: metric.labels(analysis="flood").inc()."""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames and hasattr(self, "_new_child"):
+            self._default()  # Série sem rótulos aparece (zerada) desde a primeira coleta.
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _default(self):
+        """Filho sem rótulos (métricas declaradas sem labelnames)."""
+        return self.labels()
+
+    def samples(self):
+        """[(sufixo, valores dos rótulos, rótulos extras, valor)] para a exposição."""
+        with self._lock:
+            children = list(self._children.items())
+        return [sample for key, child in sorted(children) for sample in child.samples(key)]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{format_labels(self.labelnames, key, extra)} {format_value(value)}")
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        with self._lock:
+            self.value = float(value)
+
+    def samples(self, key):
+        return [("", key, (), self.value)]
+
+
+class Counter(Metric):
+    """Total que só cresce (ex.: mensagens recebidas); por convenção, o nome termina em _total."""
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class Gauge(Metric):
+    """Valor que sobe e desce (ex.: profundidade da fila)."""
+
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def dec(self, amount=1):
+        self._default().dec(amount)
+
+    def set(self, value):
+        self._default().set(value)
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            self.sum += value
+            self.count += 1
+
+    def samples(self, key):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        samples, cumulative = [], 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            samples.append(("_bucket", key, (("le", format_value(float(bound))),), cumulative))
+        samples.append(("_bucket", key, (("le", "+Inf"),), count))
+        samples.append(("_sum", key, (), total))
+        samples.append(("_count", key, (), count))
+        return samples
+
+
+class Histogram(Metric):
+    """Distribuição de durações em buckets cumulativos (permite calcular percentis no Prometheus)."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+
+class CallbackMetric(Metric):
+    """Métrica lida no momento da coleta: `callback()` retorna o valor ou {valores dos rótulos: valor}."""
+
+    def __init__(self, kind, name, documentation, callback, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.callback = callback
+
+    def samples(self):
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [("", tuple(str(part) for part in key), (), value) for key, value in sorted(values.items())]
+
+
+class MetricsRegistry:
+    """Conjunto de métricas do processo; cada nome é registrado uma única vez."""
+
+    def __init__(self, namespace=""):
+        self.namespace = namespace
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, name, factory):
+        name = f"{self.namespace}_{name}" if self.namespace else name
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory(name)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(name, lambda full_name: Counter(full_name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(name, lambda full_name: Gauge(full_name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(name, lambda full_name: Histogram(full_name, documentation, labelnames, buckets))
+
+    def callback(self, kind, name, documentation, callback, labelnames=()):
+        """Métrica calculada na coleta (ex.: profundidade atual de uma fila)."""
+        return self._register(name, lambda full_name: CallbackMetric(kind, full_name, documentation,
+                                                                      callback, labelnames))
+
+    def render(self):
+        """Todas as métricas no formato texto de exposição do Prometheus."""
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:  # Uma métrica com callback quebrado não derruba as demais.
+                lines.append(f"# ERRO ao coletar {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+def start_metrics_server(registry, port, host="127.0.0.1", profiler=None):
+    """
+    Inicia o endpoint HTTP em uma thread: GET /metrics retorna as métricas. Com `profiler`
+    (profiler.SamplingProfiler), GET /debug/profile?seconds=N amostra as pilhas por N segundos
+    e retorna as pilhas agregadas (formato "folded" dos flame graphs). Retorna o servidor.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/metrics":
+                self._reply(200, registry.render(), CONTENT_TYPE)
+            elif url.path == "/debug/profile" and profiler is not None:
+                query = parse_qs(url.query)
+                try:
+                    seconds = min(float(query.get("seconds", ["10"])[0]), MAX_PROFILE_SECONDS)
+                except ValueError:
+                    self._reply(400, "Parâmetro seconds inválido.\n")
+                    return
+                stacks = profiler.capture(seconds)
+                self._reply(200, profiler.format_folded(stacks))
+            else:
+                self._reply(404, "Não encontrado.\n")
+
+        def _reply(self, status, body, content_type="text/plain; charset=utf-8"):
+            data = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass  # Sem uma linha de log a cada coleta do Prometheus.
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,137 @@
+# python_server/model_cache.py
+# Cache em disco dos modelos treinados a partir dos datasets históricos.
+# Cada artefato é identificado pelo hash (SHA-256) do conteúdo do dataset e dos hiperparâmetros:
+# enquanto nenhum dos dois muda, o modelo é apenas carregado do disco; quando o dataset é
+# alterado, o próximo uso detecta a mudança, treina de novo e grava um novo artefato, sem
+# reiniciar o processo.
+import hashlib         # Hash do dataset + hiperparâmetros.
+import json            # Serialização estável dos hiperparâmetros.
+import logging
+import os              # Caminhos e substituição atômica dos artefatos.
+import tempfile        # Arquivo temporário da gravação atômica.
+import threading       # Várias threads de análise usam o mesmo modelo.
+import time            # Intervalo entre verificações do dataset.
+
+import numpy as np     # Artefatos no formato .npz.
+
+# --- Configurações Padrão ---
+ARTIFACT_FORMAT_VERSION = 1         # Mude quando o formato dos arrays salvos mudar.
+RELOAD_CHECK_INTERVAL_SECONDS = 5.0
+
+log = logging.getLogger(__name__)
+
+
+def artifact_key(dataset_path, params):
+    """Hash do conteúdo do dataset, dos hiperparâmetros e da versão do formato do artefato."""
+    digest = hashlib.sha256()
+    with open(dataset_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    digest.update(json.dumps({"params": params, "format": ARTIFACT_FORMAT_VERSION},
+                             sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class ModelArtifactCache:
+    """Pasta de artefatos <nome>_<hash>.npz (arrays NumPy, sem pickle)."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path_for(self, name, key):
+        return os.path.join(self.directory, f"{name}_{key}.npz")
+
+    def load(self, name, key):
+        """Arrays do artefato, ou None se ainda não existir (ou estiver corrompido)."""
+        path = self.path_for(name, key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as artifact:
+                return {name: artifact[name] for name in artifact.files}
+        except (OSError, ValueError) as e:
+            log.warning("Artefato de modelo inválido em %s (%s); será treinado novamente.", path, e)
+            return None
+
+    def save(self, name, key, arrays):
+        """Grava o artefato em um arquivo temporário e o renomeia (leitores nunca veem um .npz parcial)."""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".npz", dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, self.path_for(name, key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return self.path_for(name, key)
+
+
+class CachedModel:
+    """
+    Modelo ligado a um dataset: carregado no primeiro uso e recarregado quando o dataset muda.
+    `train()` retorna o modelo; `to_arrays(modelo)` e `from_arrays(arrays)` convertem de/para o artefato.
+    """
+
+    def __init__(self, name, dataset_path, params, train, to_arrays, from_arrays, cache,
+                 check_interval=RELOAD_CHECK_INTERVAL_SECONDS):
+        self.name = name
+        self.dataset_path = dataset_path
+        self.params = params
+        self.train = train
+        self.to_arrays = to_arrays
+        self.from_arrays = from_arrays
+        self.cache = cache
+        self.check_interval = check_interval
+        self.key = None
+        self._model = None
+        self._signature = None   # (mtime, tamanho) do dataset na última verificação.
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Modelo atual; verifica o dataset no máximo a cada `check_interval` segundos."""
+        if self._model is not None and time.monotonic() < self._next_check:
+            return self._model
+        with self._lock:
+            self._next_check = time.monotonic() + self.check_interval
+            stat = os.stat(self.dataset_path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if self._model is None or signature != self._signature:
+                self._signature = signature
+                try:
+                    key = artifact_key(self.dataset_path, self.params)
+                    if key != self.key:
+                        self._model = self._load_or_train(key)
+                        self.key = key
+                except Exception as e:
+                    if self._model is None:
+                        raise
+                    # Dataset inválido (ex.: edição pela metade): segue com o modelo anterior
+                    # e tenta de novo na próxima mudança do arquivo.
+                    log.error("Erro ao treinar o modelo '%s' com o dataset alterado (%s); "
+                              "mantendo o modelo anterior (%s).", self.name, e, self.key)
+            return self._model
+
+    def _load_or_train(self, key, force=False):
+        arrays = None if force else self.cache.load(self.name, key)
+        if arrays is not None:
+            log.info("Modelo '%s' carregado do cache (%s).", self.name, key)
+            return self.from_arrays(arrays)
+        started = time.perf_counter()
+        model = self.train()
+        path = self.cache.save(self.name, key, self.to_arrays(model))
+        log.info("Modelo '%s' treinado em %.2f s e salvo em %s.", self.name, time.perf_counter() - started, path)
+        return model
+
+    def retrain(self):
+        """Treina de novo mesmo que já exista um artefato para o dataset atual (CLI de treinamento)."""
+        with self._lock:
+            key = artifact_key(self.dataset_path, self.params)
+            self._model = self._load_or_train(key, force=True)
+            self.key = key
+            stat = os.stat(self.dataset_path)
+            self._signature = (stat.st_mtime_ns, stat.st_size)
+            self._next_check = time.monotonic() + self.check_interval
+            return self._model
@@ -0,0 +1,187 @@
+# python_server/pipeline.py
+# Pipeline assíncrono entre a ingestão (callback MQTT) e a análise de risco.
+# O callback on_message apenas decodifica e grava a leitura; as análises de enchente e
+# incêndio são enfileiradas em uma fila limitada e executadas em paralelo por um pool de
+# threads, sem travar o loop de rede do paho (keepalive) quando uma análise demora.
+import logging
+import threading       # Threads de análise e sincronização da fila.
+import time            # Para medir a duração das análises e o intervalo do relatório.
+from collections import deque
+
+# --- Configurações Padrão ---
+DEFAULT_QUEUE_SIZE = 100
+DEFAULT_WORKERS = 2
+REPORT_INTERVAL_SECONDS = 60
+
+# Políticas quando a fila está cheia (ou, em "coalesce", já existe um pedido igual pendente):
+#   "coalesce"    -> substitui o pedido pendente do mesmo dispositivo/análise (a análise sempre lê
+#                    a janela mais recente do armazenamento, então o pedido antigo é redundante);
+#                    se a fila estiver cheia, descarta o mais antigo.
+#   "drop_oldest" -> descarta o pedido mais antigo da fila.
+#   "drop_newest" -> descarta o pedido que acabou de chegar.
+#   "block"       -> espera até haver espaço (contrapressão direta sobre o callback MQTT).
+QUEUE_POLICIES = ("coalesce", "drop_oldest", "drop_newest", "block")
+
+log = logging.getLogger(__name__)
+
+
+class AnalysisJob:
+    """Pedido de análise de um tipo (`analysis`) para uma leitura."""
+
+    def __init__(self, analysis, data, features=None):
+        self.analysis = analysis
+        self.data = data
+        self.features = features
+        self.key = (data.get('device_id'), analysis)
+        self.created_at = time.monotonic()
+
+
+class BoundedJobQueue:
+    """Fila limitada com política de descarte/coalescência e métricas de profundidade."""
+
+    def __init__(self, maxsize=DEFAULT_QUEUE_SIZE, policy="coalesce"):
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f"Política de fila desconhecida: {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self._entries = deque()   # [job] (lista para permitir substituição no lugar)
+        self._pending = {}        # chave -> entrada pendente (política "coalesce")
+        self._condition = threading.Condition()
+        self._closed = False
+        self.max_depth = 0
+
+    def __len__(self):
+        with self._condition:
+            return len(self._entries)
+
+    def put(self, job):
+        """Enfileira o pedido. Retorna "queued", "coalesced", "dropped" ou "replaced_oldest"."""
+        with self._condition:
+            if self._closed:   # Nenhum worker vai retirar pedidos de uma fila encerrada.
+                return "dropped"
+            if self.policy == "coalesce" and job.key in self._pending:
+                self._pending[job.key][0] = job
+                return "coalesced"
+
+            outcome = "queued"
+            if len(self._entries) >= self.maxsize:
+                if self.policy == "drop_newest":
+                    return "dropped"
+                if self.policy == "block":
+                    while len(self._entries) >= self.maxsize and not self._closed:
+                        self._condition.wait()
+                    if self._closed:
+                        return "dropped"
+                else:
+                    oldest = self._entries.popleft()
+                    self._pending.pop(oldest[0].key, None)
+                    outcome = "replaced_oldest"
+
+            entry = [job]
+            self._entries.append(entry)
+            if self.policy == "coalesce":
+                self._pending[job.key] = entry
+            self.max_depth = max(self.max_depth, len(self._entries))
+            self._condition.notify_all()
+            return outcome
+
+    def get(self):
+        """Retira o próximo pedido (bloqueia); retorna None quando a fila é encerrada."""
+        with self._condition:
+            while not self._entries and not self._closed:
+                self._condition.wait()
+            if not self._entries:
+                return None
+            entry = self._entries.popleft()
+            if self._pending.get(entry[0].key) is entry:
+                del self._pending[entry[0].key]
+            self._condition.notify_all()
+            return entry[0]
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+class AnalysisPipeline:
+    """
+    Encaminha cada leitura para os handlers de análise (ex.: {"flood": ..., "fire": ...})
+    através da fila limitada, executando-os em `workers` threads.
+    Cada handler recebe (data, features).
+    """
+
+    def __init__(self, handlers, queue_size=DEFAULT_QUEUE_SIZE, workers=DEFAULT_WORKERS,
+                 policy="coalesce", report_interval=REPORT_INTERVAL_SECONDS):
+        self.handlers = handlers
+        self.queue = BoundedJobQueue(queue_size, policy)
+        self._lock = threading.Lock()
+        self.counters = {"submitted": 0, "queued": 0, "coalesced": 0, "dropped": 0,
+                         "processed": 0, "failed": 0}
+        self.total_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+        self._stop = threading.Event()
+        self._threads = [threading.Thread(target=self._work, name=f"analysis-{i + 1}", daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+        if report_interval:
+            threading.Thread(target=self._report_loop, args=(report_interval,),
+                             name="pipeline-report", daemon=True).start()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def submit(self, data, features=None, analyses=None):
+        """Enfileira as análises (todas por padrão) de uma leitura sem bloquear o chamador."""
+        for analysis in analyses or self.handlers:
+            self._count("submitted")
+            outcome = self.queue.put(AnalysisJob(analysis, data, features))
+            if outcome == "replaced_oldest":
+                self._count("dropped")
+                outcome = "queued"
+            self._count(outcome)
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            started = time.monotonic()
+            try:
+                self.handlers[job.analysis](job.data, job.features)
+                self._count("processed")
+            except Exception as e:
+                self._count("failed")
+                log.exception("Erro na análise '%s': %s", job.analysis, e)
+            finally:
+                with self._lock:
+                    self.total_wait_seconds += started - job.created_at
+                    self.total_run_seconds += time.monotonic() - started
+
+    def stats(self):
+        """Retrato das métricas do pipeline (contadores, profundidade e tempos médios)."""
+        with self._lock:
+            stats = dict(self.counters)
+            finished = stats["processed"] + stats["failed"]
+            stats["avg_wait_seconds"] = self.total_wait_seconds / finished if finished else 0.0
+            stats["avg_run_seconds"] = self.total_run_seconds / finished if finished else 0.0
+        stats["queue_depth"] = len(self.queue)
+        stats["max_queue_depth"] = self.queue.max_depth
+        return stats
+
+    def _report_loop(self, interval):
+        while not self._stop.wait(interval):
+            stats = self.stats()
+            log.info("Pipeline: fila=%d (máx %d), processadas=%d, falhas=%d, coalescidas=%d, "
+                     "descartadas=%d, espera média=%.2fs, análise média=%.2fs",
+                     stats['queue_depth'], stats['max_queue_depth'], stats['processed'], stats['failed'],
+                     stats['coalesced'], stats['dropped'], stats['avg_wait_seconds'], stats['avg_run_seconds'])
+
+    def close(self, timeout=None):
+        """Encerra o pipeline; as análises já enfileiradas são concluídas antes da saída."""
+        self._stop.set()
+        self.queue.close()
+        for thread in self._threads:
+            thread.join(timeout)
@@ -0,0 +1,91 @@
+# python_server/profiler.py
+# Profiler por amostragem, acionado sob demanda no processo em execução.
+# Durante a captura, uma thread lê a pilha de todas as outras threads a cada `interval`
+# segundos (sys._current_frames) e conta as pilhas repetidas; fora da captura não há custo.
+# O resultado sai no formato "folded" (uma pilha por linha + contagem), aceito por
+# flamegraph.pl e speedscope, e como lista das funções com mais amostras.
+import os              # Pasta dos arquivos de captura.
+import signal          # Captura acionada por sinal (SIGUSR1).
+import sys             # Pilhas das threads.
+import threading       # Thread de amostragem.
+import time            # Intervalo entre amostras.
+from collections import Counter
+from datetime import datetime
+
+# --- Configurações Padrão ---
+DEFAULT_INTERVAL_SECONDS = 0.005
+DEFAULT_CAPTURE_SECONDS = 10.0
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Amostra as pilhas das threads do processo; uma captura por vez."""
+
+    def __init__(self, interval=DEFAULT_INTERVAL_SECONDS):
+        self.interval = interval
+        self._capture_lock = threading.Lock()
+
+    def capture(self, seconds=DEFAULT_CAPTURE_SECONDS):
+        """Amostra por `seconds` segundos e retorna Counter {pilha "raiz;...;folha" (por thread): amostras}."""
+        with self._capture_lock:
+            stacks = Counter()
+            own_thread = threading.get_ident()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread:
+                        continue
+                    labels = []
+                    while frame is not None:
+                        labels.append(frame_label(frame))
+                        frame = frame.f_back
+                    labels.append(names.get(thread_id, str(thread_id)))
+                    stacks[";".join(reversed(labels))] += 1
+                time.sleep(self.interval)
+            return stacks
+
+    @staticmethod
+    def format_folded(stacks):
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    @staticmethod
+    def top_functions(stacks, limit=20):
+        """Funções no topo das pilhas (tempo próprio), das mais frequentes: [(função, fração)]."""
+        own = Counter()
+        for stack, count in stacks.items():
+            own[stack.rsplit(";", 1)[-1]] += count
+        total = sum(own.values()) or 1
+        return [(function, count / total) for function, count in own.most_common(limit)]
+
+    def capture_to_file(self, seconds, directory):
+        """Captura e grava <pasta>/profile_AAAAMMDD_HHMMSS.folded; retorna (caminho, pilhas)."""
+        stacks = self.capture(seconds)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, datetime.now().strftime("profile_%Y%m%d_%H%M%S.folded"))
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.format_folded(stacks))
+        return path, stacks
+
+    def install_signal_handler(self, directory, seconds=DEFAULT_CAPTURE_SECONDS, on_done=None,
+                               signum=getattr(signal, "SIGUSR1", None)):
+        """
+        `kill -USR1 <pid>` inicia uma captura em segundo plano gravada em `directory`;
+        `on_done(caminho, pilhas)` é chamado ao final. Retorna False onde não há SIGUSR1 (Windows).
+        """
+        if signum is None:
+            return False
+
+        def handler(received, frame):
+            def run():
+                path, stacks = self.capture_to_file(seconds, directory)
+                if on_done is not None:
+                    on_done(path, stacks)
+            threading.Thread(target=run, name="profiler", daemon=True).start()
+
+        signal.signal(signum, handler)
+        return True
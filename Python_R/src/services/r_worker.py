@@ -0,0 +1,169 @@
+# python_server/r_worker.py
+# Pool de workers R persistentes (r_analysis/analysis_worker.R).
+# Cada worker carrega as bibliotecas e treina os modelos uma única vez; o Python
+# conversa com ele por stdin/stdout (uma linha JSON por pedido), evitando iniciar
+# um novo processo Rscript para cada mensagem MQTT.
+import itertools       # Para gerar ids de pedido.
+import json            # Protocolo de comunicação com o R.
+import logging
+import queue           # Para ler o stdout do R com timeout e controlar workers livres.
+import subprocess      # Para iniciar o processo Rscript.
+import threading       # Threads de leitura do stdout/stderr do R.
+
+# --- Configurações Padrão ---
+STARTUP_TIMEOUT_SECONDS = 180   # Tempo máximo para carregar bibliotecas e treinar os modelos.
+REQUEST_TIMEOUT_SECONDS = 60    # Mesmo limite usado no run_r_script.
+
+log = logging.getLogger(__name__)
+
+
+class RWorkerError(Exception):
+    """Falha de comunicação com um worker R (timeout, queda do processo ou erro na análise)."""
+
+
+class RWorkerTimeout(RWorkerError):
+    """O worker R não respondeu dentro do tempo limite."""
+
+
+class RWorker:
+    """Um processo Rscript de longa duração executando analysis_worker.R."""
+
+    def __init__(self, script_path, r_analysis_dir, name="r-worker",
+                 startup_timeout=STARTUP_TIMEOUT_SECONDS):
+        self.script_path = script_path
+        self.r_analysis_dir = r_analysis_dir
+        self.name = name
+        self.startup_timeout = startup_timeout
+        self.process = None
+        self.restarts = 0
+        self._responses = None
+        self._ids = itertools.count(1)
+
+    def start(self):
+        """Inicia o processo e aguarda o fim do treinamento dos modelos."""
+        self.process = subprocess.Popen(
+            ["Rscript", self.script_path, self.r_analysis_dir],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            text=True, encoding='utf-8', bufsize=1)
+        self._responses = queue.Queue()
+        threading.Thread(target=self._read_stdout, args=(self.process, self._responses),
+                         daemon=True).start()
+        threading.Thread(target=self._read_stderr, args=(self.process,), daemon=True).start()
+
+        ready = self._next_response(self.startup_timeout)
+        if ready.get("status") != "ready":
+            self.stop()
+            raise RWorkerError(f"{self.name}: resposta inesperada ao iniciar: {ready}")
+        log.info("Worker R '%s' pronto (modelos carregados).", self.name)
+
+    @staticmethod
+    def _read_stdout(process, responses):
+        for line in process.stdout:
+            line = line.strip()
+            if line:
+                responses.put(line)
+        responses.put(None)  # Fim do stdout: o processo terminou.
+
+    def _read_stderr(self, process):
+        for line in process.stderr:
+            line = line.rstrip()
+            if line:
+                # message()/warning() do R: avisos de carregamento, não erros (esses vêm na resposta).
+                log.debug("[%s] %s", self.name, line)
+
+    def _next_response(self, timeout):
+        try:
+            line = self._responses.get(timeout=timeout)
+        except queue.Empty:
+            raise RWorkerTimeout(f"{self.name}: sem resposta em {timeout} s.")
+        if line is None:
+            raise RWorkerError(f"{self.name}: o processo R terminou inesperadamente.")
+        try:
+            return json.loads(line)
+        except json.JSONDecodeError:
+            raise RWorkerError(f"{self.name}: resposta inválida do R: {line}")
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def request(self, analysis, data, features=None, timeout=REQUEST_TIMEOUT_SECONDS, forecasts=None):
+        """
+        Envia um pedido de análise e aguarda o resultado.
+        `data` é um dicionário de colunas, ex.: {"timestamp": [...], "water_level": [...]}.
+        `features` (opcional) substitui as features do modelo calculadas a partir da última leitura.
+        `forecasts` (opcional) traz as previsões já calculadas (ex.: {"predicted_smoke": 12.3}),
+        dispensando o auto.arima no R.
+        Em caso de timeout ou queda o processo é reiniciado antes de propagar o erro.
+        """
+        if not self.is_alive():
+            self.restart()
+        request_id = next(self._ids)
+        message = json.dumps({"id": request_id, "analysis": analysis, "data": data,
+                              "features": features or {}, "forecasts": forecasts or {}})
+        try:
+            self.process.stdin.write(message + "\n")
+            self.process.stdin.flush()
+            response = self._next_response(timeout)
+        except (RWorkerError, OSError) as e:
+            log.warning("Worker R '%s' falhou (%s). Reiniciando...", self.name, e)
+            self.restart()
+            if isinstance(e, RWorkerError):
+                raise
+            raise RWorkerError(str(e)) from e
+
+        if response.get("id") != request_id:
+            self.restart()
+            raise RWorkerError(f"{self.name}: resposta fora de ordem: {response}")
+        if response.get("status") != "ok":
+            raise RWorkerError(f"{self.name}: erro na análise: {response.get('error')}")
+        return response.get("result", {})
+
+    def restart(self):
+        self.stop()
+        self.restarts += 1
+        self.start()
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()  # O worker sai do laço ao ver o fim do stdin.
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+
+class RWorkerPool:
+    """Conjunto de workers R; cada pedido usa o primeiro worker livre."""
+
+    def __init__(self, size, script_path, r_analysis_dir, request_timeout=REQUEST_TIMEOUT_SECONDS):
+        self.request_timeout = request_timeout
+        self.workers = [RWorker(script_path, r_analysis_dir, name=f"r-worker-{i + 1}")
+                        for i in range(size)]
+        self._idle = queue.Queue()
+        try:
+            for worker in self.workers:
+                worker.start()
+                self._idle.put(worker)
+        except Exception:
+            self.close()
+            raise
+
+    def analyze(self, analysis, rows, features=None, forecasts=None):
+        """Executa a análise ("flood" ou "fire") sobre uma lista de leituras (dicionários)."""
+        columns = {}
+        for row in rows:
+            for key, value in row.items():
+                columns.setdefault(key, []).append(value)
+        worker = self._idle.get()
+        try:
+            return worker.request(analysis, columns, features, timeout=self.request_timeout,
+                                  forecasts=forecasts)
+        finally:
+            self._idle.put(worker)
+
+    def close(self):
+        for worker in self.workers:
+            worker.stop()
@@ -0,0 +1,194 @@
+# python_server/results_store.py
+# Histórico versionado dos resultados das análises de risco.
+# Cada resultado recebe um número de sequência crescente (seq) e é gravado em uma única
+# transação SQLite: quem lê vê o resultado inteiro ou nada (sem leituras de arquivo pela metade).
+# Guarda os últimos RISK_HISTORY_PER_DEVICE resultados de cada dispositivo e análise, para
+# consultas "último resultado", "resultados desde o seq N" e gráficos do risco ao longo do tempo.
+# Os resultados do reprocessamento em lote (backfill.py) ficam marcados e não entram nesse limite.
+import json            # Para serializar os resultados.
+import os              # Para caminhos de arquivo e gravação atômica.
+import sqlite3         # Banco de dados embutido (modo WAL).
+import tempfile        # Arquivo temporário da gravação atômica.
+import threading       # Para proteger o acesso concorrente à conexão.
+from datetime import datetime
+
+# --- Configurações Padrão ---
+RESULTS_DB_NAME = "risk_results.db"
+DEFAULT_HISTORY_PER_DEVICE = 1000
+# Níveis de risco em ordem crescente (usados para representar o risco como número nos gráficos).
+RISK_LEVELS = ("Baixo", "Moderado", "Alto", "Muito Alto")
+
+
+class ResultStore:
+    """Resultados das análises com seq global, em um banco SQLite em modo WAL."""
+
+    def __init__(self, db_path, history_per_device=DEFAULT_HISTORY_PER_DEVICE):
+        self.db_path = db_path
+        self.history_per_device = history_per_device
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # AUTOINCREMENT: um seq nunca é reutilizado, mesmo depois que o histórico antigo é apagado.
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                analysis TEXT NOT NULL,
+                device_id TEXT NOT NULL,
+                timestamp TEXT,
+                risk_level TEXT,
+                payload TEXT NOT NULL,
+                backfill INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        # Bancos criados antes da coluna "backfill": os resultados do backfill.py já traziam a marca no JSON.
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(results)")}
+        if "backfill" not in columns:
+            with self._conn:
+                self._conn.execute("ALTER TABLE results ADD COLUMN backfill INTEGER NOT NULL DEFAULT 0")
+                self._conn.execute("UPDATE results SET backfill = 1 WHERE json_extract(payload, '$.backfill')")
+        # Índices de "desde o seq N", do limite por dispositivo e das consultas por período.
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_results_device_seq ON results (analysis, device_id, seq)")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_results_device_timestamp ON results (analysis, device_id, timestamp)")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_results_timestamp ON results (analysis, timestamp)")
+        self._conn.commit()
+
+    @staticmethod
+    def _row(analysis, device_id, result):
+        timestamp = result.get('timestamp_analysis') or datetime.now().isoformat()
+        return (analysis, device_id or '', str(timestamp), result.get('risk_level'),
+                json.dumps(result, ensure_ascii=False))
+
+    def _trim_locked(self, analysis, device_id):
+        # O histórico é uma série no tempo: mantém os resultados mais recentes pelo timestamp da
+        # análise (e não pelo seq), para que um reprocessamento de dados antigos (backfill.py)
+        # não apague os resultados atuais. Os resultados do backfill nunca são apagados aqui.
+        if self.history_per_device > 0:
+            self._conn.execute(
+                "DELETE FROM results WHERE seq IN ("
+                " SELECT seq FROM results WHERE analysis = ? AND device_id = ? AND backfill = 0"
+                " ORDER BY timestamp DESC, seq DESC LIMIT -1 OFFSET ?)",
+                (analysis, device_id, self.history_per_device))
+
+    def publish(self, analysis, device_id, result):
+        """Grava o resultado (com o histórico do dispositivo já limitado) e retorna o seq atribuído."""
+        row = self._row(analysis, device_id, result)
+        with self._lock:
+            with self._conn:  # Uma transação: inserção e limpeza do histórico.
+                seq = self._conn.execute(
+                    "INSERT INTO results (analysis, device_id, timestamp, risk_level, payload)"
+                    " VALUES (?, ?, ?, ?, ?)", row).lastrowid
+                self._trim_locked(analysis, row[1])
+        return seq
+
+    def publish_many(self, analysis, results, replace=False, backfill=False):
+        """
+        Grava em lote os resultados (cada um com seu 'device_id') em uma única transação;
+        o histórico de cada dispositivo é limitado uma vez ao final. Com `replace`, apaga antes
+        os resultados já gravados de cada dispositivo no mesmo intervalo de tempo (reprocessamento).
+        Com `backfill`, os resultados ficam marcados como reprocessamento e fora do limite do histórico.
+        Retorna quantos resultados foram gravados.
+        """
+        rows = [self._row(analysis, result.get('device_id'), result) for result in results]
+        if not rows:
+            return 0
+        with self._lock:
+            with self._conn:
+                if replace:
+                    spans = {}
+                    for _, device_id, timestamp, _, _ in rows:
+                        first, last = spans.get(device_id, (timestamp, timestamp))
+                        spans[device_id] = (min(first, timestamp), max(last, timestamp))
+                    self._conn.executemany(
+                        "DELETE FROM results WHERE analysis = ? AND device_id = ?"
+                        " AND timestamp >= ? AND timestamp <= ?",
+                        [(analysis, device_id, first, last) for device_id, (first, last) in spans.items()])
+                self._conn.executemany(
+                    "INSERT INTO results (analysis, device_id, timestamp, risk_level, payload, backfill)"
+                    " VALUES (?, ?, ?, ?, ?, ?)", [row + (int(backfill),) for row in rows])
+                if not backfill:
+                    for device_id in {row[1] for row in rows}:
+                        self._trim_locked(analysis, device_id)
+        return len(rows)
+
+    def _select(self, where, params, order="seq", limit=None):
+        sql = f"SELECT seq, analysis, payload FROM results{where} ORDER BY {order}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(json.loads(payload), seq=seq, analysis=analysis) for seq, analysis, payload in rows]
+
+    @staticmethod
+    def _filters(analysis=None, device_id=None, clauses=None, params=None):
+        clauses, params = list(clauses or []), list(params or [])
+        if analysis is not None:
+            clauses.append("analysis = ?")
+            params.append(analysis)
+        if device_id is not None:
+            clauses.append("device_id = ?")
+            params.append(device_id)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def latest(self, analysis=None, device_id=None):
+        """Resultado mais recente (timestamp da análise; empates pelo maior seq) da análise/dispositivo, ou None."""
+        where, params = self._filters(analysis, device_id)
+        rows = self._select(where, params, order="timestamp DESC, seq DESC", limit=1)
+        return rows[0] if rows else None
+
+    def since(self, seq, analysis=None, device_id=None, limit=None):
+        """Resultados com seq maior que `seq`, em ordem de publicação."""
+        where, params = self._filters(analysis, device_id, ["seq > ?"], [seq or 0])
+        return self._select(where, params, limit=limit)
+
+    def history(self, analysis, device_id=None, since=None, until=None):
+        """Resultados da análise no período (timestamp da análise), em ordem cronológica."""
+        clauses, params = [], []
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(since.isoformat() if isinstance(since, datetime) else str(since))
+        if until is not None:
+            clauses.append("timestamp <= ?")
+            params.append(until.isoformat() if isinstance(until, datetime) else str(until))
+        where, params = self._filters(analysis, device_id, clauses, params)
+        return self._select(where, params, order="timestamp, seq")
+
+    def last_seq(self, analysis=None):
+        """Maior seq gravado (0 se não houver resultados)."""
+        where, params = self._filters(analysis)
+        with self._lock:
+            return self._conn.execute(f"SELECT MAX(seq) FROM results{where}", params).fetchone()[0] or 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def write_json_atomic(data, path):
+    """
+    Grava o JSON em um arquivo temporário da mesma pasta e o renomeia sobre `path`:
+    leitores concorrentes veem o arquivo antigo ou o novo, nunca um arquivo pela metade.
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def risk_level_value(risk_level):
+    """Posição do nível de risco em RISK_LEVELS (None para níveis desconhecidos)."""
+    try:
+        return RISK_LEVELS.index(risk_level)
+    except ValueError:
+        return None
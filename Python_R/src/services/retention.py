@@ -0,0 +1,117 @@
+# python_server/retention.py
+# Política de retenção do histórico de leituras, em três camadas:
+#   1. leituras brutas no armazenamento ativo (sensor_store.py) pelos últimos `raw_days` dias;
+#   2. agregados por intervalo (rollups.py), que continuam no armazenamento ativo depois que as
+#      leituras brutas saem dele; cada resolução tem a própria retenção (ex.: 1 min por 90 dias,
+#      15 min e 1 h sem limite);
+#   3. arquivo frio (sensor_archive.py): as leituras brutas mais antigas, compactadas por dispositivo e dia.
+# A compactação roda em uma thread própria, um dispositivo/dia por vez: grava o arquivo frio
+# e só então apaga as leituras do armazenamento ativo, em transações curtas que não travam a ingestão.
+import logging
+import os              # Arquivo de trava da compactação.
+import threading       # Thread da compactação periódica.
+import time            # Duração de cada execução.
+from datetime import datetime, timedelta
+
+try:
+    import fcntl       # Trava entre processos (instâncias que compartilham o TEMP_DATA_DIR).
+except ImportError:
+    fcntl = None
+
+# --- Configurações Padrão ---
+DEFAULT_RAW_RETENTION_DAYS = 30
+DEFAULT_ROLLUP_RETENTION = "60:90"         # resolução em segundos:dias; as não listadas ficam para sempre.
+DEFAULT_INTERVAL_SECONDS = 3600
+LOCK_FILE_NAME = ".compaction.lock"
+
+log = logging.getLogger(__name__)
+
+
+def parse_rollup_retention(text):
+    """'60:90,900:365' -> {60: 90, 900: 365} (dias de retenção por resolução; 0 = sem limite)."""
+    retention = {}
+    for item in (text or "").split(","):
+        if not item.strip():
+            continue
+        resolution, _, days = item.partition(":")
+        try:
+            retention[int(resolution)] = int(days)
+        except ValueError:
+            raise ValueError(f"Retenção de agregados inválida: {item!r} (use resolução:dias)") from None
+    return retention
+
+
+class Compactor:
+    """
+    Move para o arquivo frio as leituras brutas mais antigas que `raw_days` dias (0 = nunca)
+    e apaga os agregados vencidos de cada resolução. Com `interval`, roda periodicamente em segundo plano.
+    """
+
+    def __init__(self, store, archive, raw_days=DEFAULT_RAW_RETENTION_DAYS, rollup_retention=None,
+                 interval=DEFAULT_INTERVAL_SECONDS, registry=None):
+        self.store = store
+        self.archive = archive
+        self.raw_days = raw_days
+        self.rollup_retention = dict(rollup_retention or {})
+        self.lock_path = os.path.join(archive.directory, LOCK_FILE_NAME)
+        self._archived = self._duration = None
+        if registry is not None:
+            self._archived = registry.counter(
+                "sensor_readings_archived_total", "Leituras brutas movidas para o arquivo frio.")
+            self._duration = registry.histogram(
+                "compaction_duration_seconds", "Duração de cada execução da compactação.")
+        self._stop = threading.Event()
+        self._thread = None
+        if interval:
+            self._thread = threading.Thread(target=self._run_loop, args=(interval,),
+                                            name="compaction", daemon=True)
+            self._thread.start()
+
+    def run_once(self, now=None):
+        """Executa uma compactação; retorna {'days', 'readings'} arquivados (None se outra instância já está compactando)."""
+        now = now or datetime.now()
+        with open(self.lock_path, 'a') as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return None
+            started = time.perf_counter()
+            stats = {'days': 0, 'readings': 0}
+            if self.raw_days:
+                before = (now - timedelta(days=self.raw_days)).date().isoformat()
+                for key, day in self.store.expired_days(before):
+                    if self._stop.is_set():
+                        break
+                    records = self.store.read_day(key, day)
+                    if records:
+                        self.archive.write(records)
+                    self.store.delete_day(key, day)
+                    stats['days'] += 1
+                    stats['readings'] += len(records)
+                    if self._archived is not None:
+                        self._archived.inc(len(records))
+            for resolution, days in sorted(self.rollup_retention.items()):
+                if days and not self._stop.is_set():
+                    self.store.prune_rollups(resolution, (now - timedelta(days=days)).date().isoformat())
+            if self._duration is not None:
+                self._duration.observe(time.perf_counter() - started)
+            return stats
+
+    def _run_loop(self, interval):
+        while True:
+            try:
+                stats = self.run_once()
+                if stats and stats['days']:
+                    log.info("Compactação: %d leituras de %d dispositivo(s)/dia(s) movidas para o arquivo frio.",
+                             stats['readings'], stats['days'])
+            except Exception:
+                log.exception("Falha na compactação do histórico de leituras.")
+            if self._stop.wait(interval):
+                return
+
+    def close(self):
+        """Interrompe a compactação (depois do dispositivo/dia em andamento)."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,444 @@
+# python_server/risk_engine.py
+# Motor de análise de risco em Python/NumPy, equivalente a flood_analysis.R e fire_analysis.R.
+# Os classificadores Random Forest são carregados do cache de artefatos (model_cache.py) no
+# primeiro uso e treinados só quando o dataset histórico muda; as previsões de 1 passo à
+# frente são calculadas com NumPy, sem depender do Rscript nem de novos processos.
+#
+# Treinamento offline dos artefatos (ex.: depois de atualizar os datasets):
+#   python risk_engine.py --train [--force]
+# Verificação de paridade com as saídas gravadas pelos scripts R:
+#   python risk_engine.py --parity
+import argparse        # Para a linha de comando de verificação de paridade.
+import json            # Para ler as saídas gravadas pelo R.
+import os              # Para caminhos de arquivo.
+from datetime import datetime
+
+import numpy as np     # Cálculos vetorizados (árvores, votação e previsões).
+import pandas as pd    # Leitura dos datasets históricos.
+
+# Artefatos dos modelos treinados, identificados pelo hash do dataset e dos hiperparâmetros.
+from model_cache import ModelArtifactCache, CachedModel, RELOAD_CHECK_INTERVAL_SECONDS
+from logging_setup import configure_logging
+
+# --- Configurações do Modelo (mesmas dos scripts R) ---
+RISK_LEVELS = ["Baixo", "Moderado", "Alto", "Muito Alto"]
+N_TREES = 100
+FLOOD_SEED = 123
+FIRE_SEED = 456
+MIN_POINTS_FOR_FORECAST = 5
+
+FLOOD_FEATURES = ['water_level_avg_24h', 'rainfall_total_24h',
+                  'water_level_change_12h', 'previous_flood_event_in_region']
+FIRE_FEATURES = ['temperature_avg_24h', 'humidity_avg_24h', 'wind_speed_avg_24h',
+                 'vegetation_dryness_index', 'smoke_concentration_avg_6h']
+
+# Valores fixos usados pelos scripts R para as features que o sensor não fornece.
+FLOOD_PLACEHOLDERS = {'water_level_change_12h': 0, 'previous_flood_event_in_region': 0}
+FIRE_PLACEHOLDERS = {'wind_speed_avg_24h': 10, 'vegetation_dryness_index': 0.5}
+
+# Valor crítico (5%) do teste KPSS usado pelo auto.arima para decidir a diferenciação.
+KPSS_CRITICAL_VALUE = 0.463
+
+
+# --- Random Forest (classificação) ---
+
+class DecisionTree:
+    """Árvore CART (índice de Gini) com amostragem de `mtry` variáveis por divisão, como no randomForest."""
+
+    def __init__(self, mtry, rng):
+        self.mtry = mtry
+        self.rng = rng
+        self.feature, self.threshold, self.left, self.right, self.label = [], [], [], [], []
+
+    def fit(self, X, y, n_classes):
+        self.n_classes = n_classes
+        self._grow(X, y)
+        self.feature = np.array(self.feature)
+        self.threshold = np.array(self.threshold)
+        self.left = np.array(self.left)
+        self.right = np.array(self.right)
+        self.label = np.array(self.label)
+        return self
+
+    def _new_node(self):
+        for column in (self.feature, self.threshold, self.left, self.right, self.label):
+            column.append(-1)
+        return len(self.feature) - 1
+
+    def _grow(self, X, y):
+        node = self._new_node()
+        counts = np.bincount(y, minlength=self.n_classes)
+        split = self._best_split(X, y) if np.count_nonzero(counts) > 1 else None
+        if split is None:
+            # Folha: classe majoritária (empates resolvidos pelo menor nível de risco).
+            self.label[node] = int(np.argmax(counts))
+            return node
+        feature, threshold = split
+        mask = X[:, feature] <= threshold
+        self.feature[node] = feature
+        self.threshold[node] = threshold
+        self.left[node] = self._grow(X[mask], y[mask])
+        self.right[node] = self._grow(X[~mask], y[~mask])
+        return node
+
+    def _best_split(self, X, y):
+        n_samples, n_features = X.shape
+        best_gini, best = np.inf, None
+        for feature in self.rng.choice(n_features, size=min(self.mtry, n_features), replace=False):
+            order = np.argsort(X[:, feature], kind='stable')
+            values, labels = X[order, feature], y[order]
+            # Contagem acumulada de classes à esquerda de cada ponto de corte.
+            left_counts = np.cumsum(np.eye(self.n_classes)[labels], axis=0)[:-1]
+            right_counts = left_counts[-1] + np.eye(self.n_classes)[labels[-1]] - left_counts
+            n_left = np.arange(1, n_samples)
+            n_right = n_samples - n_left
+            gini = (n_left * (1 - ((left_counts / n_left[:, None]) ** 2).sum(axis=1))
+                    + n_right * (1 - ((right_counts / n_right[:, None]) ** 2).sum(axis=1)))
+            valid = values[1:] > values[:-1]  # Só corta entre valores distintos.
+            if not valid.any():
+                continue
+            gini = np.where(valid, gini, np.inf)
+            i = int(np.argmin(gini))
+            if gini[i] < best_gini:
+                best_gini = gini[i]
+                best = (int(feature), float((values[i] + values[i + 1]) / 2))
+        return best
+
+    def predict(self, X):
+        """Percorre a árvore para todas as amostras ao mesmo tempo (um nível por iteração)."""
+        nodes = np.zeros(len(X), dtype=int)
+        active = self.feature[nodes] >= 0
+        while active.any():
+            idx = np.nonzero(active)[0]
+            current = nodes[idx]
+            go_left = X[idx, self.feature[current]] <= self.threshold[current]
+            nodes[idx] = np.where(go_left, self.left[current], self.right[current])
+            active = self.feature[nodes] >= 0
+        return self.label[nodes]
+
+
+class RandomForestClassifier:
+    """Floresta de árvores com bootstrap e votação majoritária (mtry = floor(sqrt(p)), como no R)."""
+
+    def __init__(self, n_trees=N_TREES, seed=None):
+        self.n_trees = n_trees
+        self.seed = seed
+        self.trees = []
+
+    def fit(self, X, y, classes):
+        self.classes = list(classes)
+        X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=int)
+        rng = np.random.default_rng(self.seed)
+        mtry = max(int(np.sqrt(X.shape[1])), 1)
+        self.trees = []
+        for _ in range(self.n_trees):
+            sample = rng.integers(0, len(X), size=len(X))
+            self.trees.append(DecisionTree(mtry, rng).fit(X[sample], y[sample], len(self.classes)))
+        return self
+
+    def predict_index(self, X):
+        """Índice da classe vencedora para cada linha de X (previsão em lote)."""
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        votes = np.zeros((len(X), len(self.classes)), dtype=int)
+        rows = np.arange(len(X))
+        for tree in self.trees:
+            np.add.at(votes, (rows, tree.predict(X)), 1)
+        return votes.argmax(axis=1)
+
+    def predict(self, X):
+        return [self.classes[i] for i in self.predict_index(X)]
+
+    def to_arrays(self):
+        """Árvores concatenadas em arrays NumPy (formato dos artefatos salvos por model_cache.py)."""
+        sizes = [len(tree.feature) for tree in self.trees]
+        arrays = {name: np.concatenate([getattr(tree, name) for tree in self.trees])
+                  for name in ('feature', 'threshold', 'left', 'right', 'label')}
+        arrays['offsets'] = np.concatenate([[0], np.cumsum(sizes)])
+        arrays['classes'] = np.array(self.classes)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Reconstrói a floresta a partir de to_arrays(), sem treinar."""
+        forest = cls(n_trees=len(arrays['offsets']) - 1)
+        forest.classes = [str(label) for label in arrays['classes']]
+        offsets = arrays['offsets']
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            tree = DecisionTree(mtry=None, rng=None)
+            tree.n_classes = len(forest.classes)
+            for name in ('feature', 'threshold', 'left', 'right', 'label'):
+                setattr(tree, name, np.asarray(arrays[name][start:end]))
+            forest.trees.append(tree)
+        return forest
+
+
+# --- Previsão de Séries Temporais (1 passo à frente) ---
+
+def kpss_statistic(values):
+    """Estatística KPSS (nível) com a janela de Newey-West curta usada pelo auto.arima."""
+    n = len(values)
+    residuals = values - values.mean()
+    partial_sums = np.cumsum(residuals)
+    lags = int(np.trunc(4 * (n / 100) ** 0.25))
+    long_run_variance = (residuals ** 2).sum() / n
+    for lag in range(1, lags + 1):
+        weight = 1 - lag / (lags + 1)
+        long_run_variance += 2 * weight * (residuals[lag:] * residuals[:-lag]).sum() / n
+    if long_run_variance <= 0:
+        return 0.0
+    return float((partial_sums ** 2).sum() / (n ** 2 * long_run_variance))
+
+
+def _aic(residuals, n_params):
+    sigma2 = max(float((residuals ** 2).mean()), 1e-12)
+    return len(residuals) * np.log(sigma2) + 2 * (n_params + 1)
+
+
+def _candidates(series):
+    """Modelos candidatos para uma série (já diferenciada ou não): (aic, previsão do próximo valor)."""
+    models = [(_aic(series - series.mean(), 1), series.mean())]  # Média constante.
+    if len(series) >= 3 and series[:-1].std() > 0:
+        # AR(1) com constante, ajustado por mínimos quadrados.
+        A = np.column_stack([np.ones(len(series) - 1), series[:-1]])
+        coef, *_ = np.linalg.lstsq(A, series[1:], rcond=None)
+        if abs(coef[1]) < 1:
+            residuals = series[1:] - A @ coef
+            models.append((_aic(residuals, 2), coef[0] + coef[1] * series[-1]))
+    return models
+
+
+def forecast_next(values):
+    """
+    Previsão de 1 passo à frente no espírito do auto.arima: escolhe a diferenciação pelo
+    teste KPSS e, entre média/AR(1) (com ou sem drift na série diferenciada), o menor AIC.
+    Com menos de 5 pontos retorna o último valor, como os scripts R.
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return None
+    if len(values) < MIN_POINTS_FOR_FORECAST or values.std() == 0:
+        return round(float(values[-1]), 2)
+
+    if kpss_statistic(values) > KPSS_CRITICAL_VALUE:
+        diffs = np.diff(values)
+        # Passeio aleatório (sem drift) + candidatos na série diferenciada.
+        models = [(_aic(diffs, 0), 0.0)] + _candidates(diffs)
+        step = min(models, key=lambda model: model[0])[1]
+        prediction = values[-1] + step
+    else:
+        prediction = min(_candidates(values), key=lambda model: model[0])[1]
+    return round(float(prediction), 2)
+
+
+# --- Motor de Análise ---
+
+def analysis_timestamp():
+    return datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def predicted(name, series, forecasts=None):
+    """Previsão incremental informada (ForecastStore) ou, sem ela, forecast_next sobre a janela."""
+    if forecasts and forecasts.get(name) is not None:
+        return forecasts[name]
+    return forecast_next(series)
+
+
+def feature_vector(names, current, features=None):
+    """Monta a linha de features na ordem do modelo; as features calculadas, quando informadas, têm prioridade."""
+    merged = {**current, **{name: value for name, value in (features or {}).items() if value is not None}}
+    return [[merged[name] for name in names]]
+
+
+def load_training_data(path, features, category_column):
+    """Lê um dataset histórico e retorna (X, índices das classes); categorias fora de RISK_LEVELS são erro."""
+    data = pd.read_csv(path)
+    categories = pd.Categorical(data[category_column], categories=RISK_LEVELS)
+    unknown = sorted({"(vazia)" if pd.isna(label) else str(label)
+                      for label in data[category_column][categories.codes == -1]})
+    if unknown:
+        raise ValueError(f"Categorias de risco desconhecidas em {path} ({category_column}): {', '.join(unknown)}")
+    return data[features].to_numpy(dtype=float), categories.codes
+
+
+# Modelo de cada análise: (dataset histórico, features, coluna da categoria, semente).
+MODEL_SPECS = {
+    "flood": ('historical_flood_data.csv', FLOOD_FEATURES, 'flood_risk_category', FLOOD_SEED),
+    "fire": ('historical_fire_data.csv', FIRE_FEATURES, 'fire_risk_category', FIRE_SEED),
+}
+
+
+def cached_forest(name, r_analysis_dir, cache, n_trees=N_TREES,
+                  check_interval=RELOAD_CHECK_INTERVAL_SECONDS):
+    """Random Forest da análise `name`, treinado sob demanda e guardado no cache de artefatos."""
+    dataset_file, features, category_column, seed = MODEL_SPECS[name]
+    dataset_path = os.path.join(r_analysis_dir, 'datasets', dataset_file)
+
+    def train():
+        X, y = load_training_data(dataset_path, features, category_column)
+        return RandomForestClassifier(n_trees, seed).fit(X, y, RISK_LEVELS)
+
+    params = {"model": "random_forest", "features": features, "category": category_column,
+              "classes": RISK_LEVELS, "n_trees": n_trees, "seed": seed}
+    return CachedModel(f"{name}_rf", dataset_path, params, train,
+                       RandomForestClassifier.to_arrays, RandomForestClassifier.from_arrays,
+                       cache, check_interval)
+
+
+class RiskEngine:
+    """
+    Responde às análises em memória. Os classificadores vêm do cache de artefatos em
+    `model_dir` (padrão: r_analysis/models) e são recarregados quando o dataset muda.
+    """
+
+    def __init__(self, r_analysis_dir, n_trees=N_TREES, model_dir=None,
+                 check_interval=RELOAD_CHECK_INTERVAL_SECONDS):
+        cache = ModelArtifactCache(model_dir or os.path.join(r_analysis_dir, 'models'))
+        self.models = {name: cached_forest(name, r_analysis_dir, cache, n_trees, check_interval)
+                       for name in MODEL_SPECS}
+
+    def predict_flood_risk(self, features):
+        """Classifica em lote uma matriz com as colunas de FLOOD_FEATURES."""
+        return self.models["flood"].get().predict(features)
+
+    def predict_fire_risk(self, features):
+        """Classifica em lote uma matriz com as colunas de FIRE_FEATURES."""
+        return self.models["fire"].get().predict(features)
+
+    def analyze_flood(self, rows, features=None, forecasts=None):
+        """
+        Mesma saída de flood_analysis.R para uma lista de leituras (timestamp, water_level, rainfall_intensity).
+        `features` (do FeatureStore) substitui o mapeamento direto da última leitura nas features do modelo;
+        `forecasts` (do ForecastStore) substitui a previsão calculada sobre as leituras.
+        """
+        if not rows:
+            return {"risk_level": "Baixo", "predicted_water_level": None, "predicted_rainfall": None,
+                    "timestamp_analysis": analysis_timestamp(),
+                    "message": "Dados insuficientes para análise preditiva."}
+        water_level = np.array([row['water_level'] for row in rows], dtype=float)
+        rainfall = np.array([row['rainfall_intensity'] for row in rows], dtype=float)
+        current = {'water_level_avg_24h': water_level[-1], 'rainfall_total_24h': rainfall[-1],
+                   **FLOOD_PLACEHOLDERS}
+        return {
+            "risk_level": self.predict_flood_risk(feature_vector(FLOOD_FEATURES, current, features))[0],
+            "predicted_water_level": predicted("predicted_water_level", water_level, forecasts),
+            "predicted_rainfall": predicted("predicted_rainfall", rainfall, forecasts),
+            "timestamp_analysis": analysis_timestamp(),
+        }
+
+    def analyze_fire(self, rows, features=None, forecasts=None):
+        """
+        Mesma saída de fire_analysis.R para uma lista de leituras (timestamp, temperature, humidity, smoke_concentration).
+        `features` (do FeatureStore) substitui o mapeamento direto da última leitura nas features do modelo;
+        `forecasts` (do ForecastStore) substitui a previsão calculada sobre as leituras.
+        """
+        if not rows:
+            return {"risk_level": "Baixo", "predicted_temperature": None, "predicted_smoke": None,
+                    "timestamp_analysis": analysis_timestamp(),
+                    "message": "Dados insuficientes para análise preditiva."}
+        temperature = np.array([row['temperature'] for row in rows], dtype=float)
+        humidity = np.array([row['humidity'] for row in rows], dtype=float)
+        smoke = np.array([row['smoke_concentration'] for row in rows], dtype=float)
+        current = {'temperature_avg_24h': temperature[-1], 'humidity_avg_24h': humidity[-1],
+                   'smoke_concentration_avg_6h': smoke[-1], **FIRE_PLACEHOLDERS}
+        return {
+            "risk_level": self.predict_fire_risk(feature_vector(FIRE_FEATURES, current, features))[0],
+            "predicted_temperature": predicted("predicted_temperature", temperature, forecasts),
+            "predicted_smoke": predicted("predicted_smoke", smoke, forecasts),
+            "timestamp_analysis": analysis_timestamp(),
+        }
+
+    def analyze(self, analysis, rows, features=None, forecasts=None):
+        """Mesma interface do RWorkerPool: analysis é "flood" ou "fire"."""
+        if analysis == "flood":
+            return self.analyze_flood(rows, features, forecasts)
+        if analysis == "fire":
+            return self.analyze_fire(rows, features, forecasts)
+        raise ValueError(f"Análise desconhecida: {analysis}")
+
+
+# --- Verificação de Paridade com o R ---
+# A suíte de testes (tests/test_risk_engine_parity.py) compara o motor com vários casos gravados;
+# esta verificação usa só a última saída que os scripts R gravaram em temp_data.
+
+PARITY_TOLERANCE = 0.05
+
+PARITY_CASES = [
+    # (análise, CSV enviado ao R, JSON gravado pelo R, {campo de previsão: coluna da série})
+    ("flood", "flood_data_for_r.csv", "flood_risk_output.json",
+     {"predicted_water_level": "water_level", "predicted_rainfall": "rainfall_intensity"}),
+    ("fire", "fire_data_for_r.csv", "fire_risk_output.json",
+     {"predicted_temperature": "temperature", "predicted_smoke": "smoke_concentration"}),
+]
+
+
+def forecast_tolerance(series, tolerance=PARITY_TOLERANCE):
+    """Diferença aceita entre as previsões do Python e do R: fração da amplitude da série, mínimo de 1 unidade."""
+    return max(tolerance * float(np.ptp(np.asarray(series, dtype=float))), 1.0)
+
+
+def check_parity(engine, temp_data_dir, tolerance=PARITY_TOLERANCE):
+    """
+    Compara o motor Python com as saídas gravadas pelos scripts R nos mesmos dados.
+    O nível de risco precisa ser idêntico; as previsões podem diferir até `tolerance`
+    (fração da amplitude da série, mínimo de 1 unidade). Retorna True se tudo bater.
+    """
+    all_ok = True
+    for analysis, input_name, output_name, forecast_fields in PARITY_CASES:
+        input_path = os.path.join(temp_data_dir, input_name)
+        output_path = os.path.join(temp_data_dir, output_name)
+        if not (os.path.exists(input_path) and os.path.exists(output_path)):
+            print(f"[{analysis}] dados gravados não encontrados, verificação ignorada.")
+            continue
+        df = pd.read_csv(input_path)
+        rows = df.to_dict('records')
+        with open(output_path, 'r') as f:
+            expected = json.load(f)
+        result = engine.analyze(analysis, rows)
+
+        ok = result["risk_level"] == expected.get("risk_level")
+        print(f"[{analysis}] risk_level: Python={result['risk_level']} R={expected.get('risk_level')}"
+              f" {'OK' if ok else 'DIVERGENTE'}")
+        for field, column in forecast_fields.items():
+            allowed = forecast_tolerance(df[column], tolerance)
+            python_value, r_value = result.get(field), expected.get(field)
+            if python_value is None or r_value is None:
+                field_ok = python_value == r_value
+            else:
+                field_ok = abs(python_value - r_value) <= allowed
+            ok = ok and field_ok
+            print(f"[{analysis}] {field}: Python={python_value} R={r_value}"
+                  f" {'OK' if field_ok else 'DIVERGENTE'} (tolerância {allowed:.2f})")
+        all_ok = all_ok and ok
+    return all_ok
+
+
+if __name__ == "__main__":
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Motor de análise de risco em Python/NumPy.")
+    parser.add_argument("--parity", action="store_true",
+                        help="Compara o motor Python com as saídas gravadas pelos scripts R.")
+    parser.add_argument("--train", action="store_true",
+                        help="Treina (ou carrega do cache) os modelos e grava os artefatos.")
+    parser.add_argument("--force", action="store_true",
+                        help="Com --train, treina de novo mesmo que o artefato já exista.")
+    parser.add_argument("--model-dir", default=None,
+                        help="Pasta dos artefatos dos modelos (padrão: <r-analysis-dir>/models).")
+    parser.add_argument("--tolerance", type=float, default=PARITY_TOLERANCE,
+                        help="Tolerância das previsões (fração da amplitude da série).")
+    parser.add_argument("--r-analysis-dir", default=os.path.join(base_dir, '..', 'r_analysis'))
+    args = parser.parse_args()
+    configure_logging(os.getenv("LOG_LEVEL", "INFO"), os.getenv("LOG_FORMAT", "text"))
+
+    engine = RiskEngine(args.r_analysis_dir, model_dir=args.model_dir)
+    if args.train:
+        for name, model in engine.models.items():
+            if args.force:
+                model.retrain()
+            else:
+                model.get()
+            print(f"[{name}] artefato {model.cache.path_for(model.name, model.key)}")
+    if args.parity:
+        temp_data_dir = os.path.join(args.r_analysis_dir, 'temp_data')
+        raise SystemExit(0 if check_parity(engine, temp_data_dir, args.tolerance) else 1)
@@ -0,0 +1,128 @@
+# python_server/rollups.py
+# Agregados pré-calculados das leituras em várias resoluções (1 min, 15 min e 1 h).
+# Cada intervalo guarda contagem, soma, mínimo e máximo por dispositivo e campo, atualizados
+# a cada leitura gravada. Os gráficos de períodos longos leem esses agregados em vez de
+# milhares de leituras brutas.
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+
+# --- Configurações ---
+ROLLUP_RESOLUTIONS = (60, 900, 3600)  # Segundos: 1 min, 15 min e 1 h.
+ROLLUP_FIELDS = ('water_level', 'rainfall_intensity', 'temperature', 'humidity', 'smoke_concentration')
+
+
+def bucket_start(timestamp, resolution):
+    """Início (ISO, sem frações) do intervalo de `resolution` segundos que contém o timestamp."""
+    moment = timestamp if isinstance(timestamp, datetime) else datetime.fromisoformat(str(timestamp))
+    seconds = moment.hour * 3600 + moment.minute * 60 + moment.second
+    seconds -= seconds % resolution  # As resoluções dividem o dia, então o intervalo não cruza a meia-noite.
+    return f"{moment.date().isoformat()}T{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def rollup_entries(record, resolutions=ROLLUP_RESOLUTIONS, fields=ROLLUP_FIELDS):
+    """Gera (resolução, campo, intervalo, dispositivo, valor) para cada agregado afetado pela leitura."""
+    timestamp = record.get('timestamp')
+    if not timestamp:
+        return
+    try:
+        moment = datetime.fromisoformat(str(timestamp))
+    except ValueError:
+        return
+    device = record.get('device_id') or ''
+    values = [(field, record.get(field)) for field in fields]
+    values = [(field, float(value)) for field, value in values
+              if isinstance(value, (int, float)) and not isinstance(value, bool)]
+    for resolution in resolutions:
+        bucket = bucket_start(moment, resolution)
+        for field, value in values:
+            yield resolution, field, bucket, device, value
+
+
+class RollupIndex:
+    """Agregados em memória, com as chaves de intervalo mantidas ordenadas para consultas por período."""
+
+    def __init__(self, resolutions=ROLLUP_RESOLUTIONS, fields=ROLLUP_FIELDS):
+        self.resolutions = resolutions
+        self.fields = fields
+        self._stats = {}  # (resolução, campo) -> {intervalo: {dispositivo: [contagem, soma, mín, máx]}}
+        self._keys = {}   # (resolução, campo) -> intervalos em ordem
+
+    def _devices(self, resolution, field, bucket):
+        """Agregados por dispositivo de um intervalo (criados vazios se ainda não existem)."""
+        series = self._stats.get((resolution, field))
+        if series is None:
+            series = self._stats[(resolution, field)] = {}
+            self._keys[(resolution, field)] = []
+        devices = series.get(bucket)
+        if devices is None:
+            devices = series[bucket] = {}
+            keys = self._keys[(resolution, field)]
+            if not keys or bucket > keys[-1]:
+                keys.append(bucket)   # Caso comum: leituras em ordem cronológica.
+            else:
+                insort(keys, bucket)
+        return devices
+
+    def add(self, record):
+        for resolution, field, bucket, device, value in rollup_entries(record, self.resolutions, self.fields):
+            self.merge(resolution, field, bucket, device, (1, value, value, value))
+
+    def merge(self, resolution, field, bucket, device, stats):
+        """Soma agregados já calculados (contagem, soma, mín., máx.) ao intervalo do dispositivo."""
+        count, total, low, high = stats
+        devices = self._devices(resolution, field, bucket)
+        current = devices.get(device)
+        if current is None:
+            devices[device] = [count, total, low, high]
+        else:
+            current[0] += count
+            current[1] += total
+            current[2] = min(current[2], low)
+            current[3] = max(current[3], high)
+
+    def entries(self):
+        """Gera (resolução, campo, intervalo, dispositivo, contagem, soma, mín., máx.) de todos os agregados."""
+        for (resolution, field), keys in self._keys.items():
+            series = self._stats[(resolution, field)]
+            for bucket in keys:
+                for device, (count, total, low, high) in series[bucket].items():
+                    yield resolution, field, bucket, device, count, total, low, high
+
+    def prune(self, resolution, before):
+        """Descarta os intervalos da resolução que começam antes de `before` (ISO)."""
+        for (item_resolution, field), keys in self._keys.items():
+            if item_resolution != resolution:
+                continue
+            end = bisect_left(keys, before)
+            series = self._stats[(item_resolution, field)]
+            for bucket in keys[:end]:
+                del series[bucket]
+            del keys[:end]
+
+    def series(self, field, resolution, device_id=None, since=None, until=None):
+        """Série agregada [{timestamp, count, mean, min, max}] do campo na resolução pedida."""
+        keys = self._keys.get((resolution, field), [])
+        series = self._stats.get((resolution, field), {})
+        if isinstance(until, datetime):
+            until = until.isoformat()
+        start = bisect_left(keys, bucket_start(since, resolution)) if since else 0
+        end = bisect_right(keys, str(until)) if until else len(keys)
+        rows = []
+        for bucket in keys[start:end]:
+            devices = series[bucket]
+            if device_id is not None:
+                devices = {device_id: devices[device_id]} if device_id in devices else {}
+            if devices:
+                rows.append(summarize(bucket, devices.values()))
+        return rows
+
+
+def summarize(bucket, stats):
+    """Combina os agregados de vários dispositivos em uma linha da série."""
+    count = total = 0
+    low, high = float('inf'), float('-inf')
+    for item_count, item_sum, item_min, item_max in stats:
+        count += item_count
+        total += item_sum
+        low, high = min(low, item_min), max(high, item_max)
+    return {'timestamp': bucket, 'count': count, 'mean': total / count, 'min': low, 'max': high}
@@ -0,0 +1,296 @@
+# python_server/sensor_archive.py
+# Camada fria do histórico de leituras: arquivos compactados, imutáveis, um por dispositivo e dia,
+# para onde a compactação (retention.py) move as leituras brutas mais antigas que a retenção.
+# Formatos: Parquet (colunar, compressão zstd; requer pyarrow) ou JSON Lines com gzip (biblioteca padrão).
+# TieredStore junta as camadas: as consultas leem o armazenamento ativo e o arquivo como se
+# fossem um só, e o arquivo só é aberto quando o período pedido chega até ele.
+import gzip            # Formato jsonl.gz.
+import json            # Leituras serializadas e colunas heterogêneas no Parquet.
+import logging
+import os              # Pastas, troca atômica dos arquivos.
+import threading       # Gravações do arquivo (compactação) concorrentes às consultas.
+from sensor_store import SensorStore, device_partition, matches, open_store, project, to_iso
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# --- Configurações Padrão ---
+DEFAULT_FORMAT = "parquet"        # "parquet" ou "jsonl.gz"
+ARCHIVE_PREFIX = "sensor_data_"   # <pasta>/<dispositivo>/sensor_data_AAAA-MM-DD.<extensão>
+FORMAT_SUFFIXES = {"parquet": ".parquet", "jsonl.gz": ".jsonl.gz"}
+PARQUET_COMPRESSION = "zstd"
+JSON_COLUMNS_METADATA = b"json_columns"
+
+log = logging.getLogger(__name__)
+
+
+class SensorArchive:
+    """Leituras arquivadas por dispositivo e dia; aceita consultas como um SensorStore (somente leitura)."""
+
+    def __init__(self, directory, archive_format=DEFAULT_FORMAT):
+        archive_format = (archive_format or DEFAULT_FORMAT).lower()
+        if archive_format not in FORMAT_SUFFIXES:
+            raise ValueError(f"Formato de arquivo desconhecido: {archive_format}")
+        if archive_format == "parquet" and pq is None:
+            log.warning("pyarrow não está instalado; arquivando as leituras em JSON Lines (gzip).")
+            archive_format = "jsonl.gz"
+        self.directory = directory
+        self.archive_format = archive_format
+        self._write_lock = threading.Lock()
+        self._listings = {}   # pasta -> (mtime, conteúdo): evita listar as pastas a cada consulta.
+        os.makedirs(directory, exist_ok=True)
+
+    # --- Listagem ---
+
+    def _listdir(self, folder):
+        try:
+            mtime = os.stat(folder).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        cached = self._listings.get(folder)
+        if cached is None or cached[0] != mtime:
+            cached = self._listings[folder] = (mtime, sorted(os.listdir(folder)))
+        return cached[1]
+
+    def partitions(self):
+        return [name for name in self._listdir(self.directory)
+                if os.path.isdir(os.path.join(self.directory, name))]
+
+    def day_files(self, partition):
+        """[(dia, caminho)] dos arquivos do dispositivo, em ordem cronológica."""
+        folder = os.path.join(self.directory, partition)
+        files = []
+        for name in self._listdir(folder):
+            for suffix in FORMAT_SUFFIXES.values():
+                if name.startswith(ARCHIVE_PREFIX) and name.endswith(suffix):
+                    files.append((name[len(ARCHIVE_PREFIX):-len(suffix)], os.path.join(folder, name)))
+        return sorted(files)
+
+    def _files(self, device_id=None, since=None, until=None):
+        partitions = self.partitions() if device_id is None else [device_partition(device_id)]
+        first_day, last_day = (since or "")[:10], (until or "")[:10]
+        return sorted((day, path) for partition in partitions for day, path in self.day_files(partition)
+                      if not (first_day and day < first_day) and not (last_day and day > last_day))
+
+    def day_range(self, device_id=None):
+        """(primeiro, último) dia arquivado do dispositivo (ou de todos), ou None se não há arquivos."""
+        days = [day for day, _ in self._files(device_id)]
+        return (days[0], days[-1]) if days else None
+
+    # --- Gravação ---
+
+    def write(self, records):
+        """
+        Acrescenta leituras ao arquivo, agrupadas por dispositivo e dia. O arquivo do dia é regravado
+        com as leituras que já tinha (uma leitura com o mesmo dispositivo e timestamp só entra uma vez)
+        e trocado de forma atômica: uma consulta vê o arquivo antigo ou o novo, nunca um pela metade.
+        """
+        groups = {}
+        for record in records:
+            timestamp = str(record.get('timestamp') or '')
+            if timestamp:
+                groups.setdefault((device_partition(record.get('device_id')), timestamp[:10]), []).append(record)
+        with self._write_lock:
+            for (partition, day), new_records in groups.items():
+                self._write_day(partition, day, new_records)
+
+    def _write_day(self, partition, day, new_records):
+        folder = os.path.join(self.directory, partition)
+        os.makedirs(folder, exist_ok=True)
+        existing = [path for file_day, path in self.day_files(partition) if file_day == day]
+        merged = {}
+        for record in [record for path in existing for record in read_archive_file(path)] + new_records:
+            merged[(record.get('device_id'), str(record.get('timestamp')))] = record
+        records = sorted(merged.values(), key=lambda record: str(record.get('timestamp')))
+
+        path = os.path.join(folder, f"{ARCHIVE_PREFIX}{day}{FORMAT_SUFFIXES[self.archive_format]}")
+        temp_path = f"{path}.tmp"
+        if self.archive_format == "parquet":
+            write_parquet(temp_path, records)
+        else:
+            write_jsonl_gz(temp_path, records)
+        os.replace(temp_path, path)
+        for old_path in existing:   # Arquivo do mesmo dia em outro formato (ARCHIVE_FORMAT alterado).
+            if old_path != path:
+                os.remove(old_path)
+
+    # --- Consultas (mesma semântica de SensorStore.query) ---
+
+    def query(self, device_id=None, since=None, until=None, fields=None, last=None):
+        since, until = to_iso(since), to_iso(until)
+        paths_by_day = {}
+        for day, path in self._files(device_id, since, until):
+            paths_by_day.setdefault(day, []).append(path)
+
+        # Com `last`, lê os dias do mais recente para o mais antigo e para assim que tiver N linhas.
+        chunks, total = [], 0
+        for day in sorted(paths_by_day, reverse=bool(last)):
+            rows = []
+            for path in paths_by_day[day]:
+                for record in read_archive_file(path, fields):
+                    if matches(record, device_id, since, until):
+                        row = project(record, fields)
+                        if row is not None:
+                            rows.append(row)
+            if len(paths_by_day[day]) > 1:
+                rows.sort(key=lambda row: str(row.get('timestamp', '')))
+            chunks.append(rows)
+            total += len(rows)
+            if last and total >= last:
+                break
+        if last:
+            chunks.reverse()
+        rows = [row for chunk in chunks for row in chunk]
+        return rows[-last:] if last else rows
+
+    def time_range(self):
+        files = self._files()
+        if not files:
+            return None, None
+        first_day, last_day = files[0][0], files[-1][0]
+        first = [str(record['timestamp']) for day, path in files if day == first_day
+                 for record in read_archive_file(path, ()) if record.get('timestamp')]
+        last = [str(record['timestamp']) for day, path in files if day == last_day
+                for record in read_archive_file(path, ()) if record.get('timestamp')]
+        return (min(first) if first else None), (max(last) if last else None)
+
+    def count(self):
+        total = 0
+        for _, path in self._files():
+            if path.endswith(FORMAT_SUFFIXES["parquet"]):
+                total += pq.ParquetFile(path).metadata.num_rows   # Só o rodapé do arquivo.
+            else:
+                total += len(read_archive_file(path))
+        return total
+
+
+class TieredStore(SensorStore):
+    """
+    Armazenamento ativo (`hot`, SQLite ou JSON Lines) + arquivo frio (`archive`).
+    Gravações, leitura incremental (tail) e agregados vão só para o ativo; as consultas por período
+    também leem o arquivo quando o período começa antes da primeira leitura ainda no ativo.
+    """
+
+    def __init__(self, hot, archive):
+        self.hot = hot
+        self.archive = archive
+
+    def append(self, record):
+        self.hot.append(record)
+
+    def append_many(self, records):
+        self.hot.append_many(records)
+
+    def load_all(self):
+        return self.archive.query() + self.hot.load_all()
+
+    def query(self, device_id=None, since=None, until=None, fields=None, last=None):
+        since, until = to_iso(since), to_iso(until)
+        rows = self.hot.query(device_id, since, until, fields, last)
+        days = self.archive.day_range(device_id)
+        if days is None or (since and since[:10] > days[1]) or (until and until[:10] < days[0]):
+            return rows
+        if last and len(rows) >= last and days[1] < str(rows[0].get('timestamp', ''))[:10]:
+            return rows   # As N mais recentes já estão todas no ativo.
+        rows = self.archive.query(device_id, since, until, fields, last) + rows
+        rows.sort(key=lambda row: str(row.get('timestamp', '')))
+        return rows[-last:] if last else rows
+
+    def tail(self, cursor=None, fields=None):
+        return self.hot.tail(cursor, fields)
+
+    def rollups(self, field, resolution, device_id=None, since=None, until=None):
+        # Os agregados ficam no armazenamento ativo mesmo depois que as leituras brutas são arquivadas.
+        return self.hot.rollups(field, resolution, device_id, since, until)
+
+    def count(self):
+        return self.hot.count() + self.archive.count()
+
+    def time_range(self):
+        hot_first, hot_last = self.hot.time_range()
+        archive_first, archive_last = self.archive.time_range()
+        firsts = [value for value in (hot_first, archive_first) if value]
+        lasts = [value for value in (hot_last, archive_last) if value]
+        return (min(firsts) if firsts else None), (max(lasts) if lasts else None)
+
+    def expired_days(self, before):
+        return self.hot.expired_days(before)
+
+    def read_day(self, key, day):
+        return self.hot.read_day(key, day)
+
+    def delete_day(self, key, day):
+        self.hot.delete_day(key, day)
+
+    def prune_rollups(self, resolution, before):
+        self.hot.prune_rollups(resolution, before)
+
+    def flush(self):
+        self.hot.flush()
+
+    def close(self):
+        self.hot.close()
+
+
+def write_parquet(path, records):
+    """
+    Uma coluna por campo. Colunas com tipos misturados (ex.: número e texto) são gravadas como
+    texto JSON e listadas nos metadados do arquivo, para voltarem ao tipo original na leitura.
+    """
+    names = list(dict.fromkeys(name for record in records for name in record))
+    columns, json_columns = {}, []
+    for name in names:
+        values = [record.get(name) for record in records]
+        try:
+            columns[name] = pa.array(values)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            columns[name] = pa.array([None if value is None else json.dumps(value, ensure_ascii=False)
+                                      for value in values], pa.string())
+            json_columns.append(name)
+    table = pa.table(columns).replace_schema_metadata({JSON_COLUMNS_METADATA: json.dumps(json_columns)})
+    pq.write_table(table, path, compression=PARQUET_COMPRESSION)
+
+
+def write_jsonl_gz(path, records):
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def read_archive_file(path, fields=None):
+    """
+    Leituras de um arquivo do arquivo frio. Com `fields` (Parquet), lê só as colunas de
+    dispositivo, timestamp e dos campos pedidos; campos ausentes (nulos) não entram no dicionário.
+    """
+    if not path.endswith(FORMAT_SUFFIXES["parquet"]):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            lines = [line for line in f if line.strip()]
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+        return records
+
+    schema = pq.read_schema(path)
+    json_columns = set(json.loads((schema.metadata or {}).get(JSON_COLUMNS_METADATA, b"[]")))
+    columns = None
+    if fields is not None:
+        if any(field not in schema.names for field in fields):
+            return []
+        columns = [name for name in ('device_id', 'timestamp', *fields) if name in schema.names]
+    records = []
+    for row in pq.read_table(path, columns=columns).to_pylist():
+        records.append({name: json.loads(value) if name in json_columns else value
+                        for name, value in row.items() if value is not None})
+    return records
+
+
+def open_tiered_store(backend, directory, archive_dir, archive_format=DEFAULT_FORMAT, legacy_file=None):
+    """Abre o armazenamento ativo (ver sensor_store.open_store) junto com o arquivo frio em `archive_dir`."""
+    return TieredStore(open_store(backend, directory, legacy_file=legacy_file),
+                       SensorArchive(archive_dir, archive_format))
@@ -0,0 +1,115 @@
+# python_server/sensor_buffer.py
+# Buffer colunar das leituras para o dashboard, alimentado de forma incremental.
+# Em vez de reler todo o histórico a cada atualização da página, o buffer guarda o cursor
+# da última leitura vista (SensorStore.tail) e acrescenta apenas as novas em arrays NumPy
+# com capacidade dobrada sob demanda. Um único buffer é compartilhado por todas as sessões.
+# Com `max_age`, o buffer guarda só as leituras desse período (a janela de retenção do
+# armazenamento ativo), descartando as mais antigas à medida que chegam leituras novas.
+import threading       # Várias sessões do Streamlit atualizam o mesmo buffer.
+import numpy as np
+import pandas as pd
+
+INITIAL_CAPACITY = 1024
+TRIM_FRACTION = 8   # Só recorta o buffer quando ao menos 1/8 das leituras saiu da janela.
+
+
+class SensorBuffer:
+    """Colunas 'timestamp' + `fields` das leituras (as dos últimos `max_age`, se informado), em ordem cronológica."""
+
+    def __init__(self, store, fields, initial_capacity=INITIAL_CAPACITY, max_age=None):
+        self.store = store
+        self.fields = list(fields)
+        self.max_age = np.timedelta64(max_age) if max_age else None
+        self._cursor = None
+        self._size = 0
+        self._timestamps = np.empty(initial_capacity, dtype='datetime64[us]')
+        self._columns = {field: np.empty(initial_capacity, dtype=float) for field in self.fields}
+        self._sorted = True
+        self._lock = threading.Lock()
+        self.sequence = 0   # Total de leituras já acrescentadas: muda a cada novidade.
+
+    def __len__(self):
+        return self._size
+
+    def refresh(self):
+        """Busca no armazenamento as leituras gravadas desde a última chamada; retorna quantas entraram."""
+        with self._lock:
+            rows, self._cursor = self.store.tail(self._cursor, self.fields)
+            if rows:
+                self._append(rows)
+            return len(rows)
+
+    def _append(self, rows):
+        timestamps = pd.to_datetime([row['timestamp'] for row in rows], format='ISO8601',
+                                    errors='coerce').to_numpy(dtype='datetime64[us]')
+        values = {field: pd.to_numeric(pd.Series([row[field] for row in rows]), errors='coerce').to_numpy(float)
+                  for field in self.fields}
+        # Descarta linhas com timestamp ou valores inválidos (como o dropna() anterior do dashboard).
+        valid = ~np.isnat(timestamps)
+        for column in values.values():
+            valid &= ~np.isnan(column)
+        timestamps = timestamps[valid]
+        values = {field: column[valid] for field, column in values.items()}
+        count = len(timestamps)
+        if not count:
+            return
+
+        self._reserve(self._size + count)
+        start, end = self._size, self._size + count
+        if (start and timestamps[0] < self._timestamps[start - 1]) or np.any(timestamps[1:] < timestamps[:-1]):
+            self._sorted = False  # Leitura atrasada: reordena só quando alguém pedir o frame.
+        self._timestamps[start:end] = timestamps
+        for field, column in values.items():
+            self._columns[field][start:end] = column
+        self._size = end
+        self.sequence += count
+        if self._sorted:
+            self._trim()
+
+    def _trim(self):
+        """Descarta as leituras mais antigas que `max_age` antes da mais recente (buffer ordenado)."""
+        if self.max_age is None or not self._size:
+            return
+        cutoff = self._timestamps[self._size - 1] - self.max_age
+        expired = int(np.searchsorted(self._timestamps[:self._size], cutoff))
+        if not expired or expired < self._size // TRIM_FRACTION:
+            return
+        # Novos arrays (não in-place): frames já entregues a outras sessões não mudam.
+        capacity = len(self._timestamps)
+        self._timestamps = self._copy(self._timestamps, expired, capacity)
+        self._columns = {field: self._copy(column, expired, capacity) for field, column in self._columns.items()}
+        self._size -= expired
+
+    def _copy(self, array, start, capacity):
+        copied = np.empty(capacity, dtype=array.dtype)
+        copied[:self._size - start] = array[start:self._size]
+        return copied
+
+    def _reserve(self, capacity):
+        if capacity <= len(self._timestamps):
+            return
+        new_capacity = max(capacity, 2 * len(self._timestamps))
+        self._timestamps = self._grow(self._timestamps, new_capacity)
+        self._columns = {field: self._grow(column, new_capacity) for field, column in self._columns.items()}
+
+    def _grow(self, array, capacity):
+        grown = np.empty(capacity, dtype=array.dtype)
+        grown[:self._size] = array[:self._size]
+        return grown
+
+    def frame(self):
+        """
+        DataFrame com as leituras do buffer, sem cópia dos dados (somente leitura:
+        as colunas são visões dos arrays compartilhados entre as sessões).
+        """
+        with self._lock:
+            if not self._sorted:
+                # Novos arrays (não in-place): frames já entregues a outras sessões não mudam.
+                order = np.argsort(self._timestamps[:self._size], kind='stable')
+                self._timestamps = self._timestamps[order]
+                self._columns = {field: column[order] for field, column in self._columns.items()}
+                self._sorted = True
+                self._trim()
+            data = {'timestamp': self._timestamps[:self._size]}
+            data.update((field, column[:self._size]) for field, column in self._columns.items())
+        return pd.DataFrame(data, copy=False)
@@ -0,0 +1,765 @@
+# python_server/sensor_store.py
+# Armazenamento append-only das leituras dos sensores.
+# Substitui a regravação completa do arquivo all_sensor_data.json a cada mensagem MQTT
+# por backends onde cada nova leitura custa O(1) para ser gravada.
+import json            # Para serializar as leituras.
+import logging
+import os              # Para caminhos de arquivo e fsync.
+import re              # Para validar nomes de campos e de dispositivos.
+import sqlite3         # Banco de dados embutido (modo WAL).
+import threading       # Para proteger o acesso concorrente ao armazenamento.
+import time            # Para controlar o intervalo de fsync.
+from datetime import date, datetime, timedelta
+
+try:
+    import fcntl       # Trava da migração entre processos que abrem o mesmo store.
+except ImportError:
+    fcntl = None
+# Agregados por intervalo (1 min, 15 min, 1 h) usados pelos gráficos do dashboard.
+from rollups import ROLLUP_FIELDS, RollupIndex, bucket_start, rollup_entries
+
+# --- Configurações Padrão ---
+DEFAULT_BACKEND = "sqlite"        # "sqlite" ou "jsonl"
+SQLITE_DB_NAME = "sensor_data.db"
+SEGMENT_PREFIX = "sensor_data_"   # Segmentos JSON Lines: <dispositivo>/sensor_data_AAAA-MM-DD.jsonl
+SEGMENT_SUFFIX = ".jsonl"
+NO_DEVICE_PARTITION = "_sem_dispositivo"
+LEGACY_MIGRATION_MARKER = ".legacy_json_migrated"
+# Agregados dos segmentos JSON Lines já compactados (retention.py), na raiz do armazenamento.
+COMPACTED_ROLLUPS_FILE = "compacted_rollups.jsonl"
+# Linhas apagadas por transação na compactação: a gravação das leituras novas nunca espera muito.
+DELETE_BATCH_SIZE = 2000
+
+# Quantidade de leituras (ou segundos) acumuladas antes de forçar um fsync em disco.
+# Entre um fsync e outro os dados já estão no cache do sistema operacional: uma queda
+# do processo não perde nada, apenas uma queda de energia pode perder o último lote.
+FSYNC_BATCH_SIZE = 50
+FSYNC_INTERVAL_SECONDS = 5.0
+
+log = logging.getLogger(__name__)
+
+# Nomes dos campos no payload do ESP32 (esp32/src/prog1.ino) -> nomes usados nas análises.
+PAYLOAD_FIELD_ALIASES = {
+    'nivel_de_agua': 'water_level',
+    'intensidade_de_chuva': 'rainfall_intensity',
+    'temperatura': 'temperature',
+    'umidade': 'humidity',
+    'concentracao_de_fumaca': 'smoke_concentration',
+}
+
+
+class SensorStore:
+    """Interface comum dos backends de armazenamento de leituras."""
+
+    def append(self, record):
+        """Grava uma leitura no final do armazenamento."""
+        raise NotImplementedError
+
+    def append_many(self, records):
+        """Grava várias leituras de uma só vez."""
+        for record in records:
+            self.append(record)
+
+    def load_all(self):
+        """Retorna todas as leituras em ordem de chegada (lista de dicionários)."""
+        raise NotImplementedError
+
+    def query(self, device_id=None, since=None, until=None, fields=None, last=None):
+        """
+        Consulta as leituras por dispositivo e intervalo de tempo (since/until inclusivos).
+        Com `fields`, cada linha traz apenas 'timestamp' e os campos pedidos, e as leituras
+        que não possuem algum desses campos são descartadas.
+        Com `last`, retorna apenas as N leituras mais recentes (ainda em ordem cronológica).
+        Implementação genérica (varre tudo); os backends sobrescrevem usando seus índices.
+        """
+        since, until = to_iso(since), to_iso(until)
+        rows = [row for row in (project(record, fields) for record in self.load_all()
+                                if matches(record, device_id, since, until))
+                if row is not None]
+        return rows[-last:] if last else rows
+
+    def tail(self, cursor=None, fields=None):
+        """
+        Leitura incremental: retorna (leituras novas, novo cursor). Passe o cursor devolvido
+        na chamada seguinte para receber apenas o que foi gravado desde então (`None` = início).
+        Com `fields`, as linhas são projetadas como em `query`.
+        Implementação genérica (cursor = quantidade de leituras já lidas).
+        """
+        records = self.load_all()
+        rows = [project(record, fields) for record in records[cursor or 0:]]
+        return [row for row in rows if row is not None], len(records)
+
+    def rollups(self, field, resolution, device_id=None, since=None, until=None):
+        """
+        Série agregada do campo em intervalos de `resolution` segundos (ver rollups.py):
+        [{'timestamp', 'count', 'mean', 'min', 'max'}, ...] somando todos os dispositivos
+        (ou só `device_id`). Implementação genérica (recalcula tudo); os backends mantêm
+        os agregados de forma incremental.
+        """
+        index = RollupIndex()
+        for record in self.load_all():
+            index.add(record)
+        return index.series(field, resolution, device_id, since, until)
+
+    def count(self):
+        """Retorna a quantidade de leituras armazenadas."""
+        return len(self.load_all())
+
+    def time_range(self):
+        """
+        (primeiro, último) timestamp gravado, ou (None, None) sem leituras.
+        Implementação genérica (varre tudo); os backends sobrescrevem usando seus índices.
+        """
+        timestamps = [str(record['timestamp']) for record in self.load_all() if record.get('timestamp')]
+        return (min(timestamps), max(timestamps)) if timestamps else (None, None)
+
+    # --- Compactação (usada por retention.py) ---
+
+    def expired_days(self, before):
+        """[(chave, dia)] dos dias com leituras brutas anteriores a `before` (AAAA-MM-DD)."""
+        raise NotImplementedError
+
+    def read_day(self, key, day):
+        """Leituras brutas de um dia retornado por `expired_days`, em ordem cronológica."""
+        raise NotImplementedError
+
+    def delete_day(self, key, day):
+        """Apaga as leituras brutas do dia; os agregados (rollups) continuam disponíveis."""
+        raise NotImplementedError
+
+    def prune_rollups(self, resolution, before):
+        """Apaga os agregados da resolução com intervalo anterior a `before` (AAAA-MM-DD)."""
+        raise NotImplementedError
+
+    def flush(self):
+        """Força a gravação em disco das leituras pendentes."""
+
+    def close(self):
+        """Libera os recursos do armazenamento."""
+        self.flush()
+
+
+class JsonLinesStore(SensorStore):
+    """
+    Armazena as leituras em arquivos JSON Lines particionados por dispositivo e por dia.
+    Cada leitura é uma linha independente, então gravar é só um append no segmento atual.
+    As partições funcionam como índices: uma consulta abre apenas as pastas dos
+    dispositivos pedidos e os segmentos dos dias dentro do intervalo.
+    """
+
+    def __init__(self, directory, fsync_batch_size=FSYNC_BATCH_SIZE,
+                 fsync_interval=FSYNC_INTERVAL_SECONDS):
+        self.directory = directory
+        self.fsync_batch_size = fsync_batch_size
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._files = {}     # Segmentos abertos para escrita: caminho -> arquivo.
+        self._dirty = set()  # Segmentos com gravações ainda sem fsync.
+        self._pending = 0
+        self._last_fsync = time.monotonic()
+        # Agregados em memória, alimentados pela leitura incremental (tail) dos segmentos:
+        # funcionam também em outro processo (ex.: dashboard) que só lê os arquivos.
+        self._rollup_index = RollupIndex()
+        self._rollup_cursor = None
+        self._rollup_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _segment_for(self, record):
+        """Escolhe o segmento (dispositivo + dia) a partir da leitura."""
+        day = str(record.get('timestamp', ''))[:10] or datetime.now().strftime("%Y-%m-%d")
+        partition = device_partition(record.get('device_id'))
+        return os.path.join(self.directory, partition, f"{SEGMENT_PREFIX}{day}{SEGMENT_SUFFIX}")
+
+    def device_partitions(self):
+        """Lista as pastas de dispositivos existentes."""
+        return sorted(name for name in os.listdir(self.directory)
+                      if os.path.isdir(os.path.join(self.directory, name)))
+
+    def segment_paths(self, device_id=None, since=None, until=None):
+        """Lista os segmentos do(s) dispositivo(s) cujo dia cai no intervalo, em ordem cronológica."""
+        if device_id is None:
+            partitions = self.device_partitions()
+        else:
+            partitions = [device_partition(device_id)]
+        first_day, last_day = (since or "")[:10], (until or "")[:10]
+        paths = []
+        for partition in partitions:
+            folder = os.path.join(self.directory, partition)
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                if not (name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)):
+                    continue
+                day = name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]
+                if (first_day and day < first_day) or (last_day and day > last_day):
+                    continue
+                paths.append((day, os.path.join(folder, name)))
+        return [path for _, path in sorted(paths)]
+
+    def _write_line(self, record):
+        path = self._segment_for(record)
+        f = self._files.get(path)
+        if f is None:
+            # Fecha os segmentos de dias anteriores do mesmo dispositivo.
+            folder = os.path.dirname(path)
+            for old_path in [p for p in self._files if os.path.dirname(p) == folder]:
+                self._sync_file_locked(old_path)
+                self._files.pop(old_path).close()
+            os.makedirs(folder, exist_ok=True)
+            f = self._files[path] = open(path, 'a', encoding='utf-8')
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._dirty.add(path)
+        self._pending += 1
+
+    def append(self, record):
+        with self._lock:
+            self._write_line(record)
+            self._after_write_locked()
+
+    def append_many(self, records):
+        with self._lock:
+            for record in records:
+                self._write_line(record)
+            self._after_write_locked()
+
+    def _after_write_locked(self):
+        # Entrega os dados ao sistema operacional a cada gravação (leitores já os enxergam)
+        # e só faz o fsync, que é caro, em lotes.
+        for path in self._dirty:
+            self._files[path].flush()
+        elapsed = time.monotonic() - self._last_fsync
+        if self._pending >= self.fsync_batch_size or elapsed >= self.fsync_interval:
+            self._sync_locked()
+
+    def _sync_file_locked(self, path):
+        if path in self._dirty:
+            self._files[path].flush()
+            os.fsync(self._files[path].fileno())
+            self._dirty.discard(path)
+
+    def _sync_locked(self):
+        for path in list(self._dirty):
+            self._sync_file_locked(path)
+        self._pending = 0
+        self._last_fsync = time.monotonic()
+
+    def load_all(self):
+        records = []
+        for path in self.segment_paths():
+            records.extend(read_jsonl(path))
+        return records
+
+    def query(self, device_id=None, since=None, until=None, fields=None, last=None):
+        since, until = to_iso(since), to_iso(until)
+        segments_by_day = {}
+        for path in self.segment_paths(device_id, since, until):
+            day = os.path.basename(path)[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]
+            segments_by_day.setdefault(day, []).append(path)
+
+        # Com `last`, lê os dias do mais recente para o mais antigo e para assim que tiver N linhas.
+        days = sorted(segments_by_day, reverse=bool(last))
+        chunks, total = [], 0
+        for day in days:
+            rows = []
+            for path in segments_by_day[day]:
+                for record in read_jsonl(path):
+                    if matches(record, device_id, since, until):
+                        row = project(record, fields)
+                        if row is not None:
+                            rows.append(row)
+            if len(segments_by_day[day]) > 1:
+                # Segmentos de dispositivos diferentes se intercalam no tempo.
+                rows.sort(key=lambda row: str(row.get('timestamp', '')))
+            chunks.append(rows)
+            total += len(rows)
+            if last and total >= last:
+                break
+        if last:
+            chunks.reverse()
+        rows = [row for chunk in chunks for row in chunk]
+        return rows[-last:] if last else rows
+
+    def tail(self, cursor=None, fields=None):
+        # Cursor: posição (em bytes) já lida de cada segmento. Lê apenas o final de cada arquivo
+        # e ignora uma última linha incompleta (ainda sendo gravada), relida na próxima chamada.
+        offsets = dict(cursor or {})
+        rows = []
+        for path in self.segment_paths():
+            offset = offsets.get(path, 0)
+            try:
+                if os.path.getsize(path) <= offset:
+                    continue
+                with open(path, 'rb') as f:
+                    f.seek(offset)
+                    chunk = f.read()
+            except FileNotFoundError:
+                continue
+            complete = chunk[:chunk.rfind(b"\n") + 1]
+            offsets[path] = offset + len(complete)
+            for line in complete.decode('utf-8').splitlines():
+                try:
+                    row = project(json.loads(line), fields)
+                except json.JSONDecodeError:
+                    continue
+                if row is not None:
+                    rows.append(row)
+        rows.sort(key=lambda row: str(row.get('timestamp', '')))
+        return rows, offsets
+
+    def rollups(self, field, resolution, device_id=None, since=None, until=None):
+        with self._rollup_lock:
+            compacted_path = os.path.join(self.directory, COMPACTED_ROLLUPS_FILE)
+            if self._rollup_cursor is None and os.path.exists(compacted_path):
+                # Primeira consulta: agregados dos dias compactados, cujos segmentos já não existem.
+                for row in read_jsonl(compacted_path):
+                    self._rollup_index.merge(*row[:4], row[4:])
+            records, self._rollup_cursor = self.tail(self._rollup_cursor)
+            for record in records:
+                self._rollup_index.add(record)
+            return self._rollup_index.series(field, resolution, device_id, since, until)
+
+    def time_range(self):
+        # Só lê os segmentos do primeiro e do último dia (o dia está no nome do arquivo).
+        segments_by_day = {}
+        for path in self.segment_paths():
+            day = os.path.basename(path)[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]
+            segments_by_day.setdefault(day, []).append(path)
+        if not segments_by_day:
+            return None, None
+        first = [str(record['timestamp']) for path in segments_by_day[min(segments_by_day)]
+                 for record in read_jsonl(path) if record.get('timestamp')]
+        last = [str(record['timestamp']) for path in segments_by_day[max(segments_by_day)]
+                for record in read_jsonl(path) if record.get('timestamp')]
+        return (min(first) if first else None), (max(last) if last else None)
+
+    def _segment_path(self, partition, day):
+        return os.path.join(self.directory, partition, f"{SEGMENT_PREFIX}{day}{SEGMENT_SUFFIX}")
+
+    def expired_days(self, before):
+        # Chave = pasta do dispositivo; o dia está no nome do segmento.
+        return [(os.path.basename(os.path.dirname(path)),
+                 os.path.basename(path)[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+                for path in self.segment_paths(until=previous_day(before))]
+
+    def read_day(self, key, day):
+        path = self._segment_path(key, day)
+        if not os.path.exists(path):
+            return []
+        records = read_jsonl(path)
+        records.sort(key=lambda record: str(record.get('timestamp', '')))
+        return records
+
+    def delete_day(self, key, day):
+        path = self._segment_path(key, day)
+        with self._lock:
+            if path in self._files:
+                self._sync_file_locked(path)
+                self._files.pop(path).close()
+        if not os.path.exists(path):
+            return
+        # Os agregados do dia vão para o arquivo de rollups compactados antes de o segmento sumir.
+        index = RollupIndex()
+        for record in read_jsonl(path):
+            index.add(record)
+        with self._rollup_lock:
+            with open(os.path.join(self.directory, COMPACTED_ROLLUPS_FILE), 'a', encoding='utf-8') as f:
+                for entry in index.entries():
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.remove(path)
+
+    def prune_rollups(self, resolution, before):
+        path = os.path.join(self.directory, COMPACTED_ROLLUPS_FILE)
+        with self._rollup_lock:
+            self._rollup_index.prune(resolution, before)
+            if not os.path.exists(path):
+                return
+            rows = [row for row in read_jsonl(path) if row[0] != resolution or row[2] >= before]
+            temp_path = f"{path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                for row in rows:
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            os.replace(temp_path, path)
+
+    def flush(self):
+        with self._lock:
+            self._sync_locked()
+
+    def close(self):
+        with self._lock:
+            self._sync_locked()
+            for f in self._files.values():
+                f.close()
+            self._files.clear()
+
+
+class SQLiteStore(SensorStore):
+    """
+    Armazena as leituras em um banco SQLite em modo WAL.
+    No modo WAL com synchronous=NORMAL cada commit é só um append no log;
+    o fsync acontece em lote nos checkpoints do próprio SQLite.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        # Conexão própria da compactação: no modo WAL ela lê sem bloquear as gravações,
+        # e apaga em transações curtas (DELETE_BATCH_SIZE linhas) sem segurar o `_lock`.
+        self._maintenance_conn = None
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS readings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                device_id TEXT,
+                timestamp TEXT,
+                payload TEXT NOT NULL
+            )
+        """)
+        # Índices de tempo e de dispositivo usados pelas consultas (query).
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_readings_timestamp ON readings (timestamp)")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_readings_device_timestamp ON readings (device_id, timestamp)")
+        # Agregados por intervalo, atualizados na mesma transação de cada gravação.
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS rollups (
+                resolution INTEGER NOT NULL,
+                field TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                device_id TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                sum REAL NOT NULL,
+                min REAL NOT NULL,
+                max REAL NOT NULL,
+                PRIMARY KEY (resolution, field, bucket, device_id)
+            ) WITHOUT ROWID
+        """)
+        self._conn.commit()
+        self._backfill_rollups()
+
+    def _backfill_rollups(self):
+        """Calcula os agregados das leituras gravadas antes da existência da tabela de rollups."""
+        with self._lock:
+            # BEGIN IMMEDIATE: se dois processos abrirem o banco ao mesmo tempo, só um calcula.
+            self._conn.execute("BEGIN IMMEDIATE")
+            if self._conn.execute("SELECT 1 FROM rollups LIMIT 1").fetchone():
+                self._conn.commit()
+                return
+            cursor = self._conn.execute("SELECT payload FROM readings ORDER BY id")
+            while True:
+                rows = cursor.fetchmany(5000)
+                if not rows:
+                    break
+                self._update_rollups([json.loads(payload) for (payload,) in rows])
+            self._conn.commit()
+
+    def _update_rollups(self, records):
+        self._conn.executemany(
+            "INSERT INTO rollups VALUES (?, ?, ?, ?, 1, ?, ?, ?) "
+            "ON CONFLICT (resolution, field, bucket, device_id) DO UPDATE SET "
+            "count = count + 1, sum = sum + excluded.sum, "
+            "min = MIN(min, excluded.min), max = MAX(max, excluded.max)",
+            [(resolution, field, bucket, device, value, value, value)
+             for record in records
+             for resolution, field, bucket, device, value in rollup_entries(record)])
+
+    @staticmethod
+    def _row(record):
+        return (record.get('device_id'), record.get('timestamp'),
+                json.dumps(record, ensure_ascii=False))
+
+    def append(self, record):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO readings (device_id, timestamp, payload) VALUES (?, ?, ?)",
+                self._row(record))
+            self._update_rollups([record])
+            self._conn.commit()
+
+    def append_many(self, records):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO readings (device_id, timestamp, payload) VALUES (?, ?, ?)",
+                [self._row(record) for record in records])
+            self._update_rollups(records)
+            self._conn.commit()
+
+    def load_all(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT payload FROM readings ORDER BY id").fetchall()
+        return [json.loads(payload) for (payload,) in rows]
+
+    def query(self, device_id=None, since=None, until=None, fields=None, last=None):
+        clauses, params = [], []
+        if device_id is not None:
+            clauses.append("device_id = ?")
+            params.append(device_id)
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(to_iso(since))
+        if until is not None:
+            clauses.append("timestamp <= ?")
+            params.append(to_iso(until))
+
+        if fields:
+            # Extrai só as colunas pedidas dentro do próprio SQLite, sem decodificar o JSON inteiro.
+            columns = ["timestamp"] + [f"{column_expression(field)} AS {field}" for field in fields]
+            clauses.extend(f"{column_expression(field)} IS NOT NULL" for field in fields)
+        else:
+            columns = ["payload"]
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        if last:
+            # Percorre o índice de trás para frente e reordena só as N linhas retornadas.
+            outer_columns = ["timestamp"] + list(fields) if fields else ["payload"]
+            inner_columns = columns + (["id"] if fields else ["timestamp", "id"])
+            sql = (f"SELECT {', '.join(outer_columns)} FROM ("
+                   f"SELECT {', '.join(inner_columns)} FROM readings{where}"
+                   f" ORDER BY timestamp DESC, id DESC LIMIT {int(last)}) ORDER BY timestamp, id")
+        else:
+            sql = f"SELECT {', '.join(columns)} FROM readings{where} ORDER BY timestamp, id"
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        if not fields:
+            return [json.loads(payload) for (payload,) in rows]
+        keys = ["timestamp"] + list(fields)
+        return [dict(zip(keys, row)) for row in rows]
+
+    def tail(self, cursor=None, fields=None):
+        # Cursor: maior id já lido (a chave primária é crescente, então basta um range scan).
+        cursor = cursor or 0
+        columns = (["timestamp"] + [f"{column_expression(field)} AS {field}" for field in fields]
+                   if fields else ["payload"])
+        with self._lock:
+            last_id = self._conn.execute("SELECT MAX(id) FROM readings").fetchone()[0] or 0
+            rows = self._conn.execute(
+                f"SELECT {', '.join(columns)} FROM readings WHERE id > ? AND id <= ? ORDER BY id",
+                (cursor, last_id)).fetchall()
+        if not fields:
+            return [json.loads(payload) for (payload,) in rows], max(cursor, last_id)
+        keys = ["timestamp"] + list(fields)
+        records = [dict(zip(keys, row)) for row in rows]
+        records = [record for record in records if all(record[field] is not None for field in fields)]
+        return records, max(cursor, last_id)
+
+    def rollups(self, field, resolution, device_id=None, since=None, until=None):
+        clauses, params = ["resolution = ?", "field = ?"], [resolution, field]
+        if device_id is not None:
+            clauses.append("device_id = ?")
+            params.append(device_id)
+        if since is not None:
+            clauses.append("bucket >= ?")
+            params.append(bucket_start(since, resolution))
+        if until is not None:
+            clauses.append("bucket <= ?")
+            params.append(to_iso(until))
+        sql = (f"SELECT bucket, SUM(count), SUM(sum), MIN(min), MAX(max) FROM rollups"
+               f" WHERE {' AND '.join(clauses)} GROUP BY bucket ORDER BY bucket")
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [{'timestamp': bucket, 'count': count, 'mean': total / count, 'min': low, 'max': high}
+                for bucket, count, total, low, high in rows]
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM readings").fetchone()[0]
+
+    def time_range(self):
+        with self._lock:
+            return self._conn.execute("SELECT MIN(timestamp), MAX(timestamp) FROM readings").fetchone()
+
+    def _maintenance(self):
+        if self._maintenance_conn is None:
+            self._maintenance_conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        return self._maintenance_conn
+
+    def expired_days(self, before):
+        # Chave = device_id (pode ser NULL); range scan no índice de timestamp.
+        rows = self._maintenance().execute(
+            "SELECT DISTINCT device_id, substr(timestamp, 1, 10) FROM readings WHERE timestamp < ?",
+            (before,)).fetchall()
+        return sorted(rows, key=lambda row: (row[1], str(row[0])))
+
+    def read_day(self, key, day):
+        rows = self._maintenance().execute(
+            "SELECT payload FROM readings WHERE device_id IS ? AND timestamp >= ? AND timestamp < ?"
+            " ORDER BY timestamp, id", (key, day, next_day(day))).fetchall()
+        return [json.loads(payload) for (payload,) in rows]
+
+    def delete_day(self, key, day):
+        conn = self._maintenance()
+        while True:
+            with conn:
+                deleted = conn.execute(
+                    "DELETE FROM readings WHERE id IN (SELECT id FROM readings WHERE device_id IS ?"
+                    " AND timestamp >= ? AND timestamp < ? LIMIT ?)",
+                    (key, day, next_day(day), DELETE_BATCH_SIZE)).rowcount
+            if deleted < DELETE_BATCH_SIZE:
+                return
+
+    def prune_rollups(self, resolution, before):
+        # Um dia por transação, campo a campo (range scan na chave primária).
+        conn = self._maintenance()
+        for field in ROLLUP_FIELDS:
+            oldest = conn.execute("SELECT MIN(bucket) FROM rollups WHERE resolution = ? AND field = ?",
+                                  (resolution, field)).fetchone()[0]
+            day = oldest[:10] if oldest else before
+            while day < before:
+                with conn:
+                    conn.execute("DELETE FROM rollups WHERE resolution = ? AND field = ? AND bucket < ?",
+                                 (resolution, field, min(next_day(day), before)))
+                day = next_day(day)
+
+    def flush(self):
+        with self._lock:
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+            if self._maintenance_conn is not None:
+                self._maintenance_conn.close()
+
+
+def to_iso(value):
+    """Normaliza datetime/str para o formato ISO usado nos timestamps gravados."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value).replace(' ', 'T')
+
+
+def next_day(day):
+    """Dia seguinte (AAAA-MM-DD)."""
+    return (date.fromisoformat(day[:10]) + timedelta(days=1)).isoformat()
+
+
+def previous_day(day):
+    """Dia anterior (AAAA-MM-DD)."""
+    return (date.fromisoformat(day[:10]) - timedelta(days=1)).isoformat()
+
+
+def matches(record, device_id, since, until):
+    """Verifica se a leitura pertence ao dispositivo e ao intervalo (since/until já em ISO)."""
+    if device_id is not None and record.get('device_id') != device_id:
+        return False
+    timestamp = str(record.get('timestamp', ''))
+    if since is not None and timestamp < since:
+        return False
+    if until is not None and timestamp > until:
+        return False
+    return True
+
+
+def project(record, fields):
+    """Reduz a leitura a 'timestamp' + campos pedidos; None se faltar algum campo."""
+    if not fields:
+        return record
+    row = {'timestamp': record.get('timestamp')}
+    for field in fields:
+        value = record.get(field)
+        if value is None:
+            return None
+        row[field] = value
+    return row
+
+
+def column_expression(field):
+    """Expressão SQL de um campo da leitura (coluna própria ou extraída do JSON)."""
+    if not re.fullmatch(r"\w+", field):
+        raise ValueError(f"Nome de campo inválido: {field}")
+    if field in ("device_id", "timestamp"):
+        return field
+    return f"json_extract(payload, '$.{field}')"
+
+
+def normalize_reading(record):
+    """Copia os campos do payload do ESP32 (em português) para os nomes usados nas análises."""
+    for alias, field in PAYLOAD_FIELD_ALIASES.items():
+        if alias in record and field not in record:
+            record[field] = record[alias]
+    return record
+
+
+def device_partition(device_id):
+    """Nome seguro de pasta para o dispositivo no backend JSON Lines."""
+    if not device_id:
+        return NO_DEVICE_PARTITION
+    return re.sub(r"[^\w.-]", "_", str(device_id))
+
+
+def read_jsonl(path):
+    """Lê um arquivo JSON Lines, ignorando uma última linha incompleta (gravação interrompida)."""
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+def migrate_legacy_json(store, legacy_file, marker_path):
+    """
+    Importa uma única vez o antigo arquivo all_sensor_data.json (array JSON) para o store,
+    com os campos do payload do ESP32 já convertidos (normalize_reading).
+    O marcador só é gravado depois da importação concluída: se o processo cair no meio, a próxima
+    abertura importa as leituras que ainda faltam (as já gravadas não são duplicadas).
+    Retorna a quantidade de leituras migradas (0 se já migrado ou inexistente).
+    """
+    if not legacy_file or not os.path.exists(legacy_file) or os.path.exists(marker_path):
+        return 0
+    with open(f"{marker_path}.lock", 'a') as lock_file:
+        if fcntl is not None:
+            # Se dois processos abrirem o store ao mesmo tempo, o segundo espera o primeiro terminar.
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        if os.path.exists(marker_path):
+            return 0
+        try:
+            with open(legacy_file, 'r', encoding='utf-8') as f:
+                legacy_records = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            log.error("Não foi possível migrar %s: %s", legacy_file, e)
+            return 0
+        records = []
+        if isinstance(legacy_records, list) and legacy_records:
+            imported = {(record.get('device_id'), str(record.get('timestamp'))) for record in store.load_all()}
+            records = [normalize_reading(dict(record)) for record in legacy_records
+                       if isinstance(record, dict)
+                       and (record.get('device_id'), str(record.get('timestamp'))) not in imported]
+            store.append_many(records)
+            store.flush()
+        temp_path = f"{marker_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(f"{legacy_file}\n{len(records)}\n")
+        os.replace(temp_path, marker_path)
+    log.info("Migradas %d leituras de %s para o novo armazenamento.", len(records), legacy_file)
+    return len(records)
+
+
+def open_store(backend=DEFAULT_BACKEND, directory=None, legacy_file=None):
+    """
+    Cria o backend de armazenamento escolhido ("sqlite" ou "jsonl") dentro de `directory`
+    e, se informado, migra o antigo arquivo JSON na primeira abertura.
+    """
+    backend = (backend or DEFAULT_BACKEND).lower()
+    os.makedirs(directory, exist_ok=True)
+    if backend == "sqlite":
+        store = SQLiteStore(os.path.join(directory, SQLITE_DB_NAME))
+    elif backend == "jsonl":
+        store = JsonLinesStore(directory)
+    else:
+        raise ValueError(f"Backend de armazenamento desconhecido: {backend}")
+
+    marker_path = os.path.join(directory, f"{LEGACY_MIGRATION_MARKER}_{backend}")
+    migrate_legacy_json(store, legacy_file, marker_path)
+    return store
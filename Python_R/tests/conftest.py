@@ -0,0 +1,7 @@
+# tests/conftest.py
+# Os módulos de src/services são importados pelo nome (como fazem os próprios serviços).
+import os
+import sys
+
+SERVICES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'services')
+sys.path.insert(0, os.path.abspath(SERVICES_DIR))
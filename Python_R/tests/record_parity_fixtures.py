@@ -0,0 +1,164 @@
+# tests/record_parity_fixtures.py
+# Casos de paridade Python × R em tests/fixtures/parity/cases.json, em duas etapas:
+#
+#   python tests/record_parity_fixtures.py prepare   # gera as entradas (sem R)
+#   python tests/record_parity_fixtures.py record    # executa o Rscript nos casos pendentes
+#
+# "prepare" gera leituras variadas com a frota simulada (loadtest/esp32_fleet.py, semente fixa) e,
+# para cada linha dos datasets históricos, uma janela cuja última leitura tem os valores da linha
+# (para que os casos cheguem aos níveis Moderado, Alto e Muito Alto). Os casos ficam pendentes
+# (sem "expected") até "record" gravar a saída do flood_analysis.R/fire_analysis.R sobre cada janela.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import pandas as pd
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(TESTS_DIR, 'fixtures', 'parity')
+CASES_FILE = os.path.join(FIXTURES_DIR, 'cases.json')
+R_ANALYSIS_DIR = os.path.join(TESTS_DIR, '..', 'src', 'r_analysis')
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'loadtest'))
+
+from esp32_fleet import Esp32Fleet  # noqa: E402
+
+R_SCRIPTS = {"flood": "flood_analysis.R", "fire": "fire_analysis.R"}
+OUTPUT_FIELDS = {"flood": ("risk_level", "predicted_water_level", "predicted_rainfall"),
+                 "fire": ("risk_level", "predicted_temperature", "predicted_smoke")}
+# Colunas enviadas ao R (como no data_processor) e, para os casos dos datasets históricos,
+# a coluna do dataset que vira a última leitura da janela.
+INPUT_COLUMNS = {
+    "flood": {"water_level": "water_level_avg_24h", "rainfall_intensity": "rainfall_total_24h"},
+    "fire": {"temperature": "temperature_avg_24h", "humidity": "humidity_avg_24h",
+             "smoke_concentration": "smoke_concentration_avg_6h"},
+}
+HISTORICAL_DATASETS = {"flood": "historical_flood_data.csv", "fire": "historical_fire_data.csv"}
+PAYLOAD_FIELDS = {"water_level": "nivel_de_agua", "rainfall_intensity": "intensidade_de_chuva",
+                  "temperature": "temperatura", "humidity": "umidade",
+                  "smoke_concentration": "concentracao_de_fumaca"}
+
+FLEET_DEVICES = 3
+FLEET_READINGS = 240
+FLEET_SEED = 7
+FLEET_INTERVAL_SECONDS = 5
+HISTORICAL_WINDOW = 20
+
+
+def load_cases():
+    with open(CASES_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_cases(cases):
+    with open(CASES_FILE, 'w', encoding='utf-8') as f:
+        json.dump(cases, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+
+
+def fleet_readings():
+    """{dispositivo: DataFrame} com as leituras completas da frota simulada (semente fixa)."""
+    fleet = Esp32Fleet(FLEET_DEVICES, seed=FLEET_SEED, prefix="ESP32GuardiaoNatural_Parity")
+    start = pd.Timestamp("2025-06-01 00:00:00")
+    rows = []
+    for index in range(FLEET_READINGS):
+        moment = start + pd.Timedelta(seconds=index * FLEET_INTERVAL_SECONDS)
+        for device in fleet.devices:
+            reading = device.reading(moment.to_pydatetime())
+            rows.append({"device_id": reading["device_id"], "timestamp": moment.isoformat(sep=' '),
+                         **{field: reading[payload] for field, payload in PAYLOAD_FIELDS.items()}})
+    df = pd.DataFrame(rows)
+    return {device_id: group.drop(columns="device_id") for device_id, group in df.groupby("device_id")}
+
+
+def prepare(window, step):
+    """Gera as entradas dos casos pendentes (leituras da frota e níveis dos datasets históricos)."""
+    cases = load_cases()
+    names = {case['name'] for case in cases}
+
+    def add(case):
+        if case['name'] not in names:
+            cases.append(case)
+            names.add(case['name'])
+
+    devices = fleet_readings()
+    for analysis, columns in INPUT_COLUMNS.items():
+        # Séries variadas: janelas de `window` leituras de cada dispositivo simulado.
+        frames = []
+        for device_id, readings in devices.items():
+            readings = readings[['timestamp', *columns]].dropna()
+            offset = sum(len(frame) for frame in frames)
+            for start in range(0, len(readings) - window + 1, step):
+                add({"name": f"{analysis}_fleet_{device_id[-3:]}_{start}", "analysis": analysis,
+                     "input": f"{analysis}_fleet.csv", "rows": [offset + start, offset + start + window],
+                     "origin": "r"})
+            frames.append(readings)
+        pd.concat(frames).to_csv(os.path.join(FIXTURES_DIR, f"{analysis}_fleet.csv"), index=False)
+
+        # Níveis de risco: a última leitura de cada janela tem os valores de uma linha do dataset histórico.
+        history = pd.read_csv(os.path.join(R_ANALYSIS_DIR, 'datasets', HISTORICAL_DATASETS[analysis]))
+        base = frames[0].iloc[:HISTORICAL_WINDOW].reset_index(drop=True)
+        base = base.astype({column: float for column in columns})
+        windows = []
+        for index, row in history.iterrows():
+            window_rows = base.copy()
+            for column, dataset_column in columns.items():
+                window_rows.loc[len(window_rows) - 1, column] = row[dataset_column]
+            add({"name": f"{analysis}_historical_{index}", "analysis": analysis,
+                 "input": f"{analysis}_historical.csv",
+                 "rows": [index * HISTORICAL_WINDOW, (index + 1) * HISTORICAL_WINDOW],
+                 "origin": "r", "dataset_category": row.iloc[-1]})
+            windows.append(window_rows)
+        pd.concat(windows).to_csv(os.path.join(FIXTURES_DIR, f"{analysis}_historical.csv"), index=False)
+    save_cases(cases)
+    pending = sum('expected' not in case for case in cases)
+    print(f"{len(cases)} casos, {pending} aguardando a saída do R (execute o passo 'record').")
+
+
+def run_r(analysis, df, rscript):
+    """Executa o script R da análise sobre as leituras e retorna o JSON gravado por ele."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_path = os.path.join(temp_dir, 'input.csv')
+        output_path = os.path.join(temp_dir, 'output.json')
+        df.to_csv(input_path, index=False)
+        subprocess.run([rscript, os.path.join(R_ANALYSIS_DIR, R_SCRIPTS[analysis]), input_path, output_path],
+                       check=True, capture_output=True, text=True)
+        with open(output_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+
+def record(rscript, force):
+    """Grava a saída do R nos casos pendentes (ou em todos, com `force`)."""
+    cases = load_cases()
+    for case in cases:
+        if 'expected' in case and not force:
+            continue
+        df = pd.read_csv(os.path.join(FIXTURES_DIR, case['input']))
+        if 'rows' in case:
+            df = df.iloc[case['rows'][0]:case['rows'][1]]
+        output = run_r(case['analysis'], df, rscript)
+        case['expected'] = {field: output.get(field) for field in OUTPUT_FIELDS[case['analysis']]}
+        print(f"{case['name']}: {case['expected']}")
+        save_cases(cases)   # A cada caso: uma falha no meio não perde o que já foi gravado.
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Casos de paridade com as saídas dos scripts R.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    prepare_parser = subparsers.add_parser("prepare", help="Gera as entradas dos casos (não requer R).")
+    prepare_parser.add_argument("--window", type=int, default=60, help="Leituras por caso da frota simulada.")
+    prepare_parser.add_argument("--step", type=int, default=60, help="Deslocamento entre dois casos.")
+    record_parser = subparsers.add_parser("record", help="Executa o Rscript nos casos pendentes.")
+    record_parser.add_argument("--rscript", default=os.getenv("RSCRIPT_PATH", "Rscript"))
+    record_parser.add_argument("--force", action="store_true", help="Grava de novo também os casos já gravados.")
+    args = parser.parse_args()
+    if args.command == "prepare":
+        prepare(args.window, args.step)
+    else:
+        record(args.rscript, args.force)
+
+
+if __name__ == "__main__":
+    main()
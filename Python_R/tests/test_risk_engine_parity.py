@@ -0,0 +1,92 @@
+# tests/test_risk_engine_parity.py
+# Paridade do motor Python (risk_engine.py) com as saídas dos scripts R nos casos de
+# tests/fixtures/parity/cases.json, todas gravadas pelo flood_analysis.R/fire_analysis.R
+# (tests/record_parity_fixtures.py; ver o README.md da pasta).
+# - Nível de risco: igual ao do R em cada caso.
+# - Previsões: diferença de no máximo PARITY_TOLERANCE da amplitude da série (mínimo de 1 unidade).
+# Casos ainda sem a saída do R ("expected") são pulados e contados como pendentes.
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from risk_engine import PARITY_CASES, PARITY_TOLERANCE, RISK_LEVELS, RiskEngine, forecast_tolerance
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'parity')
+R_ANALYSIS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'r_analysis')
+MIN_VARIED_SERIES = 2   # Séries não constantes com previsão do R comparada, por análise.
+
+# Campo de previsão -> coluna da série, por análise.
+FORECAST_COLUMNS = {analysis: fields for analysis, _, _, fields in PARITY_CASES}
+
+with open(os.path.join(FIXTURES_DIR, 'cases.json'), 'r', encoding='utf-8') as f:
+    CASES = json.load(f)
+RECORDED = [case for case in CASES if 'expected' in case]
+
+
+def case_input(case):
+    df = pd.read_csv(os.path.join(FIXTURES_DIR, case['input']))
+    if 'rows' in case:
+        start, stop = case['rows']
+        df = df.iloc[start:stop]
+    return df
+
+
+def require_recorded(case):
+    if 'expected' not in case:
+        pytest.skip("saída do R ainda não gravada (tests/record_parity_fixtures.py record)")
+
+
+@pytest.fixture(scope="module")
+def engine(tmp_path_factory):
+    # Artefatos em uma pasta temporária: os testes não alteram r_analysis/models.
+    return RiskEngine(R_ANALYSIS_DIR, model_dir=str(tmp_path_factory.mktemp('models')))
+
+
+@pytest.fixture(scope="module")
+def results(engine):
+    return {case['name']: engine.analyze(case['analysis'], case_input(case).to_dict('records'))
+            for case in RECORDED}
+
+
+def test_fixtures_are_r_outputs():
+    assert all(case['origin'] == 'r' for case in CASES)
+
+
+@pytest.mark.xfail(strict=True, reason="casos da frota simulada e dos datasets históricos aguardando "
+                                       "a saída do R (tests/record_parity_fixtures.py record)")
+@pytest.mark.parametrize("analysis", sorted(FORECAST_COLUMNS))
+def test_fixtures_cover_risk_levels_and_series(analysis):
+    cases = [case for case in RECORDED if case['analysis'] == analysis]
+    assert {case['expected']['risk_level'] for case in cases} == set(RISK_LEVELS)
+    for column in FORECAST_COLUMNS[analysis].values():
+        varied = [case for case in cases if case_input(case)[column].nunique() > 1]
+        assert len(varied) >= MIN_VARIED_SERIES, column
+
+
+@pytest.mark.parametrize("case", CASES, ids=[case['name'] for case in CASES])
+def test_risk_level_matches_r(case, results):
+    require_recorded(case)
+    assert results[case['name']]['risk_level'] == case['expected']['risk_level']
+
+
+@pytest.mark.parametrize("case", CASES, ids=[case['name'] for case in CASES])
+def test_forecasts_within_tolerance(case, results):
+    require_recorded(case)
+    df = case_input(case)
+    result = results[case['name']]
+    for field, column in FORECAST_COLUMNS[case['analysis']].items():
+        expected = case['expected'][field]
+        if expected is None:
+            assert result[field] is None
+            continue
+        allowed = forecast_tolerance(df[column], PARITY_TOLERANCE)
+        assert result[field] == pytest.approx(expected, abs=allowed), field
+
+
+def test_empty_input_matches_r_fallback(engine):
+    for analysis, fields in FORECAST_COLUMNS.items():
+        result = engine.analyze(analysis, [])
+        assert result['risk_level'] == "Baixo"
+        assert all(result[field] is None for field in fields)